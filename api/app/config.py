@@ -5,20 +5,120 @@ class Settings(BaseSettings):
     STORAGE_DIR: Path = Path("/app/storage")
     CHROMA_DIR: Path = Path("/app/chroma")
     CONFIG_DIR: Path = Path("/app/config")
+    HISTORY_DIR: Path = Path("/app/history")
+    SNAPSHOT_DIR: Path = Path("/app/snapshots")
+    # Extracted text of indexed files, read to widen retrieved chunks (see CONTEXT_WINDOW_*).
+    TEXT_DIR: Path = Path("/app/texts")
+
+    # "chroma" (HNSW) or "numpy" (exact, memory-mapped matrix under NUMPY_STORE_DIR).
+    VECTOR_STORE: str = "chroma"
+    NUMPY_STORE_DIR: Path = Path("/app/vectors")
+    # Partition chunks into several collections: "" (one collection), "file_path"
+    # (hash into SHARD_COUNT shards) or "tag" (one shard per first tag).
+    SHARD_KEY: str = ""
+    SHARD_COUNT: int = 4
+    # "all" (single node), "writer" (ingests and publishes index versions to PUBLISH_DIR)
+    # or "reader" (serves queries from the latest published version, rejects writes).
+    NODE_ROLE: str = "all"
+    PUBLISH_DIR: Path = Path("/app/published")
+    PUBLISH_INTERVAL_SECONDS: float = 60.0
+    PUBLISH_KEEP: int = 3
+    REPLICA_POLL_INTERVAL_SECONDS: float = 5.0
+    CHROMA_HOST: str = ""
+    CHROMA_PORT: int = 8000
+    CONFIG_WATCH_INTERVAL: float = 2.0
 
     OLLAMA_URL: str = "http://ollama:11434"
+    # Comma-separated backend lists; empty falls back to OLLAMA_URLS, then OLLAMA_URL.
+    OLLAMA_URLS: str = ""
+    OLLAMA_CHAT_URLS: str = ""
+    OLLAMA_EMBED_URLS: str = ""
+    OLLAMA_HEALTH_INTERVAL_SECONDS: float = 10.0
+    OLLAMA_EJECT_SECONDS: float = 30.0
     CHAT_MODEL: str = "llama3.1:8b-instruct-q4_K_M"
     CHAT_MODEL_MAX_TOKENS: int = 4096
     EMBEDDING_MODEL: str = "mxbai-embed-large"
     EMBEDDING_MODEL_MAX_TOKENS: int = 1024
 
+    OLLAMA_KEEP_ALIVE: str = "15m"
+    MODEL_WARMUP_ENABLED: bool = True
+    MODEL_KEEPALIVE_INTERVAL_SECONDS: float = 240.0
+    MODEL_CATALOG_TTL_SECONDS: float = 60.0
+    HEALTHZ_REQUIRE_WARM: bool = True
+
+    EMBED_BATCH_WINDOW_MS: float = 5.0
+    EMBED_MIN_BATCH: int = 8
+    EMBED_MAX_BATCH: int = 256
+    EMBED_TARGET_LATENCY_MS: float = 500.0
+    EMBED_MAX_INFLIGHT: int = 2
+
+    # Defaults for a new index; the live values are kept in the model registry.
+    HNSW_M: int = 16
+    HNSW_CONSTRUCTION_EF: int = 100
+    HNSW_SEARCH_EF: int = 100
+
     TOP_K: int = 5
+    MIN_SIMILARITY: float = 0.75
+    SCOPE_BRUTE_FORCE_MAX: int = 2000
+    # Default for requests that don't set `two_stage`: pick DOC_TOP_N files first, then chunks.
+    TWO_STAGE_RETRIEVAL: bool = False
+    DOC_TOP_N: int = 8
+    # Widen each retrieved chunk by this many characters / neighbouring chunks of its
+    # source text for requests without `window_chars` / `window_chunks` (0 = chunk only).
+    CONTEXT_WINDOW_CHARS: int = 0
+    CONTEXT_WINDOW_CHUNKS: int = 0
+    # "generate" or "extractive" for requests without `mode`.
+    CHAT_MODE: str = "generate"
+    # Skip the chat model (and answer extractively) when no chunk passes MIN_SIMILARITY,
+    # or when the best chunk is below ANSWER_MIN_CONFIDENCE (0 disables that check).
+    CONFIDENCE_GATE: bool = True
+    ANSWER_MIN_CONFIDENCE: float = 0.0
+    # Requests with deadline_ms: below this many affordable tokens the answer comes from
+    # the answer cache or extractively instead of the chat model.
+    DEADLINE_MIN_PREDICT: int = 32
+    ANSWER_CACHE_SIZE: int = 256
+    ANSWER_CACHE_TTL_SECONDS: float = 3600
     HISTORY_TURNS: int = 4
+    HISTORY_RETENTION_TURNS: int = 100
+    HISTORY_RETENTION_DAYS: float = 0
+    HISTORY_COMPACT_INTERVAL_SECONDS: float = 3600
+    HISTORY_SUMMARY_MAX_CHARS: int = 1500
+    HISTORY_SUMMARY_USE_LLM: bool = False
     CHUNK_SIZE: int = 1200
     CHUNK_OVERLAP: int = 200
+    # Store near-duplicate chunks (MinHash Jaccard >= CHUNK_DEDUP_THRESHOLD) only once.
+    # The stored copy keeps its first file's metadata; scoped and two-stage searches also
+    # match the other copies' files, tags and mtimes through their references. Filters
+    # sent straight to the vector store (the retrieval benchmark) only see the first file.
+    CHUNK_DEDUP: bool = False
+    CHUNK_DEDUP_THRESHOLD: float = 0.9
+    CHUNK_DEDUP_PERMUTATIONS: int = 128
+    CHUNK_DEDUP_BANDS: int = 16
+    STORAGE_WATCH_ENABLED: bool = False
+    STORAGE_WATCH_POLLING: bool = False
+    STORAGE_WATCH_DEBOUNCE_SECONDS: float = 2.0
+    STORAGE_WATCH_POLL_INTERVAL: float = 5.0
+    STORAGE_WATCH_QUEUE_SIZE: int = 256
+    STORAGE_WATCH_WORKERS: int = 1
+
+    # Server-side limit for /chat and /chat/stream generations; 0 disables it.
+    CHAT_TIMEOUT_SECONDS: float = 0
+
+    SNAPSHOT_BATCH_SIZE: int = 5000
+
+    BATCH_MAX_QUESTIONS: int = 1000
+    BATCH_CONCURRENCY: int = 4
 
     DEFAULT_LANG: str = "uk"
 
+    # X-Admin-Token required by every /admin route and by profiling; while it is empty
+    # those refuse every caller (403).
+    ADMIN_TOKEN: str = ""
+    PROFILING_ENABLED: bool = False
+    PROFILE_DIR: Path = Path("/app/logs/profiles")
+    PROFILE_KEEP: int = 100
+    PROFILE_SAMPLE_INTERVAL_MS: float = 5.0
+
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
 settings = Settings()
@@ -1,13 +1,42 @@
+import re
 import sqlite3
+import threading
 from pathlib import Path
+from typing import Callable, Dict, Optional
 import chromadb
-from chromadb.utils.embedding_functions.ollama_embedding_function import OllamaEmbeddingFunction
+from fastapi import HTTPException
 from api.app.config import settings
-from api.app.services.ingest_service import IngestService
+from api.app.repositories.chroma_repo import ChromaVectorStore
+from api.app.repositories.numpy_repo import NumpyVectorStore
+from api.app.repositories.sharded_repo import ShardedVectorStore
+from api.app.repositories.vector_store import VectorStore
+from api.app.repositories.dedup_repo import ChunkDedupRepo
+from api.app.repositories.text_store import TextStore
+from api.app.services.catalog_service import CatalogService
+from api.app.services.chunk_dedup import ChunkDeduplicator
+from api.app.services.config_watcher import ConfigWatcher
+from api.app.services.document_index import DocumentIndex
+from api.app.services.embedding_service import EmbeddingService
+from api.app.services.hnsw_tuner import HnswTuner, hnsw_metadata
+from api.app.services.index_replication import IndexPublisher, ReplicaFollower
+from api.app.services.history_compactor import HistoryCompactor, extractive_summarizer, llm_summarizer
+from api.app.services.ingest_service import IngestService, SUPPORTED_EXTENSIONS
+from api.app.services.model_catalog import ModelCatalog
 from api.app.services.model_registry import ModelRegistry
+from api.app.services.model_warmup import ModelWarmer
+from api.app.services.ollama_router import OllamaRouter
 
 from api.app.services.rag_service import RagService
-from ollama import Client as OllamaClient
+from api.app.services.reduction_service import ReductionService
+from api.app.services.retrieval_benchmark import RetrievalBenchmark
+from api.app.services.shard_service import ShardService
+from api.app.services.snapshot_service import SnapshotService
+from api.app.services.storage_watcher import StorageWatcher
+from api.app.services.vector_store_benchmark import VectorStoreBenchmark
+from api.app.utils.logger import setup_logger
+from api.app.utils.minhash import MinHasher
+
+logger = setup_logger()
 
 CONFIG_PATH = Path(settings.CONFIG_DIR) / "runtime_config.json"
 
@@ -17,46 +46,210 @@ registry = ModelRegistry(
     default_chat_model_max_tokens=settings.CHAT_MODEL_MAX_TOKENS,
     default_embedding_model=settings.EMBEDDING_MODEL,
     default_embedding_model_max_tokens=settings.EMBEDDING_MODEL_MAX_TOKENS,
+    default_hnsw_m=settings.HNSW_M,
+    default_hnsw_construction_ef=settings.HNSW_CONSTRUCTION_EF,
+    default_hnsw_search_ef=settings.HNSW_SEARCH_EF,
 )
 
-client = chromadb.PersistentClient(path=str(settings.CHROMA_DIR))
+if settings.CHROMA_HOST:
+    # Shared Chroma server: required when running several uvicorn workers,
+    # an embedded PersistentClient is not safe to share between processes.
+    client = chromadb.HttpClient(host=settings.CHROMA_HOST, port=settings.CHROMA_PORT)
+else:
+    client = chromadb.PersistentClient(path=str(settings.CHROMA_DIR))
 
 
-def _make_collection(embed_model: str):
-    ef = OllamaEmbeddingFunction(
-        url=settings.OLLAMA_URL,
-        model_name=embed_model,
-    )
+def _make_store(name: str, hnsw: Optional[Dict] = None) -> VectorStore:
+    if settings.VECTOR_STORE == "numpy":
+        return NumpyVectorStore(Path(settings.NUMPY_STORE_DIR) / name)
+
+    # Embeddings are always computed by EmbeddingService and passed explicitly,
+    # so the collection itself carries no embedding function.
+    hnsw = hnsw or registry.get_hnsw()
+    metadata = hnsw_metadata(hnsw["m"], hnsw["construction_ef"], hnsw["search_ef"])
     try:
         col = client.get_or_create_collection(
-            name="documents",
-            embedding_function=ef,
-            metadata={"hnsw:space": "cosine"}
+            name=name,
+            embedding_function=None,
+            metadata=metadata
         )
     except Exception:
         col = client.create_collection(
-            name="documents",
-            embedding_function=ef,
-            metadata={"hnsw:space": "cosine"}
+            name=name,
+            embedding_function=None,
+            metadata=metadata
         )
-    return col
+    return ChromaVectorStore(client, col)
+
+
+def _list_stores():
+    if settings.VECTOR_STORE == "numpy":
+        root = Path(settings.NUMPY_STORE_DIR)
+        return [p.name for p in root.iterdir() if (p / "store.db").exists()] if root.exists() else []
+    return [c.name for c in client.list_collections()]
+
+
+# Extracted texts of the indexed files, shipped inside snapshots for context windows.
+text_store = TextStore(settings.TEXT_DIR)
+
+# Published index versions, shared between the ingest writer and the query readers.
+published = SnapshotService(
+    snapshot_dir=settings.PUBLISH_DIR,
+    registry=registry,
+    page_size=settings.SNAPSHOT_BATCH_SIZE,
+    text_store=text_store,
+)
+
+replica = ReplicaFollower(
+    snapshots=published,
+    state_path=Path(settings.CONFIG_DIR) / "replica.json",
+    make_store=_make_store,
+    list_stores=_list_stores,
+    registry=registry,
+    on_swap=lambda col, doc_index: bind_services(col, doc_index),
+    interval=settings.REPLICA_POLL_INTERVAL_SECONDS,
+    page_size=settings.SNAPSHOT_BATCH_SIZE,
+)
+
+
+def _generation_names(generation: int):
+    """(chunk collection, document index) names of an index generation; 0 keeps the original names."""
+    if not generation:
+        return "documents", "files"
+    # "-g" rather than "_": a sharded "documents" store owns every "documents_*" name.
+    return f"documents-g{generation}", f"files-g{generation}"
+
+
+_GENERATION_RE = re.compile(r"^(?:documents|files)(?:-g(\d+))?(?:_|$)")
+
+
+def _store_names():
+    """(chunk collection, document index) names; readers serve their latest replica."""
+    if settings.NODE_ROLE == "reader":
+        return replica.store_names()
+    return _generation_names(registry.get_index_generation())
+
+
+def _make_collection(name: Optional[str] = None, hnsw: Optional[Dict] = None) -> VectorStore:
+    name = name or _store_names()[0]
+    if settings.SHARD_KEY and settings.NODE_ROLE != "reader":
+        return ShardedVectorStore(name, settings.SHARD_KEY, settings.SHARD_COUNT,
+                                  make_store=lambda n: _make_store(n, hnsw), list_stores=_list_stores)
+    return _make_store(name, hnsw)
 
 
-collection = _make_collection(registry.get_embedding_model())
+def require_writer():
+    if settings.NODE_ROLE == "reader":
+        raise HTTPException(status_code=403, detail="Read-only replica: send writes to the ingest writer node")
 
-ollama = OllamaClient(host=settings.OLLAMA_URL)
 
+collection = _make_collection()
+# One centroid per indexed file, for two-stage (document-then-chunk) retrieval.
+document_index = DocumentIndex(_make_store(_store_names()[1]))
 
-def rebuild_collection_with_embedding(embed_model: str):
+
+def _urls(value: str):
+    return [u.strip().rstrip("/") for u in value.split(",") if u.strip()]
+
+
+_default_urls = _urls(settings.OLLAMA_URLS) or _urls(settings.OLLAMA_URL)
+chat_urls = _urls(settings.OLLAMA_CHAT_URLS) or _default_urls
+embed_urls = _urls(settings.OLLAMA_EMBED_URLS) or _default_urls
+
+# `ollama` serves chat/generation and model management; embeddings may go to their own pool.
+ollama = OllamaRouter(
+    chat_urls,
+    name="chat",
+    eject_seconds=settings.OLLAMA_EJECT_SECONDS,
+    health_interval=settings.OLLAMA_HEALTH_INTERVAL_SECONDS,
+)
+if embed_urls == chat_urls:
+    embed_ollama = ollama
+else:
+    embed_ollama = OllamaRouter(
+        embed_urls,
+        name="embedding",
+        eject_seconds=settings.OLLAMA_EJECT_SECONDS,
+        health_interval=settings.OLLAMA_HEALTH_INTERVAL_SECONDS,
+    )
+ollama_routers = [ollama] if embed_ollama is ollama else [ollama, embed_ollama]
+
+embedder = EmbeddingService(
+    ollama=embed_ollama,
+    registry=registry,
+    window_ms=settings.EMBED_BATCH_WINDOW_MS,
+    min_batch=settings.EMBED_MIN_BATCH,
+    max_batch=settings.EMBED_MAX_BATCH,
+    target_latency_ms=settings.EMBED_TARGET_LATENCY_MS,
+    max_inflight=settings.EMBED_MAX_INFLIGHT,
+    keep_alive=settings.OLLAMA_KEEP_ALIVE,
+)
+
+model_catalog = ModelCatalog(ollama, ttl=settings.MODEL_CATALOG_TTL_SECONDS)
+
+model_warmer = ModelWarmer(
+    ollama=ollama,
+    registry=registry,
+    keep_alive=settings.OLLAMA_KEEP_ALIVE,
+    interval=settings.MODEL_KEEPALIVE_INTERVAL_SECONDS,
+    embed_ollama=embed_ollama,
+)
+
+
+def build_index(fill: Callable, hnsw: Optional[Dict] = None):
+    """
+    Builds the next index generation next to the live one, which keeps serving queries
+    meanwhile: `fill(collection, document_index)` loads the new stores. When it fails the
+    half-built stores are dropped and nothing changes. Returns
+    (generation, collection, document_index, fill result) for swap_index().
+    """
+    generation = registry.get_index_generation() + 1
+    names = _generation_names(generation)
+    _drop_generations(lambda g: g == generation)  # left over from an interrupted build
+    col = _make_collection(names[0], hnsw)
+    doc_index = DocumentIndex(_make_store(names[1], hnsw))
     try:
-        client.delete_collection("documents")
+        result = fill(col, doc_index)
     except Exception:
-        pass
-    return _make_collection(embed_model)
+        for store in (col, doc_index.store):
+            try:
+                store.drop()
+            except Exception:
+                pass
+        raise
+    return generation, col, doc_index, result
+
+
+def swap_index(generation: int, new_collection: VectorStore, new_document_index: DocumentIndex, **changes):
+    """
+    Serves a generation from build_index(): re-binds this process, then records the
+    generation (plus the registry `changes` it was built with) so the version bump
+    re-binds the other workers. The previous generation is kept for workers that have
+    not re-bound yet and dropped on the next swap.
+    """
+    global bound_version
+    previous = registry.get_index_generation()
+    bind_services(new_collection, new_document_index)
+    registry.set_index_generation(generation, **changes)
+    bound_version = registry.get_version()
+    _drop_generations(lambda g: g not in (generation, previous))
+
+
+def _drop_generations(stale: Callable[[int], bool]):
+    for name in _list_stores():
+        m = _GENERATION_RE.match(name)
+        if m and stale(int(m.group(1) or 0)):
+            try:
+                _make_store(name).drop()
+            except Exception as e:
+                logger.warning("Could not drop index store %s: %s", name, str(e))
 
 
 def get_sqlite_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect("/app/history/chat_history.db", check_same_thread=False)
+    history_dir = Path(settings.HISTORY_DIR)
+    history_dir.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(history_dir / "chat_history.db"), check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL;")
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS history (
@@ -70,19 +263,161 @@ def get_sqlite_conn() -> sqlite3.Connection:
     return conn
 
 
+chunk_dedup = ChunkDeduplicator(
+    repo=ChunkDedupRepo(sqlite3.connect(str(Path(settings.CONFIG_DIR) / "chunk_dedup.db"), check_same_thread=False)),
+    hasher=MinHasher(num_perm=settings.CHUNK_DEDUP_PERMUTATIONS, bands=settings.CHUNK_DEDUP_BANDS),
+    threshold=settings.CHUNK_DEDUP_THRESHOLD,
+)
+
 rag = RagService(
     collection=collection,
     ollama=ollama,
+    embedder=embedder,
     sqlite_conn=get_sqlite_conn(),
     top_k=settings.TOP_K,
     history_turns=settings.HISTORY_TURNS,
     default_lang=settings.DEFAULT_LANG,
     model_registry=registry,
+    min_similarity=settings.MIN_SIMILARITY,
+    scope_brute_force_max=settings.SCOPE_BRUTE_FORCE_MAX,
+    keep_alive=settings.OLLAMA_KEEP_ALIVE,
+    document_index=document_index,
+    doc_top_n=settings.DOC_TOP_N,
+    confidence_gate=settings.CONFIDENCE_GATE,
+    min_confidence=settings.ANSWER_MIN_CONFIDENCE,
+    min_predict=settings.DEADLINE_MIN_PREDICT,
+    answer_cache_size=settings.ANSWER_CACHE_SIZE,
+    answer_cache_ttl=settings.ANSWER_CACHE_TTL_SECONDS,
+    text_store=text_store,
+    context_window_chars=settings.CONTEXT_WINDOW_CHARS,
+    context_window_chunks=settings.CONTEXT_WINDOW_CHUNKS,
+    dedup=chunk_dedup if settings.CHUNK_DEDUP else None,
 )
 
-ingest = IngestService(
-    storage_dir=settings.STORAGE_DIR,
+
+def make_ingest(col: VectorStore, doc_index: DocumentIndex, embedding=None) -> IngestService:
+    """IngestService over the given stores; `embedding` replaces the shared embedder (e.g. embedder.pinned())."""
+    return IngestService(
+        storage_dir=settings.STORAGE_DIR,
+        collection=col,
+        embedder=embedding or embedder,
+        chunk_size=settings.CHUNK_SIZE,
+        chunk_overlap=settings.CHUNK_OVERLAP,
+        document_index=doc_index,
+        dedup=chunk_dedup if settings.CHUNK_DEDUP else None,
+        text_store=text_store,
+    )
+
+
+ingest = make_ingest(collection, document_index)
+
+catalog = CatalogService(
     collection=collection,
-    chunk_size=settings.CHUNK_SIZE,
-    chunk_overlap=settings.CHUNK_OVERLAP,
+    storage_dir=settings.STORAGE_DIR,
+    ollama=ollama,
+    default_lang=settings.DEFAULT_LANG,
+)
+
+snapshots = SnapshotService(
+    snapshot_dir=settings.SNAPSHOT_DIR,
+    registry=registry,
+    page_size=settings.SNAPSHOT_BATCH_SIZE,
+    text_store=text_store,
+)
+
+shard_service = ShardService(snapshots=snapshots, page_size=settings.SNAPSHOT_BATCH_SIZE)
+
+embedding_reduction = ReductionService(registry=registry, embedder=embedder, page_size=settings.SNAPSHOT_BATCH_SIZE)
+
+hnsw_tuner = HnswTuner(page_size=settings.SNAPSHOT_BATCH_SIZE)
+vector_store_benchmark = VectorStoreBenchmark(work_dir=settings.NUMPY_STORE_DIR, page_size=settings.SNAPSHOT_BATCH_SIZE)
+retrieval_benchmark = RetrievalBenchmark(work_dir=settings.NUMPY_STORE_DIR, page_size=settings.SNAPSHOT_BATCH_SIZE)
+
+_bind_lock = threading.RLock()
+bound_version = registry.get_version()
+
+
+def bind_services(new_collection=None, new_document_index=None):
+    """
+    Re-bind every collection-dependent service to `new_collection` (or to the
+    collection of the currently registered embedding model). New service objects
+    are fully built before being swapped in, so requests see either the old set
+    or the new one.
+    """
+    global collection, document_index, ingest, catalog, bound_version
+    with _bind_lock:
+        col = new_collection if new_collection is not None else _make_collection()
+        doc_index = new_document_index or DocumentIndex(_make_store(_store_names()[1]))
+        new_ingest = make_ingest(col, doc_index)
+        new_catalog = CatalogService(
+            collection=col,
+            storage_dir=settings.STORAGE_DIR,
+            ollama=ollama,
+            default_lang=settings.DEFAULT_LANG,
+        )
+        collection, document_index, ingest, catalog = col, doc_index, new_ingest, new_catalog
+        rag.collection, rag.document_index = col, doc_index
+        bound_version = registry.get_version()
+
+
+def _on_config_change():
+    bind_services()
+    if settings.MODEL_WARMUP_ENABLED:
+        model_warmer.warm_async()
+
+
+publisher = IndexPublisher(
+    snapshots=published,
+    get_collection=lambda: collection,
+    registry=registry,
+    keep=settings.PUBLISH_KEEP,
+    interval=settings.PUBLISH_INTERVAL_SECONDS if settings.NODE_ROLE == "writer" else 0,
+    page_size=settings.SNAPSHOT_BATCH_SIZE,
+)
+
+config_watcher = ConfigWatcher(registry, on_change=_on_config_change, interval=settings.CONFIG_WATCH_INTERVAL)
+
+storage_watcher = StorageWatcher(
+    storage_dir=settings.STORAGE_DIR,
+    get_ingest=lambda: ingest,
+    supported_extensions=SUPPORTED_EXTENSIONS,
+    lock_path=Path(settings.CONFIG_DIR) / "storage_watcher.lock",
+    debounce=settings.STORAGE_WATCH_DEBOUNCE_SECONDS,
+    queue_size=settings.STORAGE_WATCH_QUEUE_SIZE,
+    workers=settings.STORAGE_WATCH_WORKERS,
+    poll_interval=settings.STORAGE_WATCH_POLL_INTERVAL,
+    force_polling=settings.STORAGE_WATCH_POLLING,
 )
+
+history_compactor = HistoryCompactor(
+    repo=rag.history,
+    summarize=(
+        llm_summarizer(ollama, registry, max_chars=settings.HISTORY_SUMMARY_MAX_CHARS)
+        if settings.HISTORY_SUMMARY_USE_LLM
+        else extractive_summarizer(max_chars=settings.HISTORY_SUMMARY_MAX_CHARS)
+    ),
+    lock_path=Path(settings.HISTORY_DIR) / "compaction.lock",
+    keep_turns=settings.HISTORY_RETENTION_TURNS,
+    max_age_days=settings.HISTORY_RETENTION_DAYS,
+    interval=settings.HISTORY_COMPACT_INTERVAL_SECONDS,
+)
+
+background_tasks = [*ollama_routers, config_watcher, history_compactor]
+if settings.MODEL_WARMUP_ENABLED:
+    background_tasks.append(model_warmer)
+if settings.STORAGE_WATCH_ENABLED and settings.NODE_ROLE != "reader":
+    background_tasks.append(storage_watcher)
+if settings.NODE_ROLE == "writer":
+    background_tasks.append(publisher)
+if settings.NODE_ROLE == "reader":
+    background_tasks.append(replica)
+
+
+def start_background_tasks():
+    for task in background_tasks:
+        task.start()
+
+
+def stop_background_tasks():
+    for task in reversed(background_tasks):
+        task.stop()
@@ -1,7 +1,18 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from api.app import deps
 from api.app.routers import upload, admin, chat, files, models
 
-app = FastAPI(title="Local RAG (UA)", version="1.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    deps.start_background_tasks()
+    yield
+    deps.stop_background_tasks()
+
+
+app = FastAPI(title="Local RAG (UA)", version="1.1.0", lifespan=lifespan)
 
 app.include_router(upload.router, prefix="", tags=["upload"])
 app.include_router(admin.router, prefix="", tags=["admin"])
@@ -1 +1,71 @@
-# Placeholder repository for Chroma operations
+from typing import Dict, List, Optional, Sequence
+
+from api.app.repositories.vector_store import VectorStore
+
+
+def _args(**kwargs) -> Dict:
+    return {k: v for k, v in kwargs.items() if v is not None}
+
+
+class ChromaVectorStore(VectorStore):
+    """VectorStore backed by a Chroma collection (embedded or HTTP client)."""
+
+    def __init__(self, client, collection):
+        self.client = client
+        self.collection = collection
+        self.name = collection.name
+
+    def add(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+            metadatas: Optional[List[Dict]] = None):
+        self.collection.add(**_args(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas))
+
+    def upsert(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict]] = None):
+        self.collection.upsert(**_args(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas))
+
+    def update(self, ids: List[str], embeddings=None, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict]] = None):
+        self.collection.update(**_args(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas))
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        self.collection.delete(**_args(ids=ids, where=where))
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: Optional[Sequence[str]] = None) -> Dict:
+        return self.collection.get(**_args(ids=ids, where=where, limit=limit, offset=offset,
+                                           include=list(include) if include is not None else None))
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict] = None,
+              include: Optional[Sequence[str]] = None) -> Dict:
+        return self.collection.query(**_args(query_embeddings=query_embeddings, n_results=n_results, where=where,
+                                             include=list(include) if include is not None else None))
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def drop(self):
+        self.client.delete_collection(self.name)
+
+    def rename(self, name: str) -> VectorStore:
+        self.collection.modify(name=name)
+        self.name = name
+        return self
+
+    @property
+    def stale(self) -> bool:
+        try:
+            return self.client.get_collection(self.name).id != self.collection.id
+        except Exception:
+            return True
+
+    @property
+    def metadata(self) -> Dict:
+        return self.collection.metadata or {}
+
+    @property
+    def configuration(self) -> Optional[Dict]:
+        return getattr(self.collection, "configuration", None)
+
+    @property
+    def max_batch_size(self) -> int:
+        return self.client.get_max_batch_size()
@@ -0,0 +1,154 @@
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+
+class ChunkDedupRepo:
+    """
+    MinHash signatures and LSH bucket keys of the stored chunks, plus `refs`: the
+    near-duplicate occurrences (file, position, metadata) that were not stored and
+    point at a stored chunk instead.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self._lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS signatures(id TEXT PRIMARY KEY, signature BLOB);")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS buckets(band INTEGER, key INTEGER, id TEXT);")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets_key ON buckets(band, key);")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets_id ON buckets(id);")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS refs(
+                id TEXT,
+                file_path TEXT,
+                file_name TEXT,
+                chunk_index INTEGER,
+                metadata TEXT
+            );
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_refs_id ON refs(id);")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_refs_file ON refs(file_path);")
+        self.conn.commit()
+
+    def candidates(self, band_keys: List[int]) -> List[str]:
+        if not band_keys:
+            return []
+        clause = " OR ".join("(band=? AND key=?)" for _ in band_keys)
+        params = [v for band, key in enumerate(band_keys) for v in (band, key)]
+        with self._lock:
+            rows = self.conn.execute(f"SELECT DISTINCT id FROM buckets WHERE {clause}", params).fetchall()
+        return [r[0] for r in rows]
+
+    def signatures(self, ids: Iterable[str]) -> Dict[str, np.ndarray]:
+        ids = list(ids)
+        if not ids:
+            return {}
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT id, signature FROM signatures WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+        return {id_: np.frombuffer(sig, dtype=np.uint64) for id_, sig in rows}
+
+    def add(self, items: List[tuple]):
+        """items: (id, signature, band_keys)."""
+        with self._lock:
+            self.conn.executemany("INSERT OR REPLACE INTO signatures(id, signature) VALUES (?, ?)",
+                                  [(id_, sig.tobytes()) for id_, sig, _ in items])
+            self.conn.executemany("INSERT INTO buckets(band, key, id) VALUES (?, ?, ?)",
+                                  [(band, key, id_) for id_, _, keys in items for band, key in enumerate(keys)])
+            self.conn.commit()
+
+    def remove(self, ids: Iterable[str]):
+        ids = [(i,) for i in ids]
+        with self._lock:
+            self.conn.executemany("DELETE FROM signatures WHERE id=?", ids)
+            self.conn.executemany("DELETE FROM buckets WHERE id=?", ids)
+            self.conn.commit()
+
+    def add_refs(self, refs: List[tuple]):
+        """refs: (id, chunk metadata) of occurrences that point at stored chunk `id`."""
+        with self._lock:
+            self.conn.executemany(
+                "INSERT INTO refs(id, file_path, file_name, chunk_index, metadata) VALUES (?, ?, ?, ?, ?)",
+                [(id_, m.get("file_path"), m.get("file_name"), m.get("chunk_index"),
+                  json.dumps(m, ensure_ascii=False)) for id_, m in refs],
+            )
+            self.conn.commit()
+
+    def refs_for(self, ids: Iterable[str]) -> Dict[str, List[Dict]]:
+        """Occurrences per stored chunk id, oldest first, each {"rowid", "metadata"}."""
+        ids = list(ids)
+        if not ids:
+            return {}
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT rowid, id, metadata FROM refs WHERE id IN ({','.join('?' * len(ids))}) ORDER BY rowid",
+                ids,
+            ).fetchall()
+        out: Dict[str, List[Dict]] = {}
+        for rowid, id_, meta in rows:
+            out.setdefault(id_, []).append({"rowid": rowid, "metadata": json.loads(meta)})
+        return out
+
+    def file_refs(self, file_path: str) -> List[Dict]:
+        with self._lock:
+            rows = self.conn.execute("SELECT id, metadata FROM refs WHERE file_path=? ORDER BY chunk_index",
+                                     (file_path,)).fetchall()
+        return [{"id": id_, "metadata": json.loads(meta)} for id_, meta in rows]
+
+    def refs_of(self, key: Optional[str] = None, values: Optional[Iterable[str]] = None) -> List[Dict]:
+        """Occurrences of the files whose `key` ("file_path" or "file_name") is in `values`; all without a key."""
+        with self._lock:
+            if key is None:
+                rows = self.conn.execute("SELECT id, metadata FROM refs").fetchall()
+            elif key in ("file_path", "file_name"):
+                values = list(values or [])
+                rows = self.conn.execute(
+                    f"SELECT id, metadata FROM refs WHERE {key} IN ({','.join('?' * len(values))})", values
+                ).fetchall() if values else []
+            else:
+                raise ValueError(f"Unsupported key: {key}")
+        return [{"id": id_, "metadata": json.loads(meta)} for id_, meta in rows]
+
+    def delete_refs(self, key: str, value: str) -> Set[str]:
+        """Drops the occurrences of one file (key is "file_path" or "file_name"); returns the ids they pointed at."""
+        if key not in ("file_path", "file_name"):
+            raise ValueError(f"Unsupported key: {key}")
+        with self._lock:
+            ids = {r[0] for r in self.conn.execute(f"SELECT id FROM refs WHERE {key}=?", (value,))}
+            self.conn.execute(f"DELETE FROM refs WHERE {key}=?", (value,))
+            self.conn.commit()
+        return ids
+
+    def delete_ref(self, rowid: int):
+        with self._lock:
+            self.conn.execute("DELETE FROM refs WHERE rowid=?", (rowid,))
+            self.conn.commit()
+
+    def update_file_refs(self, file_path: str, patch: Dict):
+        """Merges `patch` into the stored metadata of a file's occurrences (None removes a key)."""
+        with self._lock:
+            rows = self.conn.execute("SELECT rowid, metadata FROM refs WHERE file_path=?", (file_path,)).fetchall()
+            updates = []
+            for rowid, meta in rows:
+                merged = {k: v for k, v in {**json.loads(meta), **patch}.items() if v is not None}
+                updates.append((json.dumps(merged, ensure_ascii=False), rowid))
+            self.conn.executemany("UPDATE refs SET metadata=? WHERE rowid=?", updates)
+            self.conn.commit()
+
+    def ref_files(self) -> Set[str]:
+        with self._lock:
+            return {r[0] for r in self.conn.execute("SELECT DISTINCT file_path FROM refs") if r[0]}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "stored_chunks": self.conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0],
+                "duplicate_refs": self.conn.execute("SELECT COUNT(*) FROM refs").fetchone()[0],
+            }
@@ -1,12 +1,21 @@
 import json
 import sqlite3
-from typing import List, Dict
+import threading
+import time
+from typing import Callable, List, Dict, Optional
+
+from api.app.utils.profiler import span
 
 
 class HistoryRepo:
+    """
+    Chat history on one SQLite connection shared by request threads and the compactor:
+    every use of it goes through `_lock`, so no thread's commit lands in another's transaction.
+    """
 
     def __init__(self, conn: sqlite3.Connection):
         self.conn = conn
+        self._lock = threading.RLock()
         self.conn.execute(
             """
             CREATE TABLE IF NOT EXISTS history(
@@ -19,6 +28,19 @@ class HistoryRepo:
         )
         self._ensure_column("embedding_model", "TEXT")
         self._ensure_column("embedding", "TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_history_user_ts ON history(user_id, ts);")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS history_summary(
+                user_id TEXT PRIMARY KEY,
+                summary TEXT,
+                turns INTEGER,
+                upto_ts INTEGER,
+                updated_at INTEGER
+            );
+            """
+        )
+        self.conn.commit()
 
     def _ensure_column(self, column_name: str, column_type: str):
         cur = self.conn.execute("PRAGMA table_info(history)")
@@ -29,26 +51,30 @@ class HistoryRepo:
 
     def append(self, user_id: str, role: str, content: str, ts: int, embedding_model: str = None,
                embedding: List[float] = None):
-        self.conn.execute(
-            "INSERT INTO history (user_id, ts, role, content, embedding_model, embedding) VALUES (?, ?, ?, ?, ?, ?)",
-            (
-                user_id,
-                ts,
-                role,
-                content,
-                embedding_model,
-                json.dumps(embedding) if embedding else None
-            ),
-        )
-        self.conn.commit()
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO history (user_id, ts, role, content, embedding_model, embedding) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    user_id,
+                    ts,
+                    role,
+                    content,
+                    embedding_model,
+                    json.dumps(embedding) if embedding else None
+                ),
+            )
+            self.conn.commit()
 
     def recall(self, user_id: str, turns: int) -> List[Dict[str, str]]:
-        cur = self.conn.cursor()
-        cur.execute(
-            "SELECT role, content, embedding_model, embedding FROM history WHERE user_id=? ORDER BY ts DESC LIMIT ?",
-            (user_id, turns * 2),
-        )
-        rows = cur.fetchall()[::-1]
+        with span("HistoryRepo.recall"), self._lock:
+            cur = self.conn.cursor()
+            cur.execute(
+                "SELECT role, content, embedding_model, embedding FROM history WHERE user_id=? "
+                "ORDER BY ts DESC, rowid DESC LIMIT ?",
+                (user_id, turns * 2),
+            )
+            rows = cur.fetchall()[::-1]
         result = []
         for role, content, model, emb in rows:
             item = {"role": role, "content": content}
@@ -61,3 +87,79 @@ class HistoryRepo:
                     pass
             result.append(item)
         return result
+
+    def get_summary(self, user_id: str) -> Optional[str]:
+        with span("HistoryRepo.get_summary"), self._lock:
+            row = self.conn.execute("SELECT summary FROM history_summary WHERE user_id=?", (user_id,)).fetchone()
+        return row[0] if row and row[0] else None
+
+    def user_ids(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self.conn.execute("SELECT DISTINCT user_id FROM history").fetchall()]
+
+    def _summary_row(self, user_id: str) -> Optional[tuple]:
+        return self.conn.execute("SELECT summary, turns FROM history_summary WHERE user_id=?", (user_id,)).fetchone()
+
+    def compact(self, user_id: str, keep_turns: int, min_ts: int,
+                summarize: Callable[[Optional[str], List[Dict]], str]) -> int:
+        """
+        Folds turns that fall outside the retention window (older than `min_ts`, or beyond
+        the newest `keep_turns` user messages) into the user's rolling summary and deletes
+        them. Returns the number of deleted rows.
+
+        The lock is not held while `summarize` runs (it may call the LLM); the summary and
+        the deletes are then written in one transaction, which is dropped if the summary
+        changed meanwhile.
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT rowid, ts, role, content FROM history WHERE user_id=? ORDER BY ts, rowid",
+                (user_id,),
+            ).fetchall()
+            prev = self._summary_row(user_id)
+        if not rows:
+            return 0
+
+        cutoff = 0
+        if keep_turns > 0:
+            user_positions = [i for i, r in enumerate(rows) if r[2] == "user"]
+            if len(user_positions) > keep_turns:
+                cutoff = user_positions[-keep_turns]
+        if min_ts > 0:
+            while cutoff < len(rows) and rows[cutoff][1] < min_ts:
+                cutoff += 1
+        # Never split a turn: an assistant reply goes together with its question.
+        while 0 < cutoff < len(rows) and rows[cutoff][2] == "assistant":
+            cutoff += 1
+        if cutoff == 0:
+            return 0
+
+        dropped = rows[:cutoff]
+        summary = summarize(prev[0] if prev else None, [{"role": r[2], "content": r[3]} for r in dropped])
+        turns = ((prev[1] or 0) if prev else 0) + sum(1 for r in dropped if r[2] == "user")
+
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._summary_row(user_id) != prev:
+                    self.conn.rollback()
+                    return 0
+                self.conn.execute(
+                    "INSERT INTO history_summary (user_id, summary, turns, upto_ts, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET summary=excluded.summary, turns=excluded.turns, "
+                    "upto_ts=excluded.upto_ts, updated_at=excluded.updated_at",
+                    (user_id, summary, turns, dropped[-1][1], int(time.time())),
+                )
+                self.conn.executemany("DELETE FROM history WHERE rowid=?", [(r[0],) for r in dropped])
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+        return len(dropped)
+
+    def vacuum(self):
+        with self._lock:
+            if self.conn.in_transaction:
+                self.conn.commit()
+            self.conn.execute("VACUUM")
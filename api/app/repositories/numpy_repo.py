@@ -0,0 +1,436 @@
+import json
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from api.app.repositories.vector_store import VectorStore
+from api.app.utils.vectors import normalize_rows
+
+_RANGE_OPS = {"$gt": np.greater, "$gte": np.greater_equal, "$lt": np.less, "$lte": np.less_equal}
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class _Column:
+    """
+    One metadata key over all slots, laid out for vectorised filtering: every distinct
+    (type, value) gets an integer code (-1 = key missing), and numbers are also kept as
+    float64 (NaN elsewhere) for range comparisons. Equality is type-strict, so 1, 1.0
+    and True are different values.
+    """
+
+    def __init__(self, capacity: int):
+        self.codes = np.full(capacity, -1, dtype=np.int32)
+        self.numbers = np.full(capacity, np.nan, dtype=np.float64)
+        self._lookup: Dict[tuple, int] = {}
+
+    def _code(self, value: Any, create: bool = False) -> Optional[int]:
+        try:
+            key = (type(value), value)
+            code = self._lookup.get(key)
+            if code is None and create:
+                code = self._lookup[key] = len(self._lookup)
+            return code
+        except TypeError:  # unhashable values never match
+            return None
+
+    def set(self, slot: int, value: Any):
+        code = None if value is None else self._code(value, create=True)
+        self.codes[slot] = -1 if code is None else code
+        self.numbers[slot] = value if _is_number(value) else np.nan
+
+    def grow(self, capacity: int):
+        codes = np.full(capacity, -1, dtype=np.int32)
+        numbers = np.full(capacity, np.nan, dtype=np.float64)
+        codes[:len(self.codes)], numbers[:len(self.numbers)] = self.codes, self.numbers
+        self.codes, self.numbers = codes, numbers
+
+    def present(self, n: int) -> np.ndarray:
+        return self.codes[:n] >= 0
+
+    def isin(self, values, n: int) -> np.ndarray:
+        codes = [c for c in (self._code(v) for v in values) if c is not None]
+        if not codes:
+            return np.zeros(n, dtype=bool)
+        if len(codes) == 1:
+            return self.codes[:n] == codes[0]
+        return np.isin(self.codes[:n], codes)
+
+    def compare(self, op: str, value: Any, n: int) -> np.ndarray:
+        if not _is_number(value):
+            return np.zeros(n, dtype=bool)
+        # NaN (missing or not a number) compares False.
+        return _RANGE_OPS[op](self.numbers[:n], value)
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process exact vector store: L2-normalised float32 rows in a memory-mapped file
+    (`vectors.f32`) plus ids, documents and metadata in SQLite. Metadata is also kept
+    in memory as one column per key for filtering. A query runs one matrix product
+    over the candidate rows and an argpartition for the top-k, so recall is exact.
+    For small and medium corpora this is faster than HNSW and needs no index build.
+
+    Deleted rows leave a free slot that the next insert reuses. Other processes'
+    writes are picked up through SQLite's data_version, which reloads the columns; a
+    store another process renamed into this path is reopened.
+    """
+
+    exact = True
+
+    def __init__(self, path: Path, initial_capacity: int = 1024):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.name = self.path.name
+        self._initial_capacity = max(1, initial_capacity)
+        self._lock = threading.RLock()
+        self._connect()
+        self._load()
+
+    # ----- state -----
+
+    def _connect(self):
+        self._conn = sqlite3.connect(str(self.path / "store.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value TEXT);")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows(slot INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, "
+            "document TEXT, metadata TEXT);"
+        )
+        self._conn.commit()
+        self._inode = (self.path / "store.db").stat().st_ino
+
+    def _load(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE key='dim'").fetchone()
+        self.dim = int(row[0]) if row else None
+        rows = self._conn.execute("SELECT slot, id, document, metadata FROM rows ORDER BY slot").fetchall()
+        self._high = rows[-1][0] + 1 if rows else 0
+
+        capacity = max(self._initial_capacity, self._high)
+        vectors = self.path / "vectors.f32"
+        if self.dim and vectors.exists():
+            capacity = max(capacity, vectors.stat().st_size // (self.dim * 4))
+        self._capacity = capacity
+        self._ids = np.empty(capacity, dtype=object)
+        self._documents = np.empty(capacity, dtype=object)
+        self._metas = np.empty(capacity, dtype=object)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._columns: Dict[str, _Column] = {}
+        self._index: Dict[str, int] = {}
+        for slot, id_, doc, meta in rows:
+            self._set_row(slot, id_, doc, json.loads(meta) if meta else None)
+        self._free = [s for s in range(self._high) if not self._alive[s]][::-1]
+        self._open_matrix()
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _open_matrix(self):
+        if not self.dim:
+            self._matrix = None
+            return
+        vectors = self.path / "vectors.f32"
+        needed = self._capacity * self.dim * 4
+        with open(vectors, "ab") as fh:
+            if fh.tell() < needed:
+                fh.truncate(needed)
+        self._matrix = np.memmap(vectors, dtype=np.float32, mode="r+", shape=(self._capacity, self.dim))
+
+    def _maybe_reload(self):
+        if self.stale and (self.path / "store.db").exists():
+            # Another process swapped a rebuilt store in under this path (see rename()).
+            self._matrix = None
+            self._conn.close()
+            self._connect()
+            self._load()
+            return
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._load()
+
+    def _grow(self, needed: int):
+        if needed <= self._capacity:
+            return
+        capacity = max(needed, self._capacity * 2)
+
+        def extend(arr: np.ndarray) -> np.ndarray:
+            out = np.empty(capacity, dtype=arr.dtype) if arr.dtype == object else np.zeros(capacity, dtype=arr.dtype)
+            out[:len(arr)] = arr
+            return out
+
+        self._ids, self._documents, self._metas = extend(self._ids), extend(self._documents), extend(self._metas)
+        self._alive = extend(self._alive)
+        for col in self._columns.values():
+            col.grow(capacity)
+        self._capacity = capacity
+        if self._matrix is not None:
+            self._matrix.flush()
+        # Growing the file never invalidates the old mapping, so readers holding it stay safe.
+        self._open_matrix()
+
+    def _set_row(self, slot: int, id_: str, document: Optional[str], meta: Optional[Dict]):
+        self._ids[slot] = id_
+        self._documents[slot] = document
+        self._metas[slot] = meta
+        self._alive[slot] = True
+        self._index[id_] = slot
+        for key, col in self._columns.items():
+            if not meta or key not in meta:
+                col.set(slot, None)
+        for key, value in (meta or {}).items():
+            col = self._columns.get(key)
+            if col is None:
+                col = self._columns[key] = _Column(self._capacity)
+            col.set(slot, value)
+
+    def _clear_row(self, slot: int):
+        self._index.pop(self._ids[slot], None)
+        self._ids[slot] = self._documents[slot] = self._metas[slot] = None
+        self._alive[slot] = False
+        for col in self._columns.values():
+            col.set(slot, None)
+        self._free.append(slot)
+
+    # ----- filtering -----
+
+    def _mask(self, where: Optional[Dict]) -> np.ndarray:
+        alive = self._alive[:self._high]
+        if not where:
+            return alive.copy()
+        return alive & self._eval(where)
+
+    def _eval(self, where: Dict) -> np.ndarray:
+        mask = np.ones(self._high, dtype=bool)
+        for key, cond in where.items():
+            if key == "$and":
+                for sub in cond:
+                    mask &= self._eval(sub)
+            elif key == "$or":
+                any_mask = np.zeros(self._high, dtype=bool)
+                for sub in cond:
+                    any_mask |= self._eval(sub)
+                mask &= any_mask
+            else:
+                mask &= self._cond(key, cond)
+        return mask
+
+    def _cond(self, key: str, cond) -> np.ndarray:
+        n = self._high
+        col = self._columns.get(key)
+        if col is None:
+            return np.zeros(n, dtype=bool)
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        mask = np.ones(n, dtype=bool)
+        for op, value in cond.items():
+            if op == "$eq":
+                mask &= col.isin([value], n)
+            elif op == "$ne":
+                mask &= col.present(n) & ~col.isin([value], n)
+            elif op == "$in":
+                mask &= col.isin(value, n)
+            elif op == "$nin":
+                mask &= col.present(n) & ~col.isin(value, n)
+            elif op in _RANGE_OPS:
+                mask &= col.compare(op, value, n)
+            else:
+                raise ValueError(f"Unsupported where operator: {op}")
+        return mask
+
+    # ----- writes -----
+
+    def _prepare(self, embeddings, n: int) -> np.ndarray:
+        vectors = normalize_rows(embeddings)
+        if len(vectors) != n:
+            raise ValueError(f"Got {len(vectors)} embeddings for {n} ids")
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+            self._conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('dim', ?)", (str(self.dim),))
+            self._open_matrix()
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection dimensionality {self.dim}")
+        return vectors
+
+    def _take_slot(self) -> int:
+        if self._free:
+            return self._free.pop()
+        self._grow(self._high + 1)
+        self._high += 1
+        return self._high - 1
+
+    def _write(self, ids: List[str], embeddings, documents, metadatas, insert: bool, replace: bool):
+        with self._lock:
+            self._maybe_reload()
+            n = len(ids)
+            vectors = self._prepare(embeddings, n) if embeddings is not None else None
+            changed = []
+            for i, id_ in enumerate(ids):
+                slot = self._index.get(id_)
+                if slot is None:
+                    if not insert:
+                        continue
+                    if vectors is None:
+                        raise ValueError("Embeddings are required for new ids")
+                    slot = self._take_slot()
+                    doc = documents[i] if documents is not None else None
+                    meta = metadatas[i] if metadatas is not None else None
+                elif not replace:
+                    continue
+                else:
+                    doc = documents[i] if documents is not None else self._documents[slot]
+                    meta = self._metas[slot]
+                    if metadatas is not None:
+                        # Chroma semantics: metadata is merged, a None value removes the key.
+                        meta = {k: v for k, v in {**(meta or {}), **(metadatas[i] or {})}.items() if v is not None}
+                if vectors is not None:
+                    self._matrix[slot] = vectors[i]
+                self._set_row(slot, id_, doc, meta)
+                changed.append((slot, id_, doc, json.dumps(meta, ensure_ascii=False) if meta else None))
+            if self._matrix is not None:
+                self._matrix.flush()
+            self._conn.executemany("INSERT OR REPLACE INTO rows(slot, id, document, metadata) VALUES (?, ?, ?, ?)",
+                                   changed)
+            self._conn.commit()
+
+    def add(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+            metadatas: Optional[List[Dict]] = None):
+        # Like Chroma, existing ids are left untouched.
+        self._write(ids, embeddings, documents, metadatas, insert=True, replace=False)
+
+    def upsert(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict]] = None):
+        self._write(ids, embeddings, documents, metadatas, insert=True, replace=True)
+
+    def update(self, ids: List[str], embeddings=None, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict]] = None):
+        self._write(ids, embeddings, documents, metadatas, insert=False, replace=True)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        with self._lock:
+            self._maybe_reload()
+            if ids is not None:
+                slots = [self._index[i] for i in ids if i in self._index]
+                if where:
+                    mask = self._mask(where)
+                    slots = [s for s in slots if mask[s]]
+            else:
+                slots = np.flatnonzero(self._mask(where)).tolist()
+            for slot in slots:
+                self._clear_row(slot)
+            self._conn.executemany("DELETE FROM rows WHERE slot=?", [(s,) for s in slots])
+            self._conn.commit()
+
+    # ----- reads -----
+
+    def _rows(self, slots: Sequence[int], include: Sequence[str]) -> Dict:
+        slots = list(slots)
+        return {
+            "ids": [self._ids[s] for s in slots],
+            "embeddings": (np.array(self._matrix[slots]) if self._matrix is not None and slots
+                           else np.empty((0, self.dim or 0), dtype=np.float32)) if "embeddings" in include else None,
+            "documents": [self._documents[s] for s in slots] if "documents" in include else None,
+            "metadatas": [dict(self._metas[s]) if self._metas[s] else None for s in slots]
+            if "metadatas" in include else None,
+        }
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: Optional[Sequence[str]] = None) -> Dict:
+        include = ("documents", "metadatas") if include is None else include
+        with self._lock:
+            self._maybe_reload()
+            if ids is not None:
+                slots = [self._index[i] for i in ids if i in self._index]
+                if where:
+                    mask = self._mask(where)
+                    slots = [s for s in slots if mask[s]]
+            else:
+                slots = np.flatnonzero(self._mask(where)).tolist()
+            start = offset or 0
+            slots = slots[start:start + limit] if limit is not None else slots[start:]
+            return self._rows(slots, include)
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict] = None,
+              include: Optional[Sequence[str]] = None) -> Dict:
+        include = ("documents", "metadatas", "distances") if include is None else include
+        queries = normalize_rows(query_embeddings)
+        with self._lock:
+            self._maybe_reload()
+            mask = self._mask(where)
+            matrix = self._matrix
+            # Slot -> id as of the mask: a slot freed and reused during the product
+            # must not lend its old score to the new row.
+            ids = self._ids[:len(mask)].copy()
+        candidates = np.flatnonzero(mask)
+        k = min(n_results, len(candidates))
+        if matrix is None or k <= 0:
+            idx = np.empty((len(queries), 0), dtype=np.int64)
+            dist = np.empty((len(queries), 0), dtype=np.float32)
+        else:
+            # The matrix product runs outside the lock; numpy releases the GIL for it.
+            if len(candidates) == len(mask):
+                sims = queries @ matrix[:len(mask)].T
+            else:
+                sims = queries @ matrix[candidates].T
+            if k < sims.shape[1]:
+                part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            else:
+                part = np.tile(np.arange(sims.shape[1]), (len(queries), 1))
+            top = np.take_along_axis(sims, part, axis=1)
+            order = np.argsort(-top, axis=1)
+            idx = candidates[np.take_along_axis(part, order, axis=1)]
+            dist = 1.0 - np.take_along_axis(top, order, axis=1)
+
+        out = {"ids": [], "distances": [] if "distances" in include else None,
+               "documents": [] if "documents" in include else None,
+               "metadatas": [] if "metadatas" in include else None,
+               "embeddings": [] if "embeddings" in include else None}
+        with self._lock:
+            for row, drow in zip(idx, dist):
+                # Rows deleted or replaced while the product ran are dropped rather than returned stale.
+                keep = [(int(s), float(d)) for s, d in zip(row, drow) if self._alive[s] and self._ids[s] == ids[s]]
+                rows = self._rows([s for s, _ in keep], include)
+                out["ids"].append(rows["ids"])
+                if out["distances"] is not None:
+                    out["distances"].append([d for _, d in keep])
+                for key in ("documents", "metadatas", "embeddings"):
+                    if out[key] is not None:
+                        out[key].append(rows[key])
+        return out
+
+    def count(self) -> int:
+        with self._lock:
+            self._maybe_reload()
+            return int(self._alive[:self._high].sum())
+
+    def drop(self):
+        with self._lock:
+            self._matrix = None
+            self._conn.close()
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def rename(self, name: str) -> VectorStore:
+        with self._lock:
+            self._matrix = None
+            self._conn.close()
+            target = self.path.parent / name
+            self.path.rename(target)
+        return NumpyVectorStore(target, initial_capacity=self._initial_capacity)
+
+    @property
+    def stale(self) -> bool:
+        try:
+            return (self.path / "store.db").stat().st_ino != self._inode
+        except FileNotFoundError:
+            return True
+
+    @property
+    def metadata(self) -> Dict:
+        return {"store": "numpy", "space": "cosine"}
+
+    @property
+    def max_batch_size(self) -> int:
+        return 100_000
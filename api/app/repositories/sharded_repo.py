@@ -0,0 +1,510 @@
+import contextvars
+import hashlib
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from api.app.repositories.vector_store import VectorStore
+from api.app.utils.logger import setup_logger
+
+SHARD_KEYS = ("file_path", "tag")
+_NAME_RE = re.compile(r"[^a-z0-9_-]+")
+
+
+def _file_paths(where: Optional[Dict]) -> Optional[set]:
+    """file_path values a `where` filter is restricted to, or None when it is not."""
+    if not where:
+        return None
+    if "$and" in where:
+        found = None
+        for sub in where["$and"]:
+            paths = _file_paths(sub)
+            if paths is not None:
+                found = paths if found is None else found & paths
+        return found
+    cond = where.get("file_path")
+    if isinstance(cond, str):
+        return {cond}
+    if isinstance(cond, dict):
+        if isinstance(cond.get("$eq"), str):
+            return {cond["$eq"]}
+        if isinstance(cond.get("$in"), list):
+            return set(cond["$in"])
+    return None
+
+
+class _MirroredShard(VectorStore):
+    """
+    Stands in for a shard while it is rebuilt into `shadow`. Reads go to the live store.
+    Writes go to the live store and are logged until replay() applies the log to the
+    shadow; from then on they reach both, so the shadow can take over without losing any.
+    """
+
+    def __init__(self, live: VectorStore, shadow: VectorStore):
+        self.live = live
+        self.shadow: Optional[VectorStore] = shadow
+        self.name = live.name
+        self.lock = threading.Lock()
+        self._log: Optional[List[tuple]] = []
+
+    def _write(self, method: str, **kwargs):
+        with self.lock:
+            getattr(self.live, method)(**kwargs)
+            if self._log is not None:
+                self._log.append((method, kwargs))
+            elif self.shadow is not None:
+                getattr(self.shadow, method)(**kwargs)
+
+    def replay(self):
+        with self.lock:
+            for method, kwargs in self._log or []:
+                getattr(self.shadow, method)(**kwargs)
+            self._log = None
+
+    def add(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+            metadatas: Optional[List[Dict]] = None):
+        self._write("add", ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def upsert(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict]] = None):
+        self._write("upsert", ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def update(self, ids: List[str], embeddings=None, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict]] = None):
+        self._write("update", ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        self._write("delete", ids=ids, where=where)
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: Optional[Sequence[str]] = None) -> Dict:
+        return self.live.get(ids=ids, where=where, limit=limit, offset=offset, include=include)
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict] = None,
+              include: Optional[Sequence[str]] = None) -> Dict:
+        return self.live.query(query_embeddings=query_embeddings, n_results=n_results, where=where, include=include)
+
+    def count(self) -> int:
+        return self.live.count()
+
+    def drop(self):
+        self.live.drop()
+        if self.shadow is not None:
+            self.shadow.drop()
+
+    @property
+    def exact(self) -> bool:
+        return self.live.exact
+
+    @property
+    def metadata(self) -> Dict:
+        return self.live.metadata
+
+    @property
+    def configuration(self) -> Optional[Dict]:
+        return self.live.configuration
+
+    @property
+    def max_batch_size(self) -> int:
+        return self.live.max_batch_size
+
+
+class ShardedVectorStore(VectorStore):
+    """
+    A VectorStore partitioned into several underlying stores ("shards"), each with its
+    own index and write lock. Rows are routed by `shard_key`:
+
+      * "file_path": a stable hash of the chunk's file_path modulo `shard_count`
+        (shards `<name>_s00`, `<name>_s01`, ...);
+      * "tag": the file's first tag (`<name>_t_<tag>`, untagged files in `<name>_default`).
+
+    Queries fan out to the shards in parallel and the per-shard top-k lists are merged
+    by distance. A filter on file_path only visits the shards those files hash to.
+    Shards that exist but are not valid targets for the current settings (the unsharded
+    collection, or shards beyond a reduced shard_count) are still searched until
+    rebalance() drains them. rebuild_shard() rebuilds one shard next to the live one
+    and swaps it in; a shard another process swapped is reopened on first failure.
+    """
+
+    DISCOVERY_TTL = 5.0
+
+    def __init__(self, name: str, shard_key: str, shard_count: int, make_store: Callable[[str], VectorStore],
+                 list_stores: Callable[[], List[str]], max_workers: int = 8):
+        if shard_key not in SHARD_KEYS:
+            raise ValueError(f"Unsupported shard key {shard_key!r} (use one of {', '.join(SHARD_KEYS)})")
+        self.name = name
+        self.shard_key = shard_key
+        self.shard_count = max(1, shard_count)
+        self._make_store = make_store
+        self._list_stores = list_stores
+        self._lock = threading.RLock()
+        self._stores: Dict[str, VectorStore] = {}
+        self._discovered_at = 0.0
+        self._rebuilding = set()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shard")
+        self.logger = setup_logger()
+        if shard_key == "file_path":
+            for i in range(self.shard_count):
+                self._store(self._hash_shard(i))
+        self._discover(force=True)
+
+    # ----- routing -----
+
+    def _hash_shard(self, i: int) -> str:
+        return f"{self.name}_s{i:02d}"
+
+    def _hash_of(self, value: str) -> str:
+        h = int(hashlib.sha1(value.encode("utf-8")).hexdigest()[:8], 16)
+        return self._hash_shard(h % self.shard_count)
+
+    def shard_for(self, meta: Optional[Dict], id_: str = "") -> str:
+        meta = meta or {}
+        if self.shard_key == "file_path":
+            return self._hash_of(meta.get("file_path") or id_)
+        tags = [t for t in str(meta.get("tags") or "").split(",") if t]
+        tag = _NAME_RE.sub("-", tags[0]).strip("_-") if tags else ""
+        return f"{self.name}_t_{tag}" if tag else f"{self.name}_default"
+
+    def is_target(self, shard: str) -> bool:
+        if self.shard_key == "file_path":
+            return shard in {self._hash_shard(i) for i in range(self.shard_count)}
+        return shard.startswith(f"{self.name}_t_") or shard == f"{self.name}_default"
+
+    def _owns(self, shard: str) -> bool:
+        return shard == self.name or shard.startswith(f"{self.name}_")
+
+    # ----- shard registry -----
+
+    def _store(self, shard: str) -> VectorStore:
+        with self._lock:
+            store = self._stores.get(shard)
+            if store is None:
+                store = self._stores[shard] = self._make_store(shard)
+            return store
+
+    def _discover(self, force: bool = False):
+        with self._lock:
+            if not force and time.monotonic() - self._discovered_at < self.DISCOVERY_TTL:
+                return
+            # Other workers may have created shards (new tags) or swapped in rebuilt ones.
+            for shard in self._list_stores():
+                if self._owns(shard) and (shard not in self._stores or self._stores[shard].stale):
+                    self._stores[shard] = self._make_store(shard)
+            self._discovered_at = time.monotonic()
+
+    def _reopen(self, shard: str) -> Optional[VectorStore]:
+        """A fresh handle on `shard`, or None (and forgotten) if another worker dropped it."""
+        with self._lock:
+            if shard not in self._list_stores():
+                self._stores.pop(shard, None)
+                return None
+            store = self._stores[shard] = self._make_store(shard)
+            return store
+
+    def shards(self) -> Dict[str, VectorStore]:
+        self._discover()
+        with self._lock:
+            return dict(sorted(self._stores.items()))
+
+    def _targets(self, where: Optional[Dict]) -> Dict[str, VectorStore]:
+        shards = self.shards()
+        paths = _file_paths(where) if self.shard_key == "file_path" else None
+        if paths is None:
+            return shards
+        wanted = {self._hash_of(p) for p in paths}
+        return {n: s for n, s in shards.items() if n in wanted or not self.is_target(n)}
+
+    def _fan_out(self, shards: Dict[str, VectorStore], fn: Callable[[VectorStore], Dict]) -> List[Dict]:
+        if len(shards) == 1:
+            pending = {n: (lambda s=s: fn(s)) for n, s in shards.items()}
+        else:
+            pending = {n: self._pool.submit(contextvars.copy_context().run, fn, s).result
+                       for n, s in shards.items()}
+        results = []
+        for n, result in pending.items():
+            try:
+                results.append(result())
+            except Exception as e:
+                if n in self._rebuilding:
+                    self.logger.info("Shard %s skipped while rebuilding: %s", n, e)
+                    continue
+                # Another worker may have swapped in a rebuilt shard: retry once on a fresh handle.
+                self.logger.info("Shard %s failed (%s), reopening", n, e)
+                store = self._reopen(n)
+                if store is not None:
+                    results.append(fn(store))
+        return results
+
+    # ----- writes -----
+
+    def _route(self, ids: List[str], metadatas: Optional[List[Dict]]) -> Dict[str, List[int]]:
+        groups: Dict[str, List[int]] = {}
+        for i, id_ in enumerate(ids):
+            groups.setdefault(self.shard_for(metadatas[i] if metadatas else None, id_), []).append(i)
+        return groups
+
+    @staticmethod
+    def _pick(values, rows: List[int]):
+        if values is None:
+            return None
+        if isinstance(values, np.ndarray):
+            return values[rows]
+        return [values[i] for i in rows]
+
+    def add(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+            metadatas: Optional[List[Dict]] = None):
+        for shard, rows in self._route(ids, metadatas).items():
+            self._store(shard).add(ids=[ids[i] for i in rows], embeddings=self._pick(embeddings, rows),
+                                   documents=self._pick(documents, rows), metadatas=self._pick(metadatas, rows))
+
+    def _owners(self, ids: List[str]) -> Dict[str, Dict[str, Dict]]:
+        """shard -> {id: metadata} for every shard currently holding some of `ids`."""
+        owners = {}
+        for shard, store in self.shards().items():
+            found = store.get(ids=ids, include=["metadatas"])
+            if found.get("ids"):
+                owners[shard] = dict(zip(found["ids"], found.get("metadatas") or [None] * len(found["ids"])))
+        return owners
+
+    def _move(self, source: str, ids: List[str], metadatas: Optional[List[Dict]] = None,
+              embeddings=None, documents: Optional[List[str]] = None) -> Dict[str, int]:
+        """
+        Moves rows out of `source`, merging `metadatas` (Chroma semantics: a None value
+        removes the key) and replacing embeddings/documents when given.
+        """
+        store = self._store(source)
+        rows = store.get(ids=ids, include=["embeddings", "documents", "metadatas"])
+        position = {id_: i for i, id_ in enumerate(ids)}
+        moved_ids, embs, docs, metas = [], [], [], []
+        for j, id_ in enumerate(rows["ids"]):
+            i = position[id_]
+            meta = dict(rows["metadatas"][j] or {})
+            if metadatas is not None:
+                meta = {k: v for k, v in {**meta, **(metadatas[i] or {})}.items() if v is not None}
+            moved_ids.append(id_)
+            embs.append(embeddings[i] if embeddings is not None else rows["embeddings"][j])
+            docs.append(documents[i] if documents is not None else rows["documents"][j])
+            metas.append(meta or None)
+        counts: Dict[str, int] = {}
+        for shard, group in self._route(moved_ids, metas).items():
+            self._store(shard).upsert(ids=[moved_ids[i] for i in group],
+                                      embeddings=np.asarray([embs[i] for i in group], dtype=np.float32),
+                                      documents=[docs[i] for i in group], metadatas=[metas[i] for i in group])
+            counts[shard] = len(group)
+        store.delete(ids=moved_ids)
+        return counts
+
+    def _rewrite(self, ids: List[str], embeddings, documents, metadatas, insert: bool):
+        owners = self._owners(ids)
+        position = {id_: i for i, id_ in enumerate(ids)}
+        placed = set()
+        for shard, current in owners.items():
+            stay, move = [], []
+            for id_, meta in current.items():
+                i = position[id_]
+                merged = {**(meta or {}), **(metadatas[i] or {})} if metadatas is not None else meta
+                (stay if self.shard_for(merged, id_) == shard else move).append(i)
+                placed.add(id_)
+            if stay:
+                write = self._store(shard).upsert if insert else self._store(shard).update
+                write(ids=[ids[i] for i in stay], embeddings=self._pick(embeddings, stay),
+                      documents=self._pick(documents, stay), metadatas=self._pick(metadatas, stay))
+            if move:
+                self._move(shard, [ids[i] for i in move], self._pick(metadatas, move),
+                           self._pick(embeddings, move), self._pick(documents, move))
+        if insert:
+            new = [i for i, id_ in enumerate(ids) if id_ not in placed]
+            if new:
+                self.add(ids=[ids[i] for i in new], embeddings=self._pick(embeddings, new),
+                         documents=self._pick(documents, new), metadatas=self._pick(metadatas, new))
+
+    def upsert(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict]] = None):
+        self._rewrite(ids, embeddings, documents, metadatas, insert=True)
+
+    def update(self, ids: List[str], embeddings=None, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict]] = None):
+        # A metadata change may change the shard key (e.g. a file's first tag): such rows move.
+        self._rewrite(ids, embeddings, documents, metadatas, insert=False)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        for store in self._targets(where).values():
+            store.delete(ids=ids, where=where)
+
+    # ----- reads -----
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: Optional[Sequence[str]] = None) -> Dict:
+        keys = ("documents", "metadatas") if include is None else tuple(include)
+        out = {"ids": [], "embeddings": [] if "embeddings" in keys else None,
+               "documents": [] if "documents" in keys else None, "metadatas": [] if "metadatas" in keys else None}
+        skip, remaining = offset or 0, limit
+        # Shards are visited in name order, so offset/limit paging is stable.
+        for store in self._targets(where).values():
+            if remaining is not None and remaining <= 0:
+                break
+            if ids is None and where is None:
+                n = store.count()
+                if skip >= n:
+                    skip -= n
+                    continue
+                page = store.get(limit=remaining, offset=skip, include=include)
+                drop, skip = 0, 0
+            else:
+                page = store.get(ids=ids, where=where, include=include,
+                                 limit=None if remaining is None else skip + remaining)
+                drop = min(skip, len(page["ids"]))
+                skip -= drop
+            page_ids = page["ids"][drop:]
+            out["ids"].extend(page_ids)
+            for key in ("embeddings", "documents", "metadatas"):
+                if out[key] is not None and page.get(key) is not None:
+                    out[key].extend(page[key][drop:])
+            if remaining is not None:
+                remaining -= len(page_ids)
+        if out["embeddings"] is not None:
+            out["embeddings"] = np.asarray(out["embeddings"], dtype=np.float32) if out["embeddings"] else []
+        return out
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict] = None,
+              include: Optional[Sequence[str]] = None) -> Dict:
+        keys = ("documents", "metadatas", "distances") if include is None else tuple(include)
+        # Distances are needed to merge, even if the caller did not ask for them.
+        shard_include = list(dict.fromkeys([*keys, "distances"]))
+        parts = self._fan_out(self._targets(where), lambda s: s.query(
+            query_embeddings=query_embeddings, n_results=n_results, where=where, include=shard_include))
+
+        n = len(query_embeddings)
+        out = {"ids": [], **{k: [] if k in keys else None for k in ("distances", "documents", "metadatas",
+                                                                     "embeddings")}}
+        for qi in range(n):
+            merged = []
+            for part in parts:
+                for j, id_ in enumerate(part["ids"][qi]):
+                    merged.append((part["distances"][qi][j], id_, part, j))
+            merged.sort(key=lambda x: x[0])
+            merged = merged[:n_results]
+            out["ids"].append([m[1] for m in merged])
+            for key in ("distances", "documents", "metadatas", "embeddings"):
+                if out[key] is not None:
+                    out[key].append([m[2][key][qi][m[3]] for m in merged])
+        return out
+
+    def count(self) -> int:
+        return sum(store.count() for store in self.shards().values())
+
+    def drop(self):
+        for store in self.shards().values():
+            store.drop()
+        with self._lock:
+            self._stores.clear()
+        self._pool.shutdown(wait=False)
+
+    # ----- maintenance -----
+
+    def rebuild_shard(self, shard: str, fill: Callable[[VectorStore, VectorStore], Any]):
+        """
+        Rebuilds one shard next to the live one: `fill(live, shadow)` loads the empty
+        shadow store while the live shard keeps serving queries, and writes routed to the
+        shard meanwhile reach both (see _MirroredShard). The shadow then takes over the
+        shard's name. On failure the shadow is dropped and the live shard stays.
+        Returns what `fill` returned.
+        """
+        temp = f"rebuild-{shard}"
+        if temp in self._list_stores():
+            self._make_store(temp).drop()  # left over from an interrupted rebuild
+        shadow = self._make_store(temp)
+        with self._lock:
+            live = self._stores[shard]
+            mirror = self._stores[shard] = _MirroredShard(live, shadow)
+        self._rebuilding.add(shard)
+        swapped = False
+        try:
+            result = fill(live, shadow)
+            mirror.replay()
+            with mirror.lock:
+                live.drop()
+                swapped = True
+                fresh = shadow.rename(shard)
+                mirror.live, mirror.shadow = fresh, None
+            with self._lock:
+                self._stores[shard] = fresh
+            return result
+        except Exception:
+            if not swapped:
+                with self._lock:
+                    self._stores[shard] = live
+                shadow.drop()
+            raise
+        finally:
+            self._rebuilding.discard(shard)
+
+    def rebalance_shard(self, shard: str, batch_size: int = 1000) -> Dict[str, int]:
+        """Moves the rows of one shard whose shard key maps elsewhere; returns {target shard: rows}."""
+        store = self._store(shard)
+        misplaced, offset = [], 0
+        while True:
+            page = store.get(limit=batch_size, offset=offset, include=["metadatas"])
+            if not page["ids"]:
+                break
+            metas = page.get("metadatas") or [None] * len(page["ids"])
+            misplaced.extend(id_ for id_, meta in zip(page["ids"], metas) if self.shard_for(meta, id_) != shard)
+            offset += len(page["ids"])
+        moved: Dict[str, int] = {}
+        for i in range(0, len(misplaced), batch_size):
+            for target, n in self._move(shard, misplaced[i:i + batch_size]).items():
+                moved[target] = moved.get(target, 0) + n
+        if misplaced:
+            self.logger.info("Rebalance: moved %d rows out of %s", len(misplaced), shard)
+        return moved
+
+    def status(self) -> List[Dict]:
+        return [{"shard": n, "count": s.count(), "target": self.is_target(n), "rebuilding": n in self._rebuilding}
+                for n, s in self.shards().items()]
+
+    def rebalance(self, batch_size: int = 1000) -> Dict:
+        """
+        Moves every row whose shard key maps to another shard (after a shard_count or
+        shard_key change, or from the unsharded collection) and drops drained shards
+        that are no longer valid targets.
+        """
+        start = time.perf_counter()
+        self._discover(force=True)
+        moved: Dict[str, int] = {}
+        dropped = []
+        for shard, store in self.shards().items():
+            for target, n in self.rebalance_shard(shard, batch_size).items():
+                moved[target] = moved.get(target, 0) + n
+            if not self.is_target(shard) and store.count() == 0:
+                with self._lock:
+                    self._stores.pop(shard, None)
+                store.drop()
+                dropped.append(shard)
+        return {"moved": sum(moved.values()), "moved_to": moved, "dropped": dropped,
+                "seconds": round(time.perf_counter() - start, 2)}
+
+    # ----- VectorStore properties -----
+
+    @property
+    def exact(self) -> bool:
+        shards = self.shards()
+        return bool(shards) and all(s.exact for s in shards.values())
+
+    @property
+    def metadata(self) -> Dict:
+        first = next(iter(self.shards().values()), None)
+        return {**(first.metadata if first else {}), "shard_key": self.shard_key, "shards": len(self.shards())}
+
+    @property
+    def configuration(self) -> Optional[Dict]:
+        first = next(iter(self.shards().values()), None)
+        return first.configuration if first else None
+
+    @property
+    def max_batch_size(self) -> int:
+        first = next(iter(self.shards().values()), None)
+        return first.max_batch_size if first else super().max_batch_size
@@ -0,0 +1,62 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+
+class TextStore:
+    """
+    Extracted text of indexed files, one `<file_hash>.txt` per content hash, with the
+    chunk spans beside it in `<file_hash>.spans.json` ([[start, end], ...] by chunk_index).
+    Recently read texts are kept in memory.
+    """
+
+    def __init__(self, root: Path, cache_size: int = 16):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[str, List[Tuple[int, int]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _paths(self, file_hash: str) -> Tuple[Path, Path]:
+        return self.root / f"{file_hash}.txt", self.root / f"{file_hash}.spans.json"
+
+    def put(self, file_hash: str, text: str, spans: List[Tuple[int, int]]):
+        text_path, spans_path = self._paths(file_hash)
+        for path, data in ((text_path, text), (spans_path, json.dumps([list(s) for s in spans]))):
+            tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+            tmp.write_text(data, encoding="utf-8")
+            os.replace(tmp, path)
+        with self._lock:
+            self._cache.pop(file_hash, None)
+
+    def has(self, file_hash: str) -> bool:
+        return all(p.exists() for p in self._paths(file_hash))
+
+    def get(self, file_hash: Optional[str]) -> Optional[Tuple[str, List[Tuple[int, int]]]]:
+        """(text, spans) of a content hash, or None when it was never stored."""
+        if not file_hash:
+            return None
+        with self._lock:
+            if file_hash in self._cache:
+                self._cache.move_to_end(file_hash)
+                return self._cache[file_hash]
+        text_path, spans_path = self._paths(file_hash)
+        try:
+            text = text_path.read_text(encoding="utf-8")
+            spans = [tuple(s) for s in json.loads(spans_path.read_text(encoding="utf-8"))]
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._cache[file_hash] = (text, spans)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return text, spans
+
+    def delete(self, file_hash: str):
+        with self._lock:
+            self._cache.pop(file_hash, None)
+        for path in self._paths(file_hash):
+            path.unlink(missing_ok=True)
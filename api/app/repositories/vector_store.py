@@ -0,0 +1,127 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence
+
+from api.app.utils.profiler import span
+from api.app.utils.vectors import cosine_top_k
+
+
+class VectorStore(ABC):
+    """
+    The collection interface the services rely on. It is a subset of Chroma's Collection
+    API and returns Chroma's result shapes: get() gives flat lists, and query() gives one
+    list per query embedding. Every backend accepts the same `where` filters
+    ($eq/$ne/$gt/$gte/$lt/$lte/$in/$nin, $and/$or).
+
+    `include=None` means the backend default: documents and metadatas, plus distances
+    for query(). Embeddings are always passed explicitly; no backend embeds text.
+    """
+
+    name: str = "documents"
+    # True when query() scores every candidate exactly (no ANN recall loss).
+    exact: bool = False
+
+    @abstractmethod
+    def add(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+            metadatas: Optional[List[Dict]] = None):
+        ...
+
+    @abstractmethod
+    def upsert(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict]] = None):
+        ...
+
+    @abstractmethod
+    def update(self, ids: List[str], embeddings=None, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict]] = None):
+        ...
+
+    @abstractmethod
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        ...
+
+    @abstractmethod
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: Optional[Sequence[str]] = None) -> Dict:
+        ...
+
+    @abstractmethod
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict] = None,
+              include: Optional[Sequence[str]] = None) -> Dict:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def drop(self):
+        """Deletes all data of this store; the object must not be used afterwards."""
+
+    def rename(self, name: str) -> "VectorStore":
+        """
+        Moves the data under another name and returns the store to use from now on
+        (this object must not be used afterwards). Not every backend supports it.
+        """
+        raise NotImplementedError(f"{type(self).__name__} cannot be renamed")
+
+    @property
+    def stale(self) -> bool:
+        """True when another process replaced the underlying data, so the store must be reopened."""
+        return False
+
+    @property
+    def metadata(self) -> Dict:
+        return {}
+
+    @property
+    def configuration(self) -> Optional[Dict]:
+        return None
+
+    @property
+    def max_batch_size(self) -> int:
+        return 5000
+
+
+def empty_result(n_queries: int) -> Dict:
+    return {"ids": [[] for _ in range(n_queries)], "documents": [[] for _ in range(n_queries)],
+            "metadatas": [[] for _ in range(n_queries)], "distances": [[] for _ in range(n_queries)]}
+
+
+def scoped_query(store: VectorStore, query_embeddings, top_k: int, where: Optional[Dict] = None,
+                 brute_force_max: int = 0) -> Dict:
+    """
+    store.query() with one shortcut: a filtered search over at most `brute_force_max`
+    rows skips the ANN index and scores the in-scope rows exactly.
+    """
+    if where and brute_force_max > 0 and not store.exact:
+        with span("collection.get"):
+            scoped = store.get(where=where, include=[], limit=brute_force_max + 1)
+        ids = scoped.get("ids") or []
+        if len(ids) <= brute_force_max:
+            return _exact_query(store, query_embeddings, ids, top_k)
+
+    with span("collection.query"):
+        return store.query(query_embeddings=query_embeddings, n_results=top_k, where=where)
+
+
+def _exact_query(store: VectorStore, query_embeddings, ids: List[str], top_k: int) -> Dict:
+    if not ids:
+        return empty_result(len(query_embeddings))
+
+    with span("collection.get"):
+        data = store.get(ids=ids, include=["embeddings"])
+    with span("exact_search"):
+        idx, dist = cosine_top_k(query_embeddings, data["embeddings"], top_k)
+    # Documents and metadata only for the winners: for a few thousand candidates they
+    # cost as much to fetch as the embeddings.
+    winners = sorted({data["ids"][j] for row in idx for j in row})
+    with span("collection.get"):
+        rows = store.get(ids=winners, include=["documents", "metadatas"])
+    by_id = {id_: (doc, meta) for id_, doc, meta in zip(rows["ids"], rows["documents"], rows["metadatas"])}
+    ranked = [[data["ids"][j] for j in row] for row in idx]
+    return {
+        "ids": ranked,
+        "documents": [[by_id[i][0] for i in row] for row in ranked],
+        "metadatas": [[by_id[i][1] for i in row] for row in ranked],
+        "distances": [[float(d) for d in row] for row in dist],
+    }
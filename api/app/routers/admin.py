@@ -1,20 +1,320 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, JSONResponse, PlainTextResponse
 from api.app import deps
+from api.app.config import settings
+from api.app.services.hnsw_tuner import current_hnsw
+from api.app.utils import auth, profiler
+from api.app.utils.metrics import counters
 
 router = APIRouter()
 
+# Admin endpoints that change the index; rejected on read-only replicas.
+WRITER_ADMIN = [Depends(auth.require_admin), Depends(deps.require_writer)]
+
 class ReindexRequest(BaseModel):
     force_index: bool = False
 
+class HnswRequest(BaseModel):
+    m: Optional[int] = Field(None, ge=2, le=128)
+    construction_ef: Optional[int] = Field(None, ge=4, le=4096)
+    search_ef: Optional[int] = Field(None, ge=1, le=4096)
+
+class HnswTuneRequest(BaseModel):
+    sample_queries: int = Field(200, ge=10, le=5000)
+    k: int = Field(10, ge=1, le=100)
+    target_recall: float = Field(0.95, gt=0, le=1)
+    m_values: List[int] = [8, 16, 32]
+    construction_ef_values: List[int] = [100, 200]
+    search_ef_values: List[int] = [20, 50, 100, 200]
+    max_vectors: int = Field(50000, ge=100)
+
+class VectorStoreBenchmarkRequest(BaseModel):
+    sample_queries: int = Field(200, ge=10, le=5000)
+    k: int = Field(10, ge=1, le=100)
+    max_vectors: int = Field(50000, ge=100)
+
+class RetrievalBenchmarkRequest(BaseModel):
+    sample_queries: int = Field(100, ge=10, le=5000)
+    k: int = Field(10, ge=1, le=100)
+    doc_top_n_values: List[int] = [4, 8, 16]
+    scales: List[float] = [0.25, 0.5, 1.0]
+    max_vectors: int = Field(50000, ge=100)
+
+class ReductionRequest(BaseModel):
+    method: Literal["none", "truncate", "pca"]
+    dim: Optional[int] = Field(None, ge=8, le=8192)
+    fit_vectors: int = Field(20000, ge=100)
+
+class ReductionBenchmarkRequest(BaseModel):
+    dims: List[int] = [64, 128, 256, 512]
+    methods: List[Literal["truncate", "pca"]] = ["truncate", "pca"]
+    sample_queries: int = Field(200, ge=10, le=5000)
+    k: int = Field(10, ge=1, le=100)
+    max_vectors: int = Field(50000, ge=100)
+
+class ShardReindexRequest(BaseModel):
+    reembed: bool = False
+
+class PublishRequest(BaseModel):
+    force: bool = False
+
+class SnapshotImportRequest(BaseModel):
+    name: str
+    replace: bool = False
+    adopt_model: bool = True
+
 @router.get("/healthz")
 def healthz():
-    return {"status": "ok", "heartbeat": deps.client.heartbeat()}
+    body = {"status": "ok", "heartbeat": deps.client.heartbeat(), "config_version": deps.bound_version,
+            "role": settings.NODE_ROLE}
+    if settings.NODE_ROLE == "reader":
+        body["index_version"] = deps.replica.state().get("version")
+        if body["index_version"] is None:
+            body["status"] = "syncing"
+            return JSONResponse(status_code=503, content=body)
+    if settings.MODEL_WARMUP_ENABLED:
+        models = deps.model_warmer.status()
+        body["models"] = models
+        body["models_warm"] = all(m["warm"] for m in models.values())
+        if settings.HEALTHZ_REQUIRE_WARM and not body["models_warm"]:
+            body["status"] = "warming"
+            return JSONResponse(status_code=503, content=body)
+    return body
 
-@router.post("/sync-index")
+@router.post("/sync-index", dependencies=[Depends(deps.require_writer)])
 def sync_index():
     return deps.ingest.sync_index()
 
-@router.post("/reindex-all")
+@router.post("/reindex-all", dependencies=[Depends(deps.require_writer)])
 def reindex_all(req: ReindexRequest):
-    return deps.ingest.reindex_all(force=req.force_index)
\ No newline at end of file
+    return deps.ingest.reindex_all(force=req.force_index)
+
+@router.post("/admin/history/compact", dependencies=[Depends(auth.require_admin)])
+def compact_history():
+    return deps.history_compactor.run_once()
+
+@router.get("/admin/watcher", dependencies=[Depends(auth.require_admin)])
+def watcher_status():
+    return {"enabled": deps.storage_watcher in deps.background_tasks, **deps.storage_watcher.stats()}
+
+@router.get("/metrics")
+def metrics():
+    return PlainTextResponse(counters.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/admin/ollama", dependencies=[Depends(auth.require_admin)])
+def ollama_status():
+    return {"pools": [r.status() for r in deps.ollama_routers]}
+
+@router.get("/admin/hnsw", dependencies=[Depends(auth.require_admin)])
+def get_hnsw():
+    return {"configured": deps.registry.get_hnsw(), "effective": current_hnsw(deps.collection)}
+
+def _import_snapshot(name: str, transform=None):
+    """build_index() filler: loads a snapshot into the new stores."""
+    def fill(collection, document_index):
+        batch_size = min(settings.SNAPSHOT_BATCH_SIZE, collection.max_batch_size)
+        result = deps.snapshots.import_into(deps.snapshots.path_for(name), collection, batch_size=batch_size,
+                                            verify=False, transform=transform)
+        result["document_index"] = document_index.rebuild(collection, page_size=settings.SNAPSHOT_BATCH_SIZE)
+        return result
+    return fill
+
+@router.post("/admin/hnsw", dependencies=WRITER_ADMIN)
+def set_hnsw(req: HnswRequest):
+    current = deps.registry.get_hnsw()
+    changes = {k: v for k, v in req.model_dump().items() if v is not None and v != current[k]}
+    if not changes:
+        return {"changed": False, "configured": current, "effective": current_hnsw(deps.collection)}
+
+    # HNSW parameters are fixed once an index is loaded (Chroma does not apply a modified
+    # search_ef to an open index): round-trip the stored vectors through a snapshot into
+    # a new index generation instead of re-embedding the corpus. The live index keeps
+    # serving until the new one is complete.
+    snapshot = deps.snapshots.export(deps.collection, texts=False)
+    try:
+        generation, new_collection, new_document_index, _ = deps.build_index(
+            _import_snapshot(snapshot["name"]), hnsw={**current, **changes})
+    finally:
+        deps.snapshots.delete(snapshot["name"])
+    deps.swap_index(generation, new_collection, new_document_index,
+                    **{f"hnsw_{k}": v for k, v in changes.items()})
+    return {"changed": True, "configured": deps.registry.get_hnsw(), "effective": current_hnsw(deps.collection)}
+
+@router.post("/admin/hnsw/tune", dependencies=[Depends(auth.require_admin)])
+def tune_hnsw(req: HnswTuneRequest):
+    batch_size = min(settings.SNAPSHOT_BATCH_SIZE, deps.collection.max_batch_size)
+    report = deps.hnsw_tuner.run(deps.collection, batch_size=batch_size, **req.model_dump())
+    report["current"] = current_hnsw(deps.collection)
+    return report
+
+@router.post("/admin/vector-store/benchmark", dependencies=[Depends(auth.require_admin)])
+def benchmark_vector_store(req: VectorStoreBenchmarkRequest):
+    # The Chroma max batch size also bounds the throw-away Chroma collection here.
+    batch_size = min(settings.SNAPSHOT_BATCH_SIZE, deps.client.get_max_batch_size())
+    report = deps.vector_store_benchmark.run(deps.collection, deps.registry.get_hnsw(), batch_size=batch_size,
+                                             **req.model_dump())
+    report["active"] = settings.VECTOR_STORE
+    return report
+
+@router.get("/admin/document-index", dependencies=[Depends(auth.require_admin)])
+def document_index_status():
+    return {"files": deps.document_index.count(), "default_two_stage": settings.TWO_STAGE_RETRIEVAL,
+            "default_doc_top_n": settings.DOC_TOP_N}
+
+@router.post("/admin/document-index/rebuild", dependencies=WRITER_ADMIN)
+def rebuild_document_index():
+    return deps.document_index.rebuild(deps.collection, page_size=settings.SNAPSHOT_BATCH_SIZE)
+
+@router.get("/admin/dedup", dependencies=[Depends(auth.require_admin)])
+def dedup_status():
+    return {"enabled": settings.CHUNK_DEDUP, **deps.chunk_dedup.stats()}
+
+@router.post("/admin/retrieval/benchmark", dependencies=[Depends(auth.require_admin)])
+def benchmark_retrieval(req: RetrievalBenchmarkRequest):
+    batch_size = min(settings.SNAPSHOT_BATCH_SIZE, deps.client.get_max_batch_size())
+    return deps.retrieval_benchmark.run(deps.collection, settings.VECTOR_STORE, deps.registry.get_hnsw(),
+                                        batch_size=batch_size, brute_force_max=settings.SCOPE_BRUTE_FORCE_MAX,
+                                        **req.model_dump())
+
+@router.get("/admin/embedding-reduction", dependencies=[Depends(auth.require_admin)])
+def embedding_reduction_status():
+    return deps.embedding_reduction.status(deps.collection)
+
+@router.post("/admin/embedding-reduction", dependencies=WRITER_ADMIN)
+def set_embedding_reduction(req: ReductionRequest):
+    if req.method != "none" and not req.dim:
+        raise HTTPException(status_code=400, detail="dim is required")
+    current = deps.embedder.reduction()
+    spec = deps.embedding_reduction.plan(deps.collection, req.method, req.dim, fit_vectors=req.fit_vectors)
+    if spec == current:
+        return {"changed": False, **deps.embedding_reduction.status(deps.collection)}
+
+    # The new index is built next to the live one, which keeps serving in the current
+    # space until the swap switches the registry to the new reduction.
+    if current is None:
+        # The stored vectors are full-size: project them into the reduced space through
+        # a snapshot round-trip instead of re-embedding the corpus.
+        snapshot = deps.snapshots.export(deps.collection, texts=False)
+        try:
+            generation, new_collection, new_document_index, _ = deps.build_index(
+                _import_snapshot(snapshot["name"], transform=deps.embedding_reduction.transform(spec)))
+        finally:
+            deps.snapshots.delete(snapshot["name"])
+        out = {"changed": True, "reembedded": False}
+    else:
+        # Reduced vectors can't be mapped to another space: re-embed the files with the
+        # new reduction pinned, as the registry still holds the current one.
+        def reembed(collection, document_index):
+            return deps.make_ingest(collection, document_index, deps.embedder.pinned(spec)).reindex_all(force=True)
+
+        generation, new_collection, new_document_index, result = deps.build_index(reembed)
+        out = {"changed": True, "reembedded": True, "indexed": result["indexed"]}
+    deps.swap_index(generation, new_collection, new_document_index, embedding_reduction=spec)
+    return {**out, **deps.embedding_reduction.status(deps.collection)}
+
+@router.post("/admin/embedding-reduction/benchmark", dependencies=[Depends(auth.require_admin)])
+def benchmark_embedding_reduction(req: ReductionBenchmarkRequest):
+    return deps.embedding_reduction.benchmark(deps.collection, hnsw_m=deps.registry.get_hnsw()["m"],
+                                              **req.model_dump())
+
+@router.get("/admin/shards", dependencies=[Depends(auth.require_admin)])
+def shard_status():
+    return deps.shard_service.status(deps.collection)
+
+@router.post("/admin/shards/rebalance", dependencies=WRITER_ADMIN)
+def rebalance_shards():
+    return deps.shard_service.rebalance(deps.collection, batch_size=min(1000, deps.collection.max_batch_size))
+
+@router.post("/admin/shards/{name}/reindex", dependencies=WRITER_ADMIN)
+def reindex_shard(name: str, req: ShardReindexRequest):
+    return deps.shard_service.reindex(deps.collection, name, deps.ingest, reembed=req.reembed)
+
+@router.get("/admin/replication", dependencies=[Depends(auth.require_admin)])
+def replication_status():
+    body = {"role": settings.NODE_ROLE, "published": deps.publisher.status()}
+    if settings.NODE_ROLE == "reader":
+        body["replica"] = deps.replica.status()
+    return body
+
+@router.post("/admin/replication/publish", dependencies=WRITER_ADMIN)
+def publish_index(req: PublishRequest):
+    return deps.publisher.publish(force=req.force)
+
+@router.get("/admin/snapshots", dependencies=[Depends(auth.require_admin)])
+def list_snapshots():
+    return {"snapshots": deps.snapshots.list()}
+
+@router.post("/admin/snapshots/export", dependencies=[Depends(auth.require_admin)])
+def export_snapshot(dtype: str = Query("float32", pattern="^(float32|float16)$")):
+    return deps.snapshots.export(deps.collection, dtype=dtype)
+
+@router.get("/admin/snapshots/{name}", dependencies=[Depends(auth.require_admin)])
+def download_snapshot(name: str):
+    return FileResponse(deps.snapshots.path_for(name), filename=name, media_type="application/zip")
+
+@router.post("/admin/snapshots/upload", dependencies=[Depends(auth.require_admin)])
+async def upload_snapshot(file: UploadFile = File(...)):
+    path = await run_in_threadpool(deps.snapshots.save_upload, file.filename, file.file)
+    return {"name": path.name, **deps.snapshots.read_manifest(path)}
+
+@router.post("/admin/snapshots/{name}/verify", dependencies=[Depends(auth.require_admin)])
+def verify_snapshot(name: str):
+    return deps.snapshots.verify(deps.snapshots.path_for(name))
+
+@router.post("/admin/snapshots/import", dependencies=WRITER_ADMIN)
+def import_snapshot(req: SnapshotImportRequest):
+    path = deps.snapshots.path_for(req.name)
+    check = deps.snapshots.verify(path)
+    if not check["ok"]:
+        raise HTTPException(status_code=422, detail={"error": "Snapshot failed verification", **check})
+    manifest = check["manifest"]
+    model = manifest["embedding_model"]
+    switch_model = model != deps.registry.get_embedding_model()
+    if switch_model and not req.adopt_model:
+        raise HTTPException(status_code=409, detail=f"Snapshot was built with embedding model {model}")
+    switch_reduction = manifest.get("embedding_reduction") != deps.registry.get_embedding_reduction()
+    if switch_reduction and not req.adopt_model:
+        raise HTTPException(status_code=409, detail="Snapshot was built with another embedding reduction")
+
+    if switch_model or switch_reduction or req.replace:
+        # Import into a new index generation; the live one keeps serving until the
+        # swap, which also switches the registry to the snapshot's model and reduction.
+        changes = {}
+        if switch_model:
+            changes["embedding_model"] = model
+            if manifest.get("embedding_model_max_tokens"):
+                changes["embedding_model_max_tokens"] = manifest["embedding_model_max_tokens"]
+        if switch_reduction:
+            changes["embedding_reduction"] = deps.snapshots.install_projection(path)
+        generation, new_collection, new_document_index, result = deps.build_index(_import_snapshot(req.name))
+        deps.swap_index(generation, new_collection, new_document_index, **changes)
+        if switch_model and settings.MODEL_WARMUP_ENABLED:
+            deps.model_warmer.warm_async("embedding")
+        return result
+
+    batch_size = min(settings.SNAPSHOT_BATCH_SIZE, deps.collection.max_batch_size)
+    result = deps.snapshots.import_into(path, deps.collection, batch_size=batch_size, verify=False)
+    result["document_index"] = deps.document_index.rebuild(deps.collection, page_size=settings.SNAPSHOT_BATCH_SIZE)
+    return result
+
+@router.get("/admin/profiles", dependencies=[Depends(auth.require_admin)])
+def list_profiles(limit: int = Query(50, ge=1, le=1000)):
+    return {"profiles": profiler.store.list(limit=limit)}
+
+@router.get("/admin/profiles/{profile_id}", dependencies=[Depends(auth.require_admin)])
+def get_profile(profile_id: str):
+    item = profiler.store.get(profile_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return item
+
+@router.get("/admin/profiles/{profile_id}/flamegraph", dependencies=[Depends(auth.require_admin)])
+def get_profile_flamegraph(profile_id: str):
+    folded = profiler.store.get_flamegraph(profile_id)
+    if folded is None:
+        raise HTTPException(status_code=404, detail="No flamegraph captured for this profile")
+    return PlainTextResponse(folded)
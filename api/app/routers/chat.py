@@ -1,42 +1,212 @@
+import asyncio
 import json
+import threading
+import time
+from typing import Optional
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 from starlette.responses import StreamingResponse
 
 from api.app.config import settings
 from api.app.deps import rag
-from api.app.schemas.chat import ChatRequest, ChatResponse
+from api.app.schemas.chat import ChatBatchRequest, ChatRequest, ChatResponse, RetrievalScope
+from api.app.services.rag_service import GenerationCancelled
+from api.app.utils import profiler
+from api.app.utils.metrics import counters
+from api.app.utils.profiler import Profile
+from api.app.utils.scope import build_where
 
 router = APIRouter()
 
+DISCONNECT_POLL_SECONDS = 0.25
+
+
+def _retrieval(req: RetrievalScope):
+    return dict(
+        mode=req.mode or settings.CHAT_MODE,
+        where=build_where(files=req.files, tags=req.tags, mtime_from=req.mtime_from, mtime_to=req.mtime_to),
+        two_stage=settings.TWO_STAGE_RETRIEVAL if req.two_stage is None else req.two_stage,
+        doc_top_n=req.doc_top_n or settings.DOC_TOP_N,
+        window_chars=settings.CONTEXT_WINDOW_CHARS if req.window_chars is None else req.window_chars,
+        window_chunks=settings.CONTEXT_WINDOW_CHUNKS if req.window_chunks is None else req.window_chunks,
+    )
+
+
+def _count(endpoint: str, outcome: str):
+    counters.inc("chat_generations_total", endpoint=endpoint, outcome=outcome)
+
+
+async def _supervise(request: Request, cancel: threading.Event, done: Optional[asyncio.Future] = None,
+                     timeout: float = 0) -> Optional[str]:
+    """
+    Watches the client connection (and `timeout`, if positive) until `done` finishes or
+    `cancel` is set elsewhere. When the generation has to be abandoned, sets `cancel`
+    and returns the reason: "disconnect" or "timeout".
+    """
+    deadline = time.monotonic() + timeout if timeout > 0 else None
+    while not cancel.is_set():
+        if done is not None:
+            await asyncio.wait({done}, timeout=DISCONNECT_POLL_SECONDS)
+            if done.done():
+                return None
+        else:
+            await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+        if await request.is_disconnected():
+            cancel.set()
+            return "disconnect"
+        if deadline is not None and time.monotonic() >= deadline:
+            cancel.set()
+            return "timeout"
+    return None
+
+
+def _stop_reason(supervisor: asyncio.Future) -> str:
+    if supervisor.done() and not supervisor.cancelled() and supervisor.result():
+        return supervisor.result()
+    # The server cancelled the response task itself, which only happens on disconnect.
+    return "disconnect"
+
 
 @router.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest):
-    return rag.answer(
+async def chat(req: ChatRequest, request: Request, response: Response,
+               prof: Optional[Profile] = Depends(profiler.profile_request)):
+    cancel = threading.Event()
+    kwargs = dict(
         user_id=req.user_id,
         query=req.message,
         top_k=req.top_k or settings.TOP_K,
         lang=req.lang or settings.DEFAULT_LANG,
+        **_retrieval(req),
+        cancel=cancel,
+        deadline_ms=req.deadline_ms,
     )
+    if prof is None:
+        task = asyncio.ensure_future(run_in_threadpool(rag.answer, **kwargs))
+    else:
+        task = asyncio.ensure_future(run_in_threadpool(prof.run, rag.answer, **kwargs))
+
+    try:
+        reason = await _supervise(request, cancel, task, timeout=settings.CHAT_TIMEOUT_SECONDS)
+        if reason is None:
+            try:
+                result = task.result()
+            except GenerationCancelled:
+                reason = "disconnect"
+            except Exception:
+                _count("chat", "error")
+                raise
+            else:
+                _count("chat", "completed")
+                return result
+        # The worker thread notices `cancel` at the next token and closes the Ollama stream.
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        _count("chat", reason)
+        # Error responses replace the injected `response`, so they carry the profile id themselves.
+        headers = {"X-Profile-Id": prof.id} if prof is not None else None
+        if reason == "timeout":
+            raise HTTPException(status_code=504, detail="Generation timed out", headers=headers)
+        return Response(status_code=499, headers=headers)
+    finally:
+        if prof is not None:
+            profiler.store.save(prof)
+            response.headers["X-Profile-Id"] = prof.id
 
 
 @router.post("/chat/stream")
-def chat_stream(req: ChatRequest, format_type: str = "json"):
-    def generate_text():
-        for chunk in rag.stream_answer(
-                user_id=req.user_id,
-                query=req.message,
-                top_k=req.top_k or settings.TOP_K,
-                lang=req.lang or settings.DEFAULT_LANG
-        ):
-            text = chunk.get("content", "")
-            if format_type == "json":
-                yield json.dumps(chunk) + "\n"
-            else:
-                yield text
+async def chat_stream(req: ChatRequest, request: Request, format_type: str = "json",
+                      prof: Optional[Profile] = Depends(profiler.profile_request)):
+    async def generate_text():
+        cancel = threading.Event()
+        supervisor = asyncio.ensure_future(_supervise(request, cancel, timeout=settings.CHAT_TIMEOUT_SECONDS))
+        chunks = rag.stream_answer(
+            user_id=req.user_id,
+            query=req.message,
+            top_k=req.top_k or settings.TOP_K,
+            lang=req.lang or settings.DEFAULT_LANG,
+            **_retrieval(req),
+            cancel=cancel,
+            deadline_ms=req.deadline_ms,
+        )
+        if prof is not None:
+            chunks = prof.iterate(chunks)
+        outcome = None
+        try:
+            async for chunk in iterate_in_threadpool(chunks):
+                if chunk.get("type") == "final":
+                    outcome = "completed"
+                text = chunk.get("content", "")
+                if format_type == "json":
+                    yield json.dumps(chunk) + "\n"
+                else:
+                    yield text
+            if outcome is None:
+                outcome = _stop_reason(supervisor)
+                if outcome == "timeout" and format_type == "json":
+                    yield json.dumps({"type": "error", "content": "Generation timed out"}) + "\n"
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            # Also reached when the server drops the response on disconnect: make the
+            # worker thread stop pulling tokens and close the upstream stream.
+            cancel.set()
+            supervisor.cancel()
+            _count("chat_stream", outcome or _stop_reason(supervisor))
+            if prof is not None:
+                profiler.store.save(prof)
 
+    headers = {"X-Accel-Buffering": "no"}
+    if prof is not None:
+        headers["X-Profile-Id"] = prof.id
     return StreamingResponse(
         generate_text(),
         media_type="text/plain" if format_type == "text" else "application/json",
-        headers={"X-Accel-Buffering": "no"}
+        headers=headers
     )
+
+
+@router.post("/chat/batch")
+async def chat_batch(req: ChatBatchRequest, request: Request,
+                     prof: Optional[Profile] = Depends(profiler.profile_request)):
+    if not req.messages:
+        raise HTTPException(status_code=400, detail="No messages provided")
+    if len(req.messages) > settings.BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"Too many messages (max {settings.BATCH_MAX_QUESTIONS})")
+
+    concurrency = min(req.concurrency or settings.BATCH_CONCURRENCY, settings.BATCH_CONCURRENCY)
+
+    async def generate_lines():
+        cancel = threading.Event()
+        supervisor = asyncio.ensure_future(_supervise(request, cancel))
+        results = rag.answer_batch(
+            user_id=req.user_id,
+            queries=req.messages,
+            top_k=req.top_k or settings.TOP_K,
+            lang=req.lang or settings.DEFAULT_LANG,
+            concurrency=concurrency,
+            save_history=req.save_history,
+            **_retrieval(req),
+            cancel=cancel,
+        )
+        if prof is not None:
+            results = prof.iterate(results)
+        outcome = None
+        try:
+            async for item in iterate_in_threadpool(results):
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+            outcome = "completed" if not cancel.is_set() else _stop_reason(supervisor)
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            cancel.set()
+            supervisor.cancel()
+            _count("chat_batch", outcome or _stop_reason(supervisor))
+            if prof is not None:
+                profiler.store.save(prof)
+
+    headers = {"X-Accel-Buffering": "no"}
+    if prof is not None:
+        headers["X-Profile-Id"] = prof.id
+    return StreamingResponse(generate_lines(), media_type="application/x-ndjson", headers=headers)
@@ -1,22 +1,15 @@
 import os
 from typing import Optional
 
-from fastapi import APIRouter, File, HTTPException, Query, UploadFile
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile
 from starlette.responses import FileResponse
 
+from api.app import deps
 from api.app.config import settings
-from api.app.deps import collection, ingest, ollama
-from api.app.services.catalog_service import CatalogService
+from api.app.utils.scope import normalize_tags
 
 router = APIRouter()
 
-catalog = CatalogService(
-    collection=collection,
-    storage_dir=settings.STORAGE_DIR,
-    ollama=ollama,
-    default_lang=settings.DEFAULT_LANG,
-)
-
 
 @router.get("/files")
 def list_files(
@@ -24,25 +17,25 @@ def list_files(
         summarize: bool = Query(False),
         lang: Optional[str] = Query(None),
 ):
-    return {"files": catalog.list_files(limit=limit, summarize=summarize, lang=lang)}
+    return {"files": deps.catalog.list_files(limit=limit, summarize=summarize, lang=lang)}
 
 
 @router.get("/files/{filename}")
 def get_file(filename: str, summarize: bool = False, lang: Optional[str] = None):
-    item = catalog.get_file(filename, summarize=summarize, lang=lang)
+    item = deps.catalog.get_file(filename, summarize=summarize, lang=lang)
     if not item:
         raise HTTPException(status_code=404, detail="File not found in index")
     return item
 
 
-@router.put("/files/{filename}")
-async def update_file(filename: str, file: UploadFile = File(...)):
-    return ingest.update_file_from_upload(filename, file)
+@router.put("/files/{filename}", dependencies=[Depends(deps.require_writer)])
+async def update_file(filename: str, file: UploadFile = File(...), tags: Optional[str] = Form(None)):
+    return deps.ingest.update_file_from_upload(filename, file, tags=normalize_tags(tags) if tags is not None else None)
 
 
-@router.delete("/files/{filename}")
+@router.delete("/files/{filename}", dependencies=[Depends(deps.require_writer)])
 def delete_file(filename: str):
-    return ingest.delete_file_and_index(filename)
+    return deps.ingest.delete_file_and_index(filename)
 
 
 @router.get("/files/download/{file_name}")
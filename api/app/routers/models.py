@@ -1,9 +1,8 @@
 import re
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from api.app import deps
 from api.app.config import settings
-from api.app.services.ingest_service import IngestService
 from api.app.utils.logger import setup_logger
 
 logger = setup_logger()
@@ -27,12 +26,7 @@ class SelectEmbeddingRequest(BaseModel):
 
 
 def get_installed_model_names() -> list[str]:
-    try:
-        models = deps.ollama.list().get("models", [])
-        return [m.model for m in models if hasattr(m, "model")]
-    except Exception as e:
-        logger.error(f"Failed to list installed models: {e}")
-        return []
+    return deps.model_catalog.installed_names()
 
 
 def extract_context_length(info: any, default: int) -> int:
@@ -52,8 +46,8 @@ def extract_context_length(info: any, default: int) -> int:
 
 
 @router.get("/models/installed")
-def list_installed_models():
-    res = deps.ollama.list()
+def list_installed_models(refresh: bool = False):
+    res = deps.model_catalog.list(refresh=refresh)
     return {
         "installed": res.get("models", []),
         "current": {
@@ -70,6 +64,7 @@ def pull_model(req: PullRequest):
     try:
         for _ in deps.ollama.pull(model=req.name, stream=True):
             pass
+        deps.model_catalog.invalidate()
         return {"pulled": req.name}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Pull failed: {e}")
@@ -78,6 +73,7 @@ def pull_model(req: PullRequest):
 @router.get("/models/current")
 def current_models():
     return {
+        "config_version": deps.registry.get_version(),
         "chat_model": deps.registry.get_chat_model(),
         "chat_model_max_tokens": deps.registry.get_chat_model_max_tokens(),
         "embedding_model": deps.registry.get_embedding_model(),
@@ -93,7 +89,7 @@ def select_chat_model(req: SelectChatRequest):
     max_tokens = req.max_tokens
     if max_tokens is None:
         try:
-            info = deps.ollama.show(req.model)
+            info = deps.model_catalog.show(req.model)
             max_tokens = extract_context_length(info, default=4096)
             logger.info(f"Model {req.model}: context_length = {max_tokens}")
         except Exception as e:
@@ -104,7 +100,8 @@ def select_chat_model(req: SelectChatRequest):
         raise HTTPException(status_code=400, detail="Invalid max_tokens value")
 
     deps.registry.set_chat_model(req.model, max_tokens=max_tokens)
-    deps.rag.max_context_tokens = max_tokens
+    if settings.MODEL_WARMUP_ENABLED:
+        deps.model_warmer.warm_async("chat")
 
     return {
         "chat_model": deps.registry.get_chat_model(),
@@ -112,7 +109,7 @@ def select_chat_model(req: SelectChatRequest):
     }
 
 
-@router.post("/models/select/embedding")
+@router.post("/models/select/embedding", dependencies=[Depends(deps.require_writer)])
 def select_embedding_model(req: SelectEmbeddingRequest):
     if req.model not in get_installed_model_names():
         raise HTTPException(status_code=400,
@@ -121,7 +118,7 @@ def select_embedding_model(req: SelectEmbeddingRequest):
     max_tokens = req.max_tokens
     if max_tokens is None:
         try:
-            info = deps.ollama.show(req.model)
+            info = deps.model_catalog.show(req.model)
             max_tokens = extract_context_length(info, default=1024)
             logger.info(f"Embedding model {req.model}: context_length = {max_tokens}")
         except Exception as e:
@@ -131,29 +128,23 @@ def select_embedding_model(req: SelectEmbeddingRequest):
     if max_tokens < 512 or max_tokens > 131072:
         raise HTTPException(status_code=400, detail="Invalid max_tokens value")
 
-    deps.registry.set_embedding_model(req.model, max_tokens=max_tokens)
-
-    new_collection = deps.rebuild_collection_with_embedding(req.model)
-
-    deps.collection = new_collection
-    deps.ingest = IngestService(
-        storage_dir=settings.STORAGE_DIR,
-        collection=new_collection,
-        chunk_size=settings.CHUNK_SIZE,
-        chunk_overlap=settings.CHUNK_OVERLAP,
-    )
-    deps.rag.collection = new_collection
-    out = {
+    # Build the new model's index next to the live one (re-embedding the files with the
+    # new model pinned), then swap: the registry switches, and other workers re-bind,
+    # only once it is complete.
+    def fill(collection, document_index):
+        if not req.reindex:
+            return {"indexed": []}
+        embedding = deps.embedder.pinned(deps.registry.get_embedding_reduction(), model=req.model)
+        return deps.make_ingest(collection, document_index, embedding).reindex_all(force=req.force_reindex)
+
+    generation, new_collection, new_document_index, result = deps.build_index(fill)
+    deps.swap_index(generation, new_collection, new_document_index,
+                    embedding_model=req.model, embedding_model_max_tokens=max_tokens)
+    if settings.MODEL_WARMUP_ENABLED:
+        deps.model_warmer.warm_async("embedding")
+    return {
+        **result,
         "embedding_model": deps.registry.get_embedding_model(),
         "embedding_model_max_tokens": deps.registry.get_embedding_model_max_tokens(),
-        "reindexed": False,
-        "indexed": []
+        "reindexed": req.reindex,
     }
-
-    if req.reindex:
-        out = deps.ingest.reindex_all(force=req.force_reindex)
-        out["embedding_model"] = deps.registry.get_embedding_model()
-        out["embedding_model_max_tokens"] = deps.registry.get_embedding_model_max_tokens()
-        out["reindexed"] = True
-
-    return out
@@ -1,23 +1,25 @@
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, File, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
 
+from api.app import deps
 from api.app.config import settings
-from api.app.deps import ingest
+from api.app.services.ingest_service import SUPPORTED_EXTENSIONS
+from api.app.utils.scope import normalize_tags
 
 router = APIRouter()
 
 
-@router.post("/upload")
-async def upload(files: List[UploadFile] = File(...)):
+@router.post("/upload", dependencies=[Depends(deps.require_writer)])
+async def upload(files: List[UploadFile] = File(...), tags: Optional[str] = Form(None)):
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
 
     results = []
     for uf in files:
         ext = Path(uf.filename).suffix.lower()
-        if ext not in {".txt", ".pdf", ".docx", ".doc"}:
+        if ext not in SUPPORTED_EXTENSIONS:
             raise HTTPException(status_code=415, detail=f"Unsupported: {uf.filename}")
 
         dest = settings.STORAGE_DIR / uf.filename
@@ -28,7 +30,7 @@ async def upload(files: List[UploadFile] = File(...)):
                     break
                 out.write(chunk)
 
-        r = ingest.upsert_file(dest)
+        r = deps.ingest.upsert_file(dest, tags=normalize_tags(tags) if tags is not None else None)
         results.append({"file": uf.filename, **r})
 
     return {"ok": True, "results": results}
@@ -1,12 +1,42 @@
-from typing import Optional, List, Dict
-from pydantic import BaseModel
+from typing import Optional, List, Dict, Literal
+from pydantic import BaseModel, Field
 
-class ChatRequest(BaseModel):
+class RetrievalScope(BaseModel):
+    files: Optional[List[str]] = None
+    tags: Optional[List[str]] = None
+    mtime_from: Optional[int] = None
+    mtime_to: Optional[int] = None
+    # Document-then-chunk retrieval; None uses the server defaults.
+    two_stage: Optional[bool] = None
+    doc_top_n: Optional[int] = Field(None, ge=1, le=1000)
+    # Widen each retrieved chunk with this much surrounding text of its file; None uses the server defaults.
+    window_chars: Optional[int] = Field(None, ge=0, le=20000)
+    window_chunks: Optional[int] = Field(None, ge=0, le=10)
+
+class ChatRequest(RetrievalScope):
     user_id: str
     message: str
     top_k: Optional[int] = None
     lang: Optional[str] = None
+    # "extractive" returns the best passages with highlighted sentences, without the chat model.
+    mode: Optional[Literal["generate", "extractive"]] = None
+    # Latency budget for the whole pipeline; stages degrade to meet it.
+    deadline_ms: Optional[int] = Field(None, ge=1)
 
 class ChatResponse(BaseModel):
     answer: str
     citations: List[Dict]
+    mode: str = "generate"
+    # Why the chat model was skipped: "extractive", "no_context" or "low_confidence".
+    reason: Optional[str] = None
+    # Only with deadline_ms: {"deadline_ms", "elapsed_ms", "timings", "degradations"}.
+    budget: Optional[Dict] = None
+
+class ChatBatchRequest(RetrievalScope):
+    user_id: str
+    messages: List[str]
+    top_k: Optional[int] = None
+    lang: Optional[str] = None
+    concurrency: Optional[int] = None
+    mode: Optional[Literal["generate", "extractive"]] = None
+    save_history: bool = False
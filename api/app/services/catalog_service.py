@@ -2,11 +2,13 @@ from collections import defaultdict
 from pathlib import Path
 from typing import Dict, List, Optional
 
-from api.app.deps import registry
+from api.app import deps
+from api.app.repositories.vector_store import VectorStore
+from api.app.utils.scope import normalize_tags
 
 
 class CatalogService:
-    def __init__(self, collection, storage_dir: Path, ollama=None, default_lang: str = "uk"):
+    def __init__(self, collection: VectorStore, storage_dir: Path, ollama=None, default_lang: str = "uk"):
         self.collection = collection
         self.storage_dir = storage_dir
         self.ollama = ollama
@@ -34,7 +36,7 @@ class CatalogService:
             else "Summarize in 1–2 sentences (brief, informative):"
         )
         res = self.ollama.chat(
-            model=registry.get_chat_model(),
+            model=deps.registry.get_chat_model(),
             messages=[{"role": "user", "content": prompt + text[:1200]}],
             options={"temperature": 0.2},
         )
@@ -45,7 +47,7 @@ class CatalogService:
         metas = data.get("metadatas", [])
         docs = data.get("documents", [])
 
-        group = defaultdict(lambda: {"docs": {}, "count": 0, "mtime": 0, "name": None, "path": None})
+        group = defaultdict(lambda: {"docs": {}, "count": 0, "mtime": 0, "name": None, "path": None, "tags": []})
         for m, d in zip(metas, docs):
             fp = m.get("file_path")
             if not fp:
@@ -60,6 +62,7 @@ class CatalogService:
                 gi["mtime"] = mmt
             gi["name"] = m.get("file_name") or Path(fp).name
             gi["path"] = fp
+            gi["tags"] = normalize_tags(m.get("tags"))
 
         items = []
         for fp, g in group.items():
@@ -81,6 +84,7 @@ class CatalogService:
                 "size_bytes": size,
                 "chunk_count": g["count"],
                 "mtime": g["mtime"],
+                "tags": g["tags"],
                 "description": desc,
             })
 
@@ -100,6 +104,7 @@ class CatalogService:
 
         by_idx = {}
         mtime, path_ = 0, None
+        tags = normalize_tags(metas[0].get("tags"))
         for m, d in zip(metas, docs):
             ci = m.get("chunk_index", 0)
             if ci not in by_idx:
@@ -121,5 +126,6 @@ class CatalogService:
             "size_bytes": size,
             "chunk_count": len(by_idx),
             "mtime": mtime,
+            "tags": tags,
             "description": desc,
         }
@@ -0,0 +1,211 @@
+import json
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from api.app.repositories.dedup_repo import ChunkDedupRepo
+from api.app.utils.logger import setup_logger
+from api.app.utils.minhash import MinHasher, similarity
+from api.app.utils.scope import matches_where
+from api.app.utils.vectors import cosine_top_k
+
+
+def also_in(meta: Optional[Dict]) -> List[Tuple[str, int]]:
+    """(file_path, chunk_index) of the near-duplicate copies a stored chunk stands for."""
+    raw = (meta or {}).get("also_in")
+    if not raw:
+        return []
+    try:
+        return [(p, i) for p, i in json.loads(raw)]
+    except (ValueError, TypeError):
+        return []
+
+
+def expand_sources(meta: Optional[Dict]) -> List[Dict]:
+    return [{"file": Path(p).name, "path": p, "chunk": i} for p, i in also_in(meta)]
+
+
+def _pinned_files(where: Dict) -> Tuple[Optional[str], Optional[List[str]]]:
+    """(key, values) when `where` only admits files with file_path/file_name in values, else (None, None)."""
+    clauses = where.get("$and", []) if set(where) == {"$and"} else [{k: v} for k, v in where.items()]
+    for clause in clauses:
+        if len(clause) != 1:
+            continue
+        (key, cond), = clause.items()
+        if key in ("file_path", "file_name"):
+            if isinstance(cond, dict) and set(cond) == {"$in"}:
+                return key, list(cond["$in"])
+            if isinstance(cond, dict) and set(cond) == {"$eq"}:
+                return key, [cond["$eq"]]
+            if isinstance(cond, str):
+                return key, [cond]
+    return None, None
+
+
+class ChunkDeduplicator:
+    """
+    Near-duplicate chunk detection at ingest (MinHash over word shingles + LSH buckets).
+    The first copy of a chunk is embedded and stored as usual. Later copies whose
+    estimated Jaccard similarity reaches `threshold` are neither embedded nor stored;
+    they are kept as references to the stored chunk, whose `also_in` metadata (JSON
+    [[file_path, chunk_index], ...]) lets retrieval expand it back to every source file.
+    When the file owning a stored chunk goes away, a referencing file inherits it.
+    """
+
+    def __init__(self, repo: ChunkDedupRepo, hasher: MinHasher, threshold: float = 0.9):
+        self.repo = repo
+        self.hasher = hasher
+        self.threshold = threshold
+        self.logger = setup_logger()
+        self._lock = threading.RLock()
+
+    def match(self, collection, ids: List[str], chunks: List[str]) -> Tuple[List[np.ndarray], List[Optional[str]]]:
+        """
+        Signatures of `chunks` and, per chunk, the id of the stored (or earlier in this
+        batch) chunk it duplicates, or None when it has to be stored.
+        """
+        sigs = [self.hasher.signature(c) for c in chunks]
+        keys = [self.hasher.band_keys(s) for s in sigs]
+        canonical: List[Optional[str]] = [None] * len(chunks)
+
+        stored = {}
+        for i, k in enumerate(keys):
+            best = self._best(sigs[i], self.repo.signatures(self.repo.candidates(k)))
+            if best:
+                stored[i] = best
+        if stored:
+            present = set(collection.get(ids=sorted(set(stored.values())), include=[]).get("ids") or [])
+            stale = set(stored.values()) - present
+            if stale:
+                # Left behind by a dropped or rebuilt collection.
+                self.repo.remove(stale)
+            canonical = [stored.get(i) if stored.get(i) in present else None for i in range(len(chunks))]
+
+        local: Dict[Tuple[int, int], List[int]] = {}
+        for i, k in enumerate(keys):
+            if canonical[i] is not None:
+                continue
+            seen = {j for band, key in enumerate(k) for j in local.get((band, key), [])}
+            best = self._best(sigs[i], {ids[j]: sigs[j] for j in seen})
+            if best:
+                canonical[i] = best
+                continue
+            for band, key in enumerate(k):
+                local.setdefault((band, key), []).append(i)
+        return sigs, canonical
+
+    def _best(self, sig: np.ndarray, candidates: Dict[str, np.ndarray]) -> Optional[str]:
+        best, best_sim = None, self.threshold
+        for id_, other in candidates.items():
+            sim = similarity(sig, other)
+            if sim >= best_sim:
+                best, best_sim = id_, sim
+        return best
+
+    def register(self, ids: List[str], sigs: List[np.ndarray]):
+        self.repo.add([(id_, sig, self.hasher.band_keys(sig)) for id_, sig in zip(ids, sigs)])
+
+    def add_refs(self, collection, refs: List[Tuple[str, Dict]]):
+        if not refs:
+            return
+        with self._lock:
+            self.repo.add_refs(refs)
+            self._sync_also_in(collection, {id_ for id_, _ in refs})
+
+    def _sync_also_in(self, collection, ids: Set[str]):
+        ids = sorted(ids)
+        if not ids:
+            return
+        refs = self.repo.refs_for(ids)
+        metas = []
+        for id_ in ids:
+            occurrences = [[r["metadata"].get("file_path"), r["metadata"].get("chunk_index")]
+                           for r in refs.get(id_, [])]
+            metas.append({"also_in": json.dumps(occurrences, ensure_ascii=False) if occurrences else None})
+        collection.update(ids=ids, metadatas=metas)
+
+    def release_file(self, collection, where: Dict):
+        """
+        Removes one file (where={"file_path": ...} or {"file_name": ...}) from the index:
+        drops its references, hands the chunks it owns over to a file that still refers
+        to them, and deletes the rest.
+        """
+        (key, value), = where.items()
+        with self._lock:
+            touched = self.repo.delete_refs(key, value)
+            owned = collection.get(where=where, include=["metadatas"], limit=1_000_000)
+            owned_ids = owned.get("ids") or []
+            refs = self.repo.refs_for(owned_ids)
+            drop, handed, metas = [], [], []
+            for id_, meta in zip(owned_ids, owned.get("metadatas") or []):
+                heirs = refs.get(id_)
+                if not heirs:
+                    drop.append(id_)
+                    continue
+                heir = heirs[0]
+                self.repo.delete_ref(heir["rowid"])
+                new_meta = heir["metadata"]
+                # update() merges metadata: keys only the old owner had are removed explicitly.
+                metas.append({**{k: None for k in meta or {} if k not in new_meta and k != "also_in"}, **new_meta})
+                handed.append(id_)
+            if handed:
+                collection.update(ids=handed, metadatas=metas)
+            if drop:
+                collection.delete(ids=drop)
+                self.repo.remove(drop)
+            self._sync_also_in(collection, (touched | set(handed)) - set(drop))
+        if handed:
+            self.logger.info("Chunk dedup: %d chunks of %s handed over to duplicate files", len(handed), value)
+
+    def scoped_refs(self, where: Dict) -> Dict[str, Dict]:
+        """Stored chunk id -> metadata of an occurrence of it that matches `where`."""
+        key, values = _pinned_files(where)
+        out: Dict[str, Dict] = {}
+        for ref in self.repo.refs_of(key, values):
+            if ref["id"] not in out and matches_where(ref["metadata"], where):
+                out[ref["id"]] = ref["metadata"]
+        return out
+
+    def widen(self, collection, query_embeddings, result: Dict, where: Optional[Dict], top_k: int) -> Dict:
+        """
+        Completes a query result filtered by `where` with the stored chunks standing in for
+        in-scope near-duplicates: the stored copy carries its owner file's metadata, so the
+        filter misses it when only a referencing file is in scope. Such a chunk is reported
+        with the metadata of the matching occurrence, so it is cited from that file.
+        """
+        refs = self.scoped_refs(where) if where else {}
+        if not refs:
+            return result
+        data = collection.get(ids=sorted(refs), include=["embeddings", "documents", "metadatas"])
+        if not data["ids"]:
+            return result
+        idx, dist = cosine_top_k(query_embeddings, data["embeddings"], top_k)
+        out = {k: [] for k in ("ids", "documents", "metadatas", "distances")}
+        for q in range(len(query_embeddings)):
+            rows = list(zip(*(result[k][q] for k in out)))
+            found = {r[0] for r in rows}
+            for j, d in zip(idx[q], dist[q]):
+                id_ = data["ids"][j]
+                if id_ not in found:
+                    meta = {**(data["metadatas"][j] or {}), **refs[id_]}
+                    rows.append((id_, data["documents"][j], meta, float(d)))
+            rows = sorted(rows, key=lambda r: r[3])[:top_k]
+            for i, k in enumerate(out):
+                out[k].append([r[i] for r in rows])
+        return out
+
+    def file_metas(self, file_path: str) -> List[Dict]:
+        """Chunk metadata of a file's occurrences that are stored under another file."""
+        return [r["metadata"] for r in self.repo.file_refs(file_path)]
+
+    def update_file(self, file_path: str, patch: Dict):
+        self.repo.update_file_refs(file_path, patch)
+
+    def ref_files(self) -> Set[str]:
+        return self.repo.ref_files()
+
+    def stats(self) -> Dict:
+        return {"threshold": self.threshold, "num_perm": self.hasher.num_perm, "bands": self.hasher.bands,
+                **self.repo.stats()}
@@ -0,0 +1,47 @@
+import threading
+from typing import Callable
+
+from api.app.services.model_registry import ModelRegistry
+from api.app.utils.logger import setup_logger
+
+
+class ConfigWatcher:
+    """
+    Polls the shared ModelRegistry file and calls on_change() whenever another
+    worker bumped its version, so every process re-binds to the same models
+    and collection.
+    """
+
+    def __init__(self, registry: ModelRegistry, on_change: Callable[[], None], interval: float = 2.0):
+        self.registry = registry
+        self.on_change = on_change
+        self.interval = interval
+        self.logger = setup_logger()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+
+    def check(self) -> bool:
+        if not self.registry.refresh():
+            return False
+        self.logger.info("Runtime config changed (version %d), re-binding services", self.registry.get_version())
+        self.on_change()
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.logger.warning("Config watcher error: %s", str(e))
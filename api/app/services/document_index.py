@@ -0,0 +1,108 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from api.app.repositories.vector_store import VectorStore
+from api.app.utils.logger import setup_logger
+from api.app.utils.vectors import normalize_rows
+
+# Chunk metadata is copied onto the file's entry, so the same retrieval-scope `where`
+# filters (file_name, file_mtime, tag_*) work on both stores, except the keys that
+# describe a single chunk: its position, its neighbours and its near-duplicate sources.
+_CHUNK_ONLY_KEYS = {"chunk_index", "char_start", "char_end", "prev_id", "next_id", "also_in"}
+EXCERPT_CHARS = 500
+
+
+def centroid(embeddings) -> List[float]:
+    """Mean direction of the (normalised) chunk embeddings, normalised again."""
+    mean = normalize_rows(embeddings).mean(axis=0)
+    norm = float(np.linalg.norm(mean))
+    return (mean / norm if norm else mean).tolist()
+
+
+def file_metadata(chunk_meta: Dict, chunk_count: int) -> Dict:
+    meta = {k: v for k, v in chunk_meta.items() if k not in _CHUNK_ONLY_KEYS}
+    meta["chunk_count"] = chunk_count
+    return meta
+
+
+class DocumentIndex:
+    """
+    File-level index for two-stage retrieval: one vector per indexed file (the centroid
+    of its chunk embeddings), keyed by file_path. A query first picks the top-N files
+    here, then searches chunks only within those files. Kept in sync by IngestService.
+    """
+
+    def __init__(self, store: VectorStore):
+        self.store = store
+        self.logger = setup_logger()
+
+    def put(self, file_path: str, chunk_embeddings, chunk_meta: Dict, excerpt: str = ""):
+        if len(chunk_embeddings) == 0:
+            self.remove(file_path)
+            return
+        self.store.upsert(
+            ids=[file_path],
+            embeddings=[centroid(chunk_embeddings)],
+            documents=[excerpt[:EXCERPT_CHARS]],
+            metadatas=[file_metadata(chunk_meta, len(chunk_embeddings))],
+        )
+
+    def update_metadata(self, file_path: str, meta: Dict):
+        if self.store.get(ids=[file_path], include=[]).get("ids"):
+            self.store.update(ids=[file_path], metadatas=[meta])
+
+    def remove(self, file_path: Optional[str] = None, where: Optional[Dict] = None):
+        if file_path is not None:
+            self.store.delete(ids=[file_path])
+        elif where:
+            self.store.delete(where=where)
+
+    def count(self) -> int:
+        return self.store.count()
+
+    def file_paths(self) -> List[str]:
+        return self.store.get(include=[], limit=1_000_000).get("ids") or []
+
+    def top_files(self, query_embeddings, n: int, where: Optional[Dict] = None) -> List[List[str]]:
+        """file_path of the `n` closest files per query embedding."""
+        res = self.store.query(query_embeddings=query_embeddings, n_results=n, where=where, include=[])
+        return res.get("ids") or [[] for _ in query_embeddings]
+
+    def rebuild(self, collection: VectorStore, file_paths: Optional[Iterable[str]] = None,
+                page_size: int = 5000) -> Dict:
+        """
+        (Re)computes file entries from the embeddings already stored in `collection`,
+        without calling the embedding model. `file_paths=None` rebuilds every file.
+        """
+        wanted = set(file_paths) if file_paths is not None else None
+        if wanted is not None and not wanted:
+            return {"files": 0}
+
+        embeddings = defaultdict(list)
+        first = {}
+        total, offset = collection.count(), 0
+        while offset < total:
+            page = collection.get(limit=page_size, offset=offset, include=["embeddings", "metadatas", "documents"])
+            metas = page.get("metadatas") or []
+            if not metas:
+                break
+            for emb, meta, doc in zip(page["embeddings"], metas, page.get("documents") or [""] * len(metas)):
+                fp = meta.get("file_path")
+                if not fp or (wanted is not None and fp not in wanted):
+                    continue
+                embeddings[fp].append(emb)
+                if fp not in first or meta.get("chunk_index", 0) < first[fp][0].get("chunk_index", 0):
+                    first[fp] = (meta, doc or "")
+            offset += len(metas)
+
+        if wanted is None:
+            stale = [fp for fp in self.file_paths() if fp not in embeddings]
+            if stale:
+                self.store.delete(ids=stale)
+        for fp, embs in embeddings.items():
+            meta, doc = first[fp]
+            self.put(fp, np.asarray(embs, dtype=np.float32), meta, excerpt=doc)
+        self.logger.info("Document index rebuilt for %d files", len(embeddings))
+        return {"files": len(embeddings)}
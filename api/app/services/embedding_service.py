@@ -0,0 +1,212 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from api.app.services.model_registry import ModelRegistry
+from api.app.utils.logger import setup_logger
+from api.app.utils.profiler import span
+from api.app.utils.reduction import Reducer, embedding_space, load_reducer, reduction_tag
+
+Key = Tuple[str, str]
+
+
+class EmbeddingService:
+    """
+    Single entry point for every embedding call in the app (queries, history, ingestion).
+
+    Concurrent callers are coalesced: requests arriving within a short window are sent
+    to Ollama as one batched `embed` call, identical texts that are already queued or
+    in flight share one result, and the batch size adapts to the observed call latency
+    (grow while calls stay well under the target, halve when they exceed it).
+
+    When the registry holds a dimension reduction for the model, every result is reduced
+    with it, so ingestion, queries and history always land in the same vector space.
+    """
+
+    def __init__(self, ollama, registry: ModelRegistry, window_ms: float = 5.0, min_batch: int = 8,
+                 max_batch: int = 256, target_latency_ms: float = 500.0, max_inflight: int = 2,
+                 keep_alive: str = None):
+        self.ollama = ollama
+        self.keep_alive = keep_alive
+        self.registry = registry
+        self.window = window_ms / 1000
+        self.min_batch = max(1, min_batch)
+        self.max_batch = max(self.min_batch, max_batch)
+        self.target_latency_ms = target_latency_ms
+        self.logger = setup_logger()
+
+        self._cond = threading.Condition()
+        self._queue: "OrderedDict[Key, Future]" = OrderedDict()
+        self._inflight: Dict[Key, Future] = {}
+        self._batch_size = min(self.max_batch, max(self.min_batch, 32))
+        self._latency_ewma: Optional[float] = None
+        self._slots = threading.BoundedSemaphore(max(1, max_inflight))
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_inflight), thread_name_prefix="embed")
+        self._thread: Optional[threading.Thread] = None
+        self._batches = 0
+        self._texts = 0
+        self._deduped = 0
+        self._reducers: Dict[str, Reducer] = {}
+
+    def embed(self, texts: List[str], model: str = None, reduce: bool = True) -> List[List[float]]:
+        if not texts:
+            return []
+        model = model or self.registry.get_embedding_model()
+        reducer = self._reducer(self.reduction(model)) if reduce else None
+        futures = []
+        with self._cond:
+            self._ensure_started()
+            for text in texts:
+                key = (model, text)
+                fut = self._queue.get(key) or self._inflight.get(key)
+                if fut is None:
+                    fut = Future()
+                    self._queue[key] = fut
+                else:
+                    self._deduped += 1
+                futures.append(fut)
+            self._cond.notify()
+        with span("ollama.embeddings"):
+            vectors = [f.result() for f in futures]
+        return reducer.apply(vectors).tolist() if reducer else vectors
+
+    def embed_one(self, text: str, model: str = None) -> List[float]:
+        return self.embed([text], model=model)[0]
+
+    def model(self) -> str:
+        return self.registry.get_embedding_model()
+
+    def reduction(self, model: str = None) -> Optional[Dict]:
+        """The registry's reduction if it was set up for `model`, otherwise None (full vectors)."""
+        spec = self.registry.get_embedding_reduction()
+        model = model or self.registry.get_embedding_model()
+        return spec if spec and spec.get("model") == model else None
+
+    def space(self, model: str = None) -> str:
+        model = model or self.registry.get_embedding_model()
+        return embedding_space(model, reduction_tag(self.reduction(model)))
+
+    def pinned(self, spec: Optional[Dict], model: Optional[str] = None) -> "PinnedEmbedder":
+        """A view of this service that embeds with `model` and reduces with `spec` whatever the registry holds."""
+        return PinnedEmbedder(self, spec, model or self.model())
+
+    def _reducer(self, spec: Optional[Dict]) -> Optional[Reducer]:
+        if not spec:
+            return None
+        tag = reduction_tag(spec)
+        reducer = self._reducers.get(tag)
+        if reducer is None:
+            reducer = self._reducers[tag] = load_reducer(spec, self.registry.artifact_dir)
+        return reducer
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "batch_size": self._batch_size,
+                "queued": len(self._queue),
+                "inflight": len(self._inflight),
+                "latency_ewma_ms": round(self._latency_ewma, 2) if self._latency_ewma is not None else None,
+                "batches": self._batches,
+                "texts": self._texts,
+                "deduplicated": self._deduped,
+            }
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="embed-coalescer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.window
+                while len(self._queue) < self._batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            # Waiting for a free slot lets the next batch keep growing under load.
+            self._slots.acquire()
+            with self._cond:
+                model = next(iter(self._queue))[0]
+                batch = []
+                for key in list(self._queue.keys()):
+                    if len(batch) >= self._batch_size:
+                        break
+                    if key[0] != model:
+                        continue
+                    fut = self._queue.pop(key)
+                    self._inflight[key] = fut
+                    batch.append((key, fut))
+            self._pool.submit(self._send, model, batch)
+
+    def _send(self, model: str, batch: List[Tuple[Key, Future]]):
+        start = time.perf_counter()
+        try:
+            res = self.ollama.embed(model=model, input=[key[1] for key, _ in batch], keep_alive=self.keep_alive)
+            embeddings = res["embeddings"]
+            if len(embeddings) != len(batch):
+                raise RuntimeError(f"Ollama returned {len(embeddings)} embeddings for {len(batch)} inputs")
+            self._adapt(len(batch), (time.perf_counter() - start) * 1000)
+            for (_, fut), emb in zip(batch, embeddings):
+                fut.set_result(list(emb))
+        except Exception as e:
+            self.logger.warning("Embedding batch of %d failed: %s", len(batch), str(e))
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        finally:
+            with self._cond:
+                for key, _ in batch:
+                    self._inflight.pop(key, None)
+            self._slots.release()
+
+    def _adapt(self, size: int, latency_ms: float):
+        with self._cond:
+            self._batches += 1
+            self._texts += size
+            if self._latency_ewma is None:
+                self._latency_ewma = latency_ms
+            else:
+                self._latency_ewma = 0.8 * self._latency_ewma + 0.2 * latency_ms
+            if latency_ms > self.target_latency_ms:
+                self._batch_size = max(self.min_batch, self._batch_size // 2)
+            elif size >= self._batch_size and self._latency_ewma < self.target_latency_ms / 2:
+                self._batch_size = min(self.max_batch, self._batch_size + max(1, self._batch_size // 4))
+
+
+class PinnedEmbedder:
+    """
+    EmbeddingService view with a fixed model and reduction (None: full vectors), so an
+    index for them can be built before the registry switches to them.
+    """
+
+    def __init__(self, service: EmbeddingService, spec: Optional[Dict], model: str):
+        self.service = service
+        self.spec = spec
+        self._model = model
+
+    def model(self) -> str:
+        return self._model
+
+    def embed(self, texts: List[str], model: str = None, reduce: bool = True) -> List[List[float]]:
+        model = model or self._model
+        vectors = self.service.embed(texts, model=model, reduce=False)
+        reducer = self.service._reducer(self.reduction(model)) if reduce else None
+        return reducer.apply(vectors).tolist() if reducer and vectors else vectors
+
+    def embed_one(self, text: str, model: str = None) -> List[float]:
+        return self.embed([text], model=model)[0]
+
+    def reduction(self, model: str = None) -> Optional[Dict]:
+        model = model or self._model
+        return self.spec if self.spec and self.spec.get("model") == model else None
+
+    def space(self, model: str = None) -> str:
+        model = model or self._model
+        return embedding_space(model, reduction_tag(self.reduction(model)))
@@ -0,0 +1,113 @@
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from api.app.repositories.history_repo import HistoryRepo
+from api.app.utils.locks import try_exclusive_lock
+from api.app.utils.logger import setup_logger
+
+
+def extractive_summarizer(max_chars: int = 1500, snippet_chars: int = 160) -> Callable:
+    """
+    Cheap rolling summary: one "Q: … / A: …" line per folded turn, appended to the
+    previous summary and trimmed from the oldest end to `max_chars`.
+    """
+
+    def summarize(previous: Optional[str], turns: List[Dict]) -> str:
+        lines = [previous] if previous else []
+        for msg in turns:
+            text = " ".join((msg.get("content") or "").split())[:snippet_chars]
+            if text:
+                lines.append(f"{'Q' if msg['role'] == 'user' else 'A'}: {text}")
+        summary = "\n".join(lines)
+        if len(summary) > max_chars:
+            summary = summary[-max_chars:]
+            summary = summary[summary.find("\n") + 1:] if "\n" in summary else summary
+        return summary
+
+    return summarize
+
+
+def llm_summarizer(ollama, registry, max_chars: int = 1500) -> Callable:
+    fallback = extractive_summarizer(max_chars)
+
+    def summarize(previous: Optional[str], turns: List[Dict]) -> str:
+        transcript = "\n".join(f"{m['role']}: {m.get('content') or ''}" for m in turns)
+        prompt = (
+            f"Merge the existing summary and the conversation below into one compact summary "
+            f"(max {max_chars} characters) of the topics the user asked about and the key facts answered. "
+            f"Keep the user's language.\n\nExisting summary:\n{previous or '-'}\n\nConversation:\n{transcript[:8000]}"
+        )
+        try:
+            res = ollama.chat(
+                model=registry.get_chat_model(),
+                messages=[{"role": "user", "content": prompt}],
+                options={"temperature": 0.1},
+            )
+            return res["message"]["content"].strip()[:max_chars]
+        except Exception:
+            return fallback(previous, turns)
+
+    return summarize
+
+
+class HistoryCompactor:
+    """
+    Periodically enforces history retention (max turns per user and/or max age),
+    folding pruned turns into each user's rolling summary, then VACUUMs the DB.
+    One process at a time (lock file next to the DB).
+    """
+
+    def __init__(self, repo: HistoryRepo, summarize: Callable, lock_path: Path, keep_turns: int = 0,
+                 max_age_days: float = 0, interval: float = 3600):
+        self.repo = repo
+        self.summarize = summarize
+        self.lock_path = Path(lock_path)
+        self.keep_turns = keep_turns
+        self.max_age_days = max_age_days
+        self.interval = interval
+        self.logger = setup_logger()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or (self.keep_turns <= 0 and self.max_age_days <= 0):
+            return
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="history-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def run_once(self) -> Dict:
+        lock = try_exclusive_lock(self.lock_path)
+        if lock is None:
+            return {"skipped": "compaction already running in another process"}
+        try:
+            min_ts = int(time.time() - self.max_age_days * 86400) if self.max_age_days > 0 else 0
+            deleted, users = 0, 0
+            for user_id in self.repo.user_ids():
+                n = self.repo.compact(user_id, keep_turns=self.keep_turns, min_ts=min_ts,
+                                      summarize=self.summarize)
+                if n:
+                    users += 1
+                    deleted += n
+            if deleted:
+                self.repo.vacuum()
+            self.logger.info("History compaction: %d rows folded into summaries for %d users", deleted, users)
+            return {"deleted_rows": deleted, "users_compacted": users}
+        finally:
+            lock.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.logger.warning("History compaction failed: %s", str(e))
@@ -0,0 +1,189 @@
+import time
+import uuid
+from typing import Dict, List, Optional, Sequence
+
+import chromadb
+import numpy as np
+from fastapi import HTTPException
+
+from api.app.utils.logger import setup_logger
+from api.app.utils.vectors import cosine_top_k, normalize_rows
+
+
+def hnsw_metadata(m: int, construction_ef: int, search_ef: int, space: str = "cosine") -> Dict:
+    return {
+        "hnsw:space": space,
+        "hnsw:M": m,
+        "hnsw:construction_ef": construction_ef,
+        "hnsw:search_ef": search_ef,
+    }
+
+
+def current_hnsw(collection) -> Dict:
+    """HNSW parameters the collection was actually built with."""
+    cfg = getattr(collection, "configuration", None)
+    hnsw = cfg.get("hnsw") if isinstance(cfg, dict) else None
+    if hnsw:
+        return {
+            "m": hnsw.get("max_neighbors"),
+            "construction_ef": hnsw.get("ef_construction"),
+            "search_ef": hnsw.get("ef_search"),
+        }
+    meta = collection.metadata or {}
+    return {
+        "m": meta.get("hnsw:M"),
+        "construction_ef": meta.get("hnsw:construction_ef"),
+        "search_ef": meta.get("hnsw:search_ef"),
+    }
+
+
+def estimate_index_bytes(n: int, dim: int, m: int) -> int:
+    # hnswlib layout: float32 vector + label + level-0 links (2*M ids + count) per element,
+    # plus upper-level links (M ids + count) for the expected 1/(M-1) extra levels.
+    per_element = dim * 4 + 8 + (2 * m * 4 + 4) + (m * 4 + 4) / max(1, m - 1)
+    return int(n * per_element)
+
+
+def percentile(values: List[float], q: float) -> float:
+    return round(float(np.percentile(values, q)), 3) if values else 0.0
+
+
+def load_vectors(collection, max_vectors: int, page_size: int = 5000) -> np.ndarray:
+    total = collection.count()
+    if max_vectors:
+        total = min(total, max_vectors)
+    parts, offset = [], 0
+    while offset < total:
+        page = collection.get(limit=min(page_size, total - offset), offset=offset, include=["embeddings"])
+        embs = page.get("embeddings")
+        if embs is None or len(embs) == 0:
+            break
+        parts.append(np.asarray(embs, dtype=np.float32))
+        offset += len(embs)
+    return np.vstack(parts) if parts else np.empty((0, 0), dtype=np.float32)
+
+
+def holdout_queries(vectors: np.ndarray, sample_queries: int, k: int, seed: int = 0):
+    """
+    Splits stored vectors into held-out queries and the base set to search. Returns
+    (queries, base, truth_sets), where truth_sets holds the exact top-k base rows per query.
+    """
+    n = len(vectors)
+    n_queries = min(sample_queries, n // 10)
+    if n_queries < 1 or n - n_queries < k:
+        raise HTTPException(status_code=400, detail=f"Not enough vectors to benchmark ({n} indexed)")
+    rng = np.random.default_rng(seed)
+    held_out = np.zeros(n, dtype=bool)
+    held_out[rng.choice(n, size=n_queries, replace=False)] = True
+    queries = normalize_rows(vectors[held_out])
+    base = vectors[~held_out]
+    truth, _ = cosine_top_k(queries, base, k)
+    return queries, base, [set(row.tolist()) for row in truth]
+
+
+class HnswTuner:
+    """
+    Measures the recall/latency trade-off of HNSW parameters on the live corpus.
+
+    A sample of stored vectors is held out as queries; their exact cosine neighbours
+    among the remaining vectors are the ground truth. Every (M, construction_ef,
+    search_ef) combination is built into a throw-away in-memory collection (Chroma
+    keeps the loaded index's search_ef, so it cannot be swept on one build) and
+    measured for recall@k, p50/p99 single-query latency, build time and an index
+    memory estimate. The recommendation is the fastest configuration reaching
+    `target_recall`.
+    """
+
+    def __init__(self, page_size: int = 5000):
+        self.page_size = page_size
+        self.logger = setup_logger()
+
+    def run(self, collection, sample_queries: int = 200, k: int = 10, target_recall: float = 0.95,
+            m_values: Sequence[int] = (8, 16, 32), construction_ef_values: Sequence[int] = (100, 200),
+            search_ef_values: Sequence[int] = (20, 50, 100, 200), max_vectors: int = 50000,
+            seed: int = 0, batch_size: int = 5000) -> Dict:
+        start = time.perf_counter()
+        vectors = load_vectors(collection, max_vectors, self.page_size)
+        queries, base, truth_sets = holdout_queries(vectors, sample_queries, k, seed)
+        dim = base.shape[1]
+
+        exact_latency = []
+        for q in queries:
+            t0 = time.perf_counter()
+            cosine_top_k(q, base, k)
+            exact_latency.append((time.perf_counter() - t0) * 1000)
+
+        client = chromadb.EphemeralClient()
+        ids = [str(i) for i in range(len(base))]
+        results = []
+        for m in m_values:
+            for construction_ef in construction_ef_values:
+                for search_ef in search_ef_values:
+                    results.append(self._measure(client, base, ids, queries, truth_sets, k,
+                                                 m, construction_ef, search_ef, batch_size))
+                self.logger.info("HNSW sweep M=%d construction_ef=%d done", m, construction_ef)
+
+        return {
+            "vectors": len(base),
+            "queries": len(queries),
+            "dim": dim,
+            "k": k,
+            "target_recall": target_recall,
+            "exact": {"p50_ms": percentile(exact_latency, 50), "p99_ms": percentile(exact_latency, 99)},
+            "results": results,
+            "recommendation": self.recommend(results, target_recall),
+            "seconds": round(time.perf_counter() - start, 2),
+        }
+
+    @staticmethod
+    def _measure(client, base: np.ndarray, ids: List[str], queries: np.ndarray, truth_sets: List[set], k: int,
+                 m: int, construction_ef: int, search_ef: int, batch_size: int) -> Dict:
+        name = f"hnsw-tune-{uuid.uuid4().hex[:12]}"
+        col = client.create_collection(
+            name=name,
+            embedding_function=None,
+            metadata=hnsw_metadata(m, construction_ef, search_ef),
+        )
+        try:
+            t0 = time.perf_counter()
+            for i in range(0, len(base), batch_size):
+                col.add(ids=ids[i:i + batch_size], embeddings=base[i:i + batch_size])
+            build_s = time.perf_counter() - t0
+
+            col.query(query_embeddings=[queries[0].tolist()], n_results=k, include=[])
+            latency, hits = [], 0
+            for qi, q in enumerate(queries):
+                t0 = time.perf_counter()
+                res = col.query(query_embeddings=[q.tolist()], n_results=k, include=[])
+                latency.append((time.perf_counter() - t0) * 1000)
+                hits += len(truth_sets[qi] & {int(x) for x in res["ids"][0]})
+        finally:
+            client.delete_collection(name)
+        return {
+            "m": m,
+            "construction_ef": construction_ef,
+            "search_ef": search_ef,
+            "recall_at_k": round(hits / (len(queries) * k), 4),
+            "p50_ms": percentile(latency, 50),
+            "p99_ms": percentile(latency, 99),
+            "build_seconds": round(build_s, 2),
+            "index_mb": round(estimate_index_bytes(len(base), base.shape[1], m) / 2 ** 20, 1),
+        }
+
+    @staticmethod
+    def recommend(results: List[Dict], target_recall: float) -> Optional[Dict]:
+        if not results:
+            return None
+        good = [r for r in results if r["recall_at_k"] >= target_recall]
+        if good:
+            best = min(good, key=lambda r: (r["p50_ms"], r["index_mb"], r["build_seconds"]))
+            reason = f"lowest p50 latency with recall@k >= {target_recall}"
+        else:
+            best = max(results, key=lambda r: (r["recall_at_k"], -r["p50_ms"]))
+            reason = f"no configuration reached recall@k {target_recall}; highest recall"
+        return {
+            "m": best["m"],
+            "construction_ef": best["construction_ef"],
+            "search_ef": best["search_ef"],
+            "reason": reason,
+        }
@@ -0,0 +1,253 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from api.app.services.document_index import DocumentIndex
+from api.app.services.snapshot_service import SnapshotService, corpus_version
+from api.app.utils.locks import try_exclusive_lock
+from api.app.utils.logger import setup_logger
+
+LATEST = "LATEST"
+REPLICA_PREFIX = "replica_"
+
+
+def read_latest(publish_dir: Path) -> Optional[Dict]:
+    try:
+        return json.loads((Path(publish_dir) / LATEST).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_json(path: Path, data: Dict):
+    tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class IndexPublisher:
+    """
+    Writer side of the reader/writer split: exports the chunk collection as an immutable
+    snapshot into the shared PUBLISH_DIR and then atomically moves the LATEST pointer
+    ({"version", "name", ...}) to it. Nothing is published while the corpus is unchanged.
+    """
+
+    def __init__(self, snapshots: SnapshotService, get_collection: Callable, registry, keep: int = 3,
+                 interval: float = 60.0, page_size: int = 5000):
+        self.snapshots = snapshots
+        self.get_collection = get_collection
+        self.registry = registry
+        self.keep = keep
+        self.interval = interval
+        self.page_size = page_size
+        self.lock_path = self.snapshots.snapshot_dir / ".publish.lock"
+        self.logger = setup_logger()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="index-publisher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def fingerprint(self, collection) -> str:
+        """corpus_version() of the live collection, from ids and metadatas only."""
+        ids, hashes = [], []
+        offset = 0
+        while True:
+            page = collection.get(limit=self.page_size, offset=offset, include=["metadatas"])
+            page_ids = page.get("ids") or []
+            if not page_ids:
+                break
+            ids.extend(page_ids)
+            hashes.extend((m or {}).get("file_hash") for m in page.get("metadatas") or [None] * len(page_ids))
+            offset += len(page_ids)
+        return corpus_version(ids, hashes)
+
+    def publish(self, force: bool = False) -> Dict:
+        lock = try_exclusive_lock(self.lock_path)
+        if lock is None:
+            return {"published": False, "reason": "publish already running in another process"}
+        try:
+            collection = self.get_collection()
+            latest = read_latest(self.snapshots.snapshot_dir) or {}
+            model = self.registry.get_embedding_model()
+            reduction = self.registry.get_embedding_reduction()
+            if reduction and reduction.get("model") != model:
+                reduction = None
+            if (not force and latest.get("embedding_model") == model
+                    and latest.get("embedding_reduction") == reduction
+                    and latest.get("corpus_version") == self.fingerprint(collection)):
+                return {"published": False, "reason": "unchanged", **latest}
+
+            snap = self.snapshots.export(collection)
+            pointer = {
+                "version": int(latest.get("version") or 0) + 1,
+                "name": snap["name"],
+                "sha256": snap["sha256"],
+                "corpus_version": snap["corpus_version"],
+                "embedding_model": snap["embedding_model"],
+                "embedding_reduction": snap["embedding_reduction"],
+                "count": snap["count"],
+                "published_at": int(time.time()),
+            }
+            _write_json(self.snapshots.snapshot_dir / LATEST, pointer)
+            self._prune(keep_name=snap["name"])
+            self.logger.info("Published index version %d (%s, %d chunks)", pointer["version"], snap["name"],
+                             snap["count"])
+            return {"published": True, **pointer}
+        finally:
+            lock.close()
+
+    def _prune(self, keep_name: str):
+        # Older versions stay around for a while: readers may still be importing them.
+        for i, item in enumerate(self.snapshots.list()):
+            if i >= max(self.keep, 1) and item["name"] != keep_name:
+                self.snapshots.delete(item["name"])
+
+    def status(self) -> Dict:
+        return {"latest": read_latest(self.snapshots.snapshot_dir), "interval": self.interval, "keep": self.keep}
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.publish()
+            except Exception as e:
+                self.logger.warning("Index publish failed: %s", str(e))
+
+
+class ReplicaFollower:
+    """
+    Reader side: polls the LATEST pointer and, when it moves, imports that snapshot into
+    a fresh local collection ("replica_<version>") next to the one being served, rebuilds
+    its document index, then hot-swaps the services onto it via on_swap() and drops
+    older replicas. One process per node imports (lock file); the others only re-bind
+    once the local state file names the new collection.
+    """
+
+    def __init__(self, snapshots: SnapshotService, state_path: Path, make_store: Callable, list_stores: Callable,
+                 registry, on_swap: Callable, interval: float = 5.0, page_size: int = 5000):
+        self.snapshots = snapshots
+        self.state_path = Path(state_path)
+        self.lock_path = self.state_path.with_suffix(".lock")
+        self.make_store = make_store
+        self.list_stores = list_stores
+        self.registry = registry
+        self.on_swap = on_swap
+        self.interval = interval
+        self.page_size = page_size
+        self.logger = setup_logger()
+        self.bound = self.store_names()[0]
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="replica-follower", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+
+    def state(self) -> Dict:
+        try:
+            return json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def store_names(self) -> Tuple[str, str]:
+        """(chunk collection, document index) names of the replica this node serves."""
+        name = self.state().get("collection")
+        return (name, f"{name}_files") if name else ("documents", "files")
+
+    def check(self) -> bool:
+        latest = read_latest(self.snapshots.snapshot_dir)
+        state = self.state()
+        if latest and latest["version"] > int(state.get("version") or 0):
+            lock = try_exclusive_lock(self.lock_path)
+            if lock is not None:
+                try:
+                    state = self.state()
+                    if latest["version"] > int(state.get("version") or 0):
+                        state = self._load(latest)
+                finally:
+                    lock.close()
+        name = state.get("collection")
+        if not name or name == self.bound:
+            return False
+        chunks, files = self.store_names()
+        self.on_swap(self.make_store(chunks), DocumentIndex(self.make_store(files)))
+        self.bound = name
+        self.logger.info("Serving index version %s (%s)", state.get("version"), name)
+        return True
+
+    def _load(self, latest: Dict) -> Dict:
+        start = time.perf_counter()
+        name = f"{REPLICA_PREFIX}{int(latest['version']):06d}"
+        path = self.snapshots.path_for(latest["name"])
+        for n in (name, f"{name}_files"):
+            if n in self.list_stores():
+                # Left over from an interrupted import.
+                self.make_store(n).drop()
+        collection = self.make_store(name)
+        batch_size = min(self.page_size, collection.max_batch_size)
+        result = self.snapshots.import_into(path, collection, batch_size=batch_size, verify=True)
+        DocumentIndex(self.make_store(f"{name}_files")).rebuild(collection, page_size=self.page_size)
+
+        previous = self.state().get("collection")
+        state = {
+            "version": latest["version"],
+            "collection": name,
+            "snapshot": latest["name"],
+            "corpus_version": result["corpus_version"],
+            "loaded_at": int(time.time()),
+        }
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        _write_json(self.state_path, state)
+        manifest = self.snapshots.read_manifest(path)
+        if manifest["embedding_model"] != self.registry.get_embedding_model():
+            # Queries must be embedded with the model the writer indexed with.
+            self.registry.set_embedding_model(manifest["embedding_model"], manifest.get("embedding_model_max_tokens"))
+        if manifest.get("embedding_reduction") != self.registry.get_embedding_reduction():
+            self.snapshots.adopt_reduction(path)
+        self._drop_stale(keep={name, previous})
+        self.logger.info("Imported index version %d into %s in %.2fs", latest["version"], name,
+                         time.perf_counter() - start)
+        return state
+
+    def _drop_stale(self, keep):
+        # The previous replica stays until the next version: other workers may still serve it.
+        keep = {n for k in keep if k for n in (k, f"{k}_files")}
+        for n in self.list_stores():
+            if n.startswith(REPLICA_PREFIX) and n not in keep:
+                try:
+                    self.make_store(n).drop()
+                except Exception as e:
+                    self.logger.warning("Could not drop stale replica %s: %s", n, str(e))
+
+    def status(self) -> Dict:
+        return {"state": self.state(), "bound": self.bound, "latest": read_latest(self.snapshots.snapshot_dir)}
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                self.logger.warning("Replica sync failed: %s", str(e))
+            if self._stop.wait(self.interval):
+                return
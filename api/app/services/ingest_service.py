@@ -1,40 +1,71 @@
 from pathlib import Path
-from typing import Dict, Any, Set
+from typing import Dict, Any, List, Optional, Set, Tuple
 from fastapi import HTTPException, UploadFile
 
+from api.app.repositories.text_store import TextStore
+from api.app.repositories.vector_store import VectorStore
+from api.app.services.chunk_dedup import ChunkDeduplicator
+from api.app.services.document_index import DocumentIndex
 from api.app.utils.hashing import sha256_file
 from api.app.utils.extract import extract_text_from_file
-from api.app.utils.chunk import sentence_chunk_text
-from api.app import deps
+from api.app.utils.chunk import chunk_spans, sentence_chunk_text
+from api.app.utils.reduction import meta_space, reduction_tag
+from api.app.utils.scope import normalize_tags, tags_metadata
+
+SUPPORTED_EXTENSIONS = {".txt", ".pdf", ".docx", ".doc"}
 
 
 class IngestService:
-    def __init__(self, storage_dir: Path, collection, chunk_size: int, chunk_overlap: int):
+    def __init__(self, storage_dir: Path, collection: VectorStore, embedder, chunk_size: int, chunk_overlap: int,
+                 document_index: Optional[DocumentIndex] = None, dedup: Optional[ChunkDeduplicator] = None,
+                 text_store: Optional[TextStore] = None):
         self.storage_dir = storage_dir
         self.collection = collection
+        self.document_index = document_index
+        self.dedup = dedup
+        self.text_store = text_store
+        self.embedder = embedder
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
 
-    def upsert_file(self, path: Path, force: bool = False) -> Dict[str, Any]:
+    def upsert_file(self, path: Path, force: bool = False, tags: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Index `path`. `tags=None` keeps the tags the file already has in the index,
+        a list (possibly empty) replaces them.
+        """
         file_hash = sha256_file(path)
         mtime = int(path.stat().st_mtime)
-        embedding_model = deps.registry.get_embedding_model()
-
-        existing = self.collection.get(
-            where={"file_path": str(path)}, include=["metadatas"], limit=1_000_000
-        )
-        existing_hashes = {m.get("file_hash") for m in existing.get("metadatas", [])}
-        existing_models = {m.get("embedding_model") for m in existing.get("metadatas", [])}
-
-        if not force and existing_hashes and (file_hash in existing_hashes) and embedding_model in existing_models:
+        embedding_model = self.embedder.model()
+        reduction = reduction_tag(self.embedder.reduction(embedding_model))
+
+        existing_ids, existing_metas = self._indexed(path)
+        existing_hashes = {m.get("file_hash") for m in existing_metas}
+        same_space = self.embedder.space(embedding_model) in {meta_space(m) for m in existing_metas}
+        previous_tags = normalize_tags((existing_metas or [{}])[0].get("tags"))
+        tags = previous_tags if tags is None else normalize_tags(tags)
+
+        if not force and existing_hashes and (file_hash in existing_hashes) and same_space:
+            if tags != previous_tags:
+                tag_meta = tags_metadata(tags, previous=previous_tags)
+                if existing_ids:
+                    self.collection.update(ids=existing_ids, metadatas=[tag_meta for _ in existing_ids])
+                if self.dedup:
+                    self.dedup.update_file(str(path), tag_meta)
+                if self.document_index:
+                    self.document_index.update_metadata(str(path), tag_meta)
+                return {"indexed": False, "reason": "no_change_and_same_model", "tags": tags}
             return {"indexed": False, "reason": "no_change_and_same_model"}
 
-        if existing.get("metadatas"):
-            self.collection.delete(where={"file_path": str(path)})
+        if existing_metas:
+            self._delete_chunks({"file_path": str(path)})
 
         text = extract_text_from_file(path)
         chunks = sentence_chunk_text(text, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
 
+        spans = chunk_spans(text, chunks)
+        if self.text_store and chunks:
+            self.text_store.put(file_hash, text, spans)
+
         ids = [f"{path.name}:{file_hash}:{i}" for i in range(len(chunks))]
         metadatas = [
             {
@@ -43,16 +74,79 @@ class IngestService:
                 "file_hash": file_hash,
                 "file_mtime": mtime,
                 "chunk_index": i,
-                "embedding_model": embedding_model
+                **({"char_start": spans[i][0], "char_end": spans[i][1]} if spans[i][0] >= 0 else {}),
+                **({"prev_id": ids[i - 1]} if i > 0 else {}),
+                **({"next_id": ids[i + 1]} if i + 1 < len(chunks) else {}),
+                "embedding_model": embedding_model,
+                **({"embedding_reduction": reduction} if reduction else {}),
+                **tags_metadata(tags),
             }
             for i in range(len(chunks))
         ]
-        self.collection.add(ids=ids, documents=chunks, metadatas=metadatas)
-        return {"indexed": True, "chunks": len(chunks)}
+        sigs, canonical = [], [None] * len(chunks)
+        if self.dedup and chunks:
+            sigs, canonical = self.dedup.match(self.collection, ids, chunks)
+        new = [i for i, c in enumerate(canonical) if c is None]
+
+        # Near-duplicates are neither embedded nor stored, only referenced.
+        embeddings = self.embedder.embed([chunks[i] for i in new], model=embedding_model)
+        if new:
+            self.collection.add(ids=[ids[i] for i in new], documents=[chunks[i] for i in new],
+                                embeddings=embeddings, metadatas=[metadatas[i] for i in new])
+        dups = [(canonical[i], metadatas[i]) for i in range(len(chunks)) if canonical[i] is not None]
+        if self.dedup:
+            self.dedup.register([ids[i] for i in new], [sigs[i] for i in new])
+            self.dedup.add_refs(self.collection, dups)
+
+        if self.document_index:
+            if chunks:
+                if dups:
+                    shared = self.collection.get(ids=sorted({c for c, _ in dups}), include=["embeddings"])
+                    by_id = dict(zip(shared["ids"], shared["embeddings"]))
+                    embeddings = list(embeddings) + [by_id[c] for c, _ in dups if c in by_id]
+                self.document_index.put(str(path), embeddings, metadatas[0], excerpt=chunks[0])
+            else:
+                self.document_index.remove(str(path))
+        out = {"indexed": True, "chunks": len(chunks), "tags": tags}
+        if self.dedup:
+            out["deduplicated"] = len(dups)
+        return out
+
+    def _indexed(self, path: Path) -> Tuple[List[str], List[Dict]]:
+        """Ids of the chunks stored for `path` and the metadata of all its chunks, near-duplicates included."""
+        existing = self.collection.get(
+            where={"file_path": str(path)}, include=["metadatas"], limit=1_000_000
+        )
+        metas = list(existing.get("metadatas") or [])
+        if self.dedup:
+            metas += self.dedup.file_metas(str(path))
+        return existing.get("ids") or [], metas
+
+    def _delete_chunks(self, where: Dict):
+        hashes = set()
+        if self.text_store:
+            (key, value), = where.items()
+            path = Path(value) if key == "file_path" else self.storage_dir / value
+            hashes = {m.get("file_hash") for m in self._indexed(path)[1] if m.get("file_hash")}
+        if self.dedup:
+            self.dedup.release_file(self.collection, where)
+        else:
+            self.collection.delete(where=where)
+        for h in hashes:
+            # Identical files share one text; keep it while any of their chunks is stored.
+            if not self.collection.get(where={"file_hash": h}, include=[], limit=1).get("ids"):
+                self.text_store.delete(h)
+
+    def remove_from_index(self, path: Path):
+        self._delete_chunks({"file_path": str(path)})
+        if self.document_index:
+            self.document_index.remove(str(path))
+        return {"removed": str(path)}
 
     def _list_indexed_files(self) -> Set[str]:
         data = self.collection.get(include=["metadatas"], limit=1_000_000)
-        return {m.get("file_path") for m in data.get("metadatas", []) if m.get("file_path")}
+        files = {m.get("file_path") for m in data.get("metadatas", []) if m.get("file_path")}
+        return files | self.dedup.ref_files() if self.dedup else files
 
     def sync_index(self):
         indexed_files = self._list_indexed_files()
@@ -60,34 +154,37 @@ class IngestService:
         for f in indexed_files:
             p = Path(f)
             if not p.exists():
-                self.collection.delete(where={"file_path": f})
+                self._delete_chunks({"file_path": f})
+                if self.document_index:
+                    self.document_index.remove(f)
                 deleted.append(f)
 
         changed = []
         for path in self.storage_dir.iterdir():
-            if path.is_file() and path.suffix.lower() in {".txt", ".pdf", ".docx", ".doc"}:
-                existing = self.collection.get(
-                    where={"file_path": str(path)}, include=["metadatas"], limit=1_000_000
-                )
-                existing_hashes = {m.get("file_hash") for m in existing.get("metadatas", [])}
+            if path.is_file() and path.suffix.lower() in SUPPORTED_EXTENSIONS:
+                _, existing_metas = self._indexed(path)
+                existing_hashes = {m.get("file_hash") for m in existing_metas}
                 cur_hash = sha256_file(path)
                 if existing_hashes and (cur_hash in existing_hashes):
                     continue
                 self.upsert_file(path)
                 changed.append(str(path))
 
-        return {"deleted_from_index": deleted, "reindexed": changed}
+        out = {"deleted_from_index": deleted, "reindexed": changed}
+        if self.document_index:
+            # Files indexed before the document index existed (or restored from a snapshot).
+            missing = (indexed_files - set(deleted)) - set(changed) - set(self.document_index.file_paths())
+            out["document_index_backfilled"] = self.document_index.rebuild(self.collection, missing)["files"]
+        return out
 
     def reindex_all(self, force: bool = False):
-        embedding_model = deps.registry.get_embedding_model()
+        space = self.embedder.space()
         indexed = []
         for path in sorted(self.storage_dir.iterdir()):
-            if path.is_file() and path.suffix.lower() in {".txt", ".pdf", ".docx", ".doc"}:
-                existing = self.collection.get(
-                    where={"file_path": str(path)}, include=["metadatas"], limit=1_000_000
-                )
-                existing_models = {m.get("embedding_model") for m in existing.get("metadatas", [])}
-                if not force and existing_models and embedding_model in existing_models:
+            if path.is_file() and path.suffix.lower() in SUPPORTED_EXTENSIONS:
+                _, existing_metas = self._indexed(path)
+                existing_spaces = {meta_space(m) for m in existing_metas}
+                if not force and existing_spaces and space in existing_spaces:
                     indexed.append({"file": path.name, "indexed": False, "reason": "same_model"})
                     continue
                 r = self.upsert_file(path, force=force)
@@ -97,7 +194,9 @@ class IngestService:
     def delete_file_and_index(self, file_name: str):
         safe = Path(file_name).name
         target = self.storage_dir / safe
-        self.collection.delete(where={"file_name": safe})
+        self._delete_chunks({"file_name": safe})
+        if self.document_index:
+            self.document_index.remove(where={"file_name": safe})
         if target.exists():
             try:
                 target.unlink()
@@ -105,7 +204,7 @@ class IngestService:
                 raise HTTPException(status_code=500, detail=f"Failed to remove file: {e}")
         return {"deleted": safe}
 
-    def update_file_from_upload(self, file_name: str, upload: UploadFile):
+    def update_file_from_upload(self, file_name: str, upload: UploadFile, tags: Optional[List[str]] = None):
         safe = Path(file_name).name
         if Path(upload.filename).name != safe:
             raise HTTPException(status_code=400, detail="filename mismatch with route")
@@ -118,5 +217,5 @@ class IngestService:
                     break
                 out.write(chunk)
 
-        r = self.upsert_file(dest, force=True)
+        r = self.upsert_file(dest, force=True, tags=tags)
         return {"updated": safe, **r}
@@ -0,0 +1,56 @@
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from api.app.utils.logger import setup_logger
+
+
+class ModelCatalog:
+    """
+    TTL cache in front of `ollama.list()` and `ollama.show()`, which the model
+    routes otherwise hit synchronously on every request.
+    """
+
+    def __init__(self, ollama, ttl: float = 60.0):
+        self.ollama = ollama
+        self.ttl = ttl
+        self.logger = setup_logger()
+        self._lock = threading.Lock()
+        self._list: Tuple[float, Any] = (0.0, None)
+        self._show: Dict[str, Tuple[float, Any]] = {}
+
+    def _fresh(self, ts: float) -> bool:
+        return time.monotonic() - ts < self.ttl
+
+    def list(self, refresh: bool = False):
+        with self._lock:
+            ts, value = self._list
+            if not refresh and value is not None and self._fresh(ts):
+                return value
+        value = self.ollama.list()
+        with self._lock:
+            self._list = (time.monotonic(), value)
+        return value
+
+    def installed_names(self) -> List[str]:
+        try:
+            models = self.list().get("models", [])
+            return [m.model for m in models if hasattr(m, "model")]
+        except Exception as e:
+            self.logger.error(f"Failed to list installed models: {e}")
+            return []
+
+    def show(self, name: str):
+        with self._lock:
+            cached = self._show.get(name)
+            if cached and self._fresh(cached[0]):
+                return cached[1]
+        info = self.ollama.show(name)
+        with self._lock:
+            self._show[name] = (time.monotonic(), info)
+        return info
+
+    def invalidate(self):
+        with self._lock:
+            self._list = (0.0, None)
+            self._show.clear()
@@ -1,43 +1,111 @@
+import fcntl
 import json
+import os
+from contextlib import contextmanager
 from pathlib import Path
 from threading import RLock
+from typing import Dict, Optional
 
 
 class ModelRegistry:
     """
-    Persistent registry for current chat/embedding model names.
-    Backed by a JSON file under CONFIG_DIR, survives restarts.
+    Persistent registry for current chat/embedding model names, the embedding dimension
+    reduction, the HNSW index parameters and the index generation being served. Backed by a JSON file under CONFIG_DIR,
+    survives restarts.
+
+    The file carries a monotonically increasing "version"; every change bumps it
+    under an exclusive file lock, so several worker processes can share one file
+    and detect each other's changes via refresh().
     """
 
+    KEYS = ("chat_model", "chat_model_max_tokens", "embedding_model", "embedding_model_max_tokens",
+            "hnsw_m", "hnsw_construction_ef", "hnsw_search_ef", "embedding_reduction", "index_generation")
+
     def __init__(self, config_path: Path, default_chat_model: str, default_chat_model_max_tokens: int,
                  default_embedding_model: str,
-                 default_embedding_model_max_tokens: int):
+                 default_embedding_model_max_tokens: int, default_hnsw_m: int = 16,
+                 default_hnsw_construction_ef: int = 100, default_hnsw_search_ef: int = 100):
         self.path = config_path
+        self.lock_path = config_path.with_suffix(config_path.suffix + ".lock")
         self._lock = RLock()
+        self._mtime_ns = None
 
         self._state = {
+            "version": 0,
             "chat_model": default_chat_model,
             "chat_model_max_tokens": default_chat_model_max_tokens,
             "embedding_model": default_embedding_model,
             "embedding_model_max_tokens": default_embedding_model_max_tokens,
+            "hnsw_m": default_hnsw_m,
+            "hnsw_construction_ef": default_hnsw_construction_ef,
+            "hnsw_search_ef": default_hnsw_search_ef,
+            # {"method": "truncate"|"pca", "dim", "model", "projection"?} or None (full vectors).
+            "embedding_reduction": None,
+            # Bumped when the index is rebuilt next to the live one and swapped in.
+            "index_generation": 0,
         }
         self._load_or_init()
 
+    @contextmanager
+    def _file_lock(self):
+        with self._lock, open(self.lock_path, "a+") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _read_file(self) -> dict:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception:
+            return {}
+
+    def _apply(self, data: dict):
+        for k in ("version",) + self.KEYS:
+            if k in data:
+                self._state[k] = data[k]
+
     def _load_or_init(self):
         self.path.parent.mkdir(parents=True, exist_ok=True)
-        if self.path.exists():
-            try:
-                data = json.loads(self.path.read_text(encoding="utf-8"))
-                for k in ("chat_model", "chat_model_max_tokens", "embedding_model", "embedding_model_max_tokens"):
-                    if k in data:
-                        self._state[k] = data[k]
-            except Exception:
-                pass
-        self._persist()
+        with self._file_lock():
+            if self.path.exists():
+                self._apply(self._read_file())
+            self._persist()
 
     def _persist(self):
         with self._lock:
-            self.path.write_text(json.dumps(self._state, ensure_ascii=False, indent=2), encoding="utf-8")
+            tmp = self.path.with_suffix(self.path.suffix + f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(self._state, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, self.path)
+            self._mtime_ns = self.path.stat().st_mtime_ns
+
+    def _update(self, **changes):
+        with self._file_lock():
+            self._apply(self._read_file())
+            self._state.update(changes)
+            self._state["version"] = int(self._state.get("version") or 0) + 1
+            self._persist()
+
+    def refresh(self) -> bool:
+        """Reload the file if another process changed it. Returns True when the version moved."""
+        try:
+            mtime_ns = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            if mtime_ns == self._mtime_ns:
+                return False
+            data = self._read_file()
+            self._mtime_ns = mtime_ns
+            if not data or data.get("version") == self._state.get("version"):
+                return False
+            self._apply(data)
+            return True
+
+    def get_version(self) -> int:
+        with self._lock:
+            return int(self._state.get("version") or 0)
 
     def get_chat_model(self) -> str:
         with self._lock:
@@ -56,15 +124,57 @@ class ModelRegistry:
             return self._state.get("embedding_model_max_tokens")
 
     def set_chat_model(self, name: str, max_tokens: int = None):
-        with self._lock:
-            self._state["chat_model"] = name
-            if max_tokens is not None:
-                self._state["chat_model_max_tokens"] = max_tokens
-            self._persist()
+        changes = {"chat_model": name}
+        if max_tokens is not None:
+            changes["chat_model_max_tokens"] = max_tokens
+        self._update(**changes)
 
     def set_embedding_model(self, name: str, max_tokens: int = None):
+        changes = {"embedding_model": name}
+        if max_tokens is not None:
+            changes["embedding_model_max_tokens"] = max_tokens
+        self._update(**changes)
+
+    @property
+    def artifact_dir(self) -> Path:
+        """Where files referenced by the registry (PCA projections) are kept."""
+        return self.path.parent
+
+    def get_embedding_reduction(self) -> Optional[Dict]:
         with self._lock:
-            self._state["embedding_model"] = name
-            if max_tokens is not None:
-                self._state["embedding_model_max_tokens"] = max_tokens
-            self._persist()
+            spec = self._state.get("embedding_reduction")
+            return dict(spec) if spec else None
+
+    def set_embedding_reduction(self, spec: Optional[Dict]):
+        self._update(embedding_reduction=spec or None)
+
+    def get_hnsw(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "m": self._state["hnsw_m"],
+                "construction_ef": self._state["hnsw_construction_ef"],
+                "search_ef": self._state["hnsw_search_ef"],
+            }
+
+    def set_hnsw(self, m: Optional[int] = None, construction_ef: Optional[int] = None,
+                 search_ef: Optional[int] = None):
+        changes = {}
+        if m is not None:
+            changes["hnsw_m"] = m
+        if construction_ef is not None:
+            changes["hnsw_construction_ef"] = construction_ef
+        if search_ef is not None:
+            changes["hnsw_search_ef"] = search_ef
+        if changes:
+            self._update(**changes)
+
+    def get_index_generation(self) -> int:
+        with self._lock:
+            return int(self._state.get("index_generation") or 0)
+
+    def set_index_generation(self, generation: int, **changes):
+        """Switches to a rebuilt index generation and the settings it was built with, in one version bump."""
+        unknown = set(changes) - set(self.KEYS)
+        if unknown:
+            raise ValueError(f"Unknown registry keys: {', '.join(sorted(unknown))}")
+        self._update(index_generation=generation, **changes)
@@ -0,0 +1,100 @@
+import threading
+import time
+from typing import Dict, Optional
+
+from api.app.services.model_registry import ModelRegistry
+from api.app.utils.logger import setup_logger
+
+
+class ModelWarmer:
+    """
+    Preloads the active chat and embedding models into Ollama (at startup and after
+    a model switch) and keeps them resident with a periodic keep-alive request.
+    A model counts as warm while its last successful ping is recent and was for the
+    model currently selected in the registry.
+    """
+
+    KINDS = ("chat", "embedding")
+
+    def __init__(self, ollama, registry: ModelRegistry, keep_alive: str = "15m", interval: float = 240.0,
+                 embed_ollama=None):
+        self.ollama = ollama
+        self.embed_ollama = embed_ollama or ollama
+        self.registry = registry
+        self.keep_alive = keep_alive
+        self.interval = interval
+        self.logger = setup_logger()
+        self._lock = threading.Lock()
+        self._state: Dict[str, Dict] = {k: {"model": None, "warm_at": None, "error": None} for k in self.KINDS}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _current_model(self, kind: str) -> str:
+        return self.registry.get_chat_model() if kind == "chat" else self.registry.get_embedding_model()
+
+    def warm(self, kind: str) -> bool:
+        model = self._current_model(kind)
+        start = time.perf_counter()
+        try:
+            if kind == "chat":
+                self._each(self.ollama, "generate", model=model, prompt="", keep_alive=self.keep_alive)
+            else:
+                self._each(self.embed_ollama, "embed", model=model, input="warmup", keep_alive=self.keep_alive)
+        except Exception as e:
+            with self._lock:
+                self._state[kind] = {"model": model, "warm_at": None, "error": str(e)}
+            self.logger.warning("Failed to warm %s model %s: %s", kind, model, str(e))
+            return False
+        with self._lock:
+            self._state[kind] = {"model": model, "warm_at": time.time(), "error": None}
+        self.logger.info("Warmed %s model %s in %.2fs", kind, model, time.perf_counter() - start)
+        return True
+
+    @staticmethod
+    def _each(client, method: str, **kwargs):
+        # A backend router preloads the model on every backend of its pool.
+        if hasattr(client, "broadcast"):
+            return client.broadcast(method, **kwargs)
+        return getattr(client, method)(**kwargs)
+
+    def warm_all(self) -> bool:
+        return all([self.warm(kind) for kind in self.KINDS])
+
+    def warm_async(self, kind: str = None):
+        target = self.warm_all if kind is None else (lambda: self.warm(kind))
+        threading.Thread(target=target, name="model-warmup", daemon=True).start()
+
+    def status(self) -> Dict:
+        now = time.time()
+        out = {}
+        with self._lock:
+            for kind in self.KINDS:
+                st = dict(self._state[kind])
+                current = self._current_model(kind)
+                st["warm"] = bool(
+                    st["warm_at"] and st["model"] == current and now - st["warm_at"] < 2 * self.interval + 60
+                )
+                st["model"] = current
+                out[kind] = st
+        return out
+
+    def is_warm(self) -> bool:
+        return all(s["warm"] for s in self.status().values())
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="model-keepalive", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        ok = self.warm_all()
+        # Retry quickly while Ollama is still coming up or a model is missing.
+        while not self._stop.wait(self.interval if ok else min(self.interval, 10.0)):
+            ok = self.warm_all()
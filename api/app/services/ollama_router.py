@@ -0,0 +1,300 @@
+import itertools
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+import httpx
+from ollama import Client as OllamaClient
+from ollama import ResponseError
+
+from api.app.utils.logger import setup_logger
+
+
+def _model_names(res) -> Set[str]:
+    models = res.get("models", []) if res is not None else []
+    names = set()
+    for m in models:
+        name = getattr(m, "model", None) or getattr(m, "name", None)
+        if name is None and isinstance(m, dict):
+            name = m.get("model") or m.get("name")
+        if name:
+            names.add(name)
+    return names
+
+
+class OllamaBackend:
+    def __init__(self, url: str, client_factory: Callable = OllamaClient):
+        self.url = url
+        # Every backend gets its own client, hence its own HTTP connection pool.
+        self.client = client_factory(host=url)
+        self.outstanding = 0
+        self.ejected_until = 0.0
+        self.loaded_models: Set[str] = set()
+        self.installed_models: Optional[Set[str]] = None
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def status(self) -> Dict:
+        return {
+            "url": self.url,
+            "available": self.available,
+            "outstanding": self.outstanding,
+            "loaded_models": sorted(self.loaded_models),
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+class OllamaRouter:
+    """
+    Drop-in replacement for `ollama.Client` that spreads calls over several Ollama
+    backends. A call goes to the available backend that already has the model loaded
+    (then: has it installed), with the fewest outstanding requests. Connection
+    failures and 5xx responses eject the backend for `eject_seconds` and retry the
+    call elsewhere; streaming calls are only retried before the first chunk.
+    A background health check (`ps()`) re-admits backends and refreshes which
+    models are loaded where.
+    """
+
+    def __init__(self, urls: List[str], name: str = "default", client_factory: Callable = OllamaClient,
+                 eject_seconds: float = 30.0, health_interval: float = 10.0):
+        if not urls:
+            raise ValueError("OllamaRouter needs at least one backend URL")
+        self.name = name
+        self.backends = [OllamaBackend(u, client_factory=client_factory) for u in urls]
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        self.logger = setup_logger()
+        self._lock = threading.Lock()
+        self._rr = itertools.count()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ----- selection -----
+
+    def _pick(self, model: Optional[str], exclude: Set[str]) -> OllamaBackend:
+        with self._lock:
+            candidates = [b for b in self.backends if b.url not in exclude and b.available]
+            if not candidates:
+                # Everything is ejected: try the least recently failed instead of failing outright.
+                candidates = [b for b in self.backends if b.url not in exclude]
+            if not candidates:
+                raise ConnectionError(f"No Ollama backend available in pool '{self.name}'")
+
+            offset = next(self._rr)
+
+            def score(item):
+                i, b = item
+                loaded = model is not None and model in b.loaded_models
+                installed = model is None or b.installed_models is None or model in b.installed_models
+                return (not loaded, not installed, b.outstanding, (i + offset) % len(candidates))
+
+            _, backend = min(enumerate(candidates), key=score)
+            backend.outstanding += 1
+            return backend
+
+    def _release(self, backend: OllamaBackend, model: Optional[str] = None, ok: bool = True):
+        with self._lock:
+            backend.outstanding -= 1
+            if ok:
+                backend.failures = 0
+                if model:
+                    backend.loaded_models.add(model)
+
+    def _eject(self, backend: OllamaBackend, error: Exception):
+        with self._lock:
+            backend.failures += 1
+            backend.last_error = str(error)
+            backend.ejected_until = time.monotonic() + self.eject_seconds
+        self.logger.warning("Ollama backend %s ejected for %.0fs: %s", backend.url, self.eject_seconds, str(error))
+
+    @staticmethod
+    def _is_backend_failure(error: Exception) -> bool:
+        if isinstance(error, (httpx.TransportError, ConnectionError)):
+            return True
+        return isinstance(error, ResponseError) and getattr(error, "status_code", 0) >= 500
+
+    @staticmethod
+    def _is_missing_model(error: Exception) -> bool:
+        return isinstance(error, ResponseError) and getattr(error, "status_code", 0) == 404
+
+    def _call(self, method: str, route_model: Optional[str], **kwargs):
+        tried: Set[str] = set()
+        while True:
+            backend = self._pick(route_model, tried)
+            try:
+                result = getattr(backend.client, method)(**kwargs)
+            except Exception as e:
+                self._release(backend, ok=False)
+                tried.add(backend.url)
+                if self._is_backend_failure(e):
+                    self._eject(backend, e)
+                elif not self._is_missing_model(e):
+                    raise
+                if len(tried) >= len(self.backends):
+                    raise
+                continue
+            self._release(backend, model=route_model)
+            return result
+
+    def _call_stream(self, method: str, route_model: Optional[str], **kwargs) -> Iterator:
+        tried: Set[str] = set()
+        while True:
+            backend = self._pick(route_model, tried)
+            stream = None
+            try:
+                stream = getattr(backend.client, method)(**kwargs)
+                first = next(stream)
+            except StopIteration:
+                self._release(backend, model=route_model)
+                return iter(())
+            except Exception as e:
+                self._release(backend, ok=False)
+                tried.add(backend.url)
+                if self._is_backend_failure(e):
+                    self._eject(backend, e)
+                elif not self._is_missing_model(e):
+                    raise
+                if len(tried) >= len(self.backends):
+                    raise
+                continue
+            return self._drain(backend, route_model, first, stream)
+
+    def _drain(self, backend: OllamaBackend, model: Optional[str], first, stream) -> Iterator:
+        ok = True
+        try:
+            yield first
+            yield from stream
+        except Exception as e:
+            ok = False
+            if self._is_backend_failure(e):
+                self._eject(backend, e)
+            raise
+        finally:
+            # Closing the upstream generator closes the HTTP response, which makes
+            # Ollama abort the generation if it is still running.
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+            self._release(backend, model=model, ok=ok)
+
+    # ----- ollama.Client surface -----
+
+    def chat(self, model: str = "", messages=None, stream: bool = False, **kwargs):
+        if stream:
+            return self._call_stream("chat", model, model=model, messages=messages, stream=True, **kwargs)
+        return self._call("chat", model, model=model, messages=messages, **kwargs)
+
+    def generate(self, model: str = "", prompt: str = "", stream: bool = False, **kwargs):
+        if stream:
+            return self._call_stream("generate", model, model=model, prompt=prompt, stream=True, **kwargs)
+        return self._call("generate", model, model=model, prompt=prompt, **kwargs)
+
+    def embed(self, model: str = "", input="", **kwargs):
+        return self._call("embed", model, model=model, input=input, **kwargs)
+
+    def embeddings(self, model: str = "", prompt: str = "", **kwargs):
+        return self._call("embeddings", model, model=model, prompt=prompt, **kwargs)
+
+    def show(self, model: str):
+        return self._call("show", model, model=model)
+
+    def list(self):
+        """Union of the models installed on every reachable backend."""
+        merged, seen, last_error = [], set(), None
+        for b in self.backends:
+            try:
+                res = b.client.list()
+            except Exception as e:
+                last_error = e
+                continue
+            b.installed_models = _model_names(res)
+            for m in res.get("models", []):
+                name = getattr(m, "model", None) or (m.get("model") if isinstance(m, dict) else None)
+                if name not in seen:
+                    seen.add(name)
+                    merged.append(m)
+        if not merged and last_error is not None:
+            raise last_error
+        return {"models": merged}
+
+    def ps(self):
+        merged = []
+        for b in self.backends:
+            try:
+                merged.extend(b.client.ps().get("models", []))
+            except Exception:
+                continue
+        return {"models": merged}
+
+    def pull(self, model: str, stream: bool = False, **kwargs):
+        """Pulls the model onto every backend of the pool."""
+        if stream:
+            return itertools.chain.from_iterable(
+                b.client.pull(model=model, stream=True, **kwargs) for b in self.backends
+            )
+        return [b.client.pull(model=model, **kwargs) for b in self.backends]
+
+    def broadcast(self, method: str, **kwargs) -> List:
+        """Runs a call on every available backend (e.g. preloading a model everywhere)."""
+        results, last_error = [], None
+        for b in self.backends:
+            if not b.available:
+                continue
+            try:
+                results.append(getattr(b.client, method)(**kwargs))
+            except Exception as e:
+                last_error = e
+                if self._is_backend_failure(e):
+                    self._eject(b, e)
+                continue
+            if kwargs.get("model"):
+                with self._lock:
+                    b.loaded_models.add(kwargs["model"])
+        if not results:
+            raise last_error or ConnectionError(f"No Ollama backend available in pool '{self.name}'")
+        return results
+
+    # ----- health -----
+
+    def check_health(self):
+        for b in self.backends:
+            try:
+                loaded = _model_names(b.client.ps())
+            except Exception as e:
+                if b.available:
+                    self._eject(b, e)
+                continue
+            with self._lock:
+                b.loaded_models = loaded
+                b.ejected_until = 0.0
+                b.last_error = None
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {"pool": self.name, "backends": [b.status() for b in self.backends]}
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"ollama-health-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            try:
+                self.check_health()
+            except Exception as e:
+                self.logger.warning("Ollama health check failed: %s", str(e))
+            if self._stop.wait(self.health_interval):
+                return
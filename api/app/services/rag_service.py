@@ -1,10 +1,22 @@
+import contextvars
+import json
+import re
 import time
 import threading
-from typing import Dict, List, Iterator
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Dict, List, Iterator, Optional
 from sklearn.metrics.pairwise import cosine_similarity
 
+from api.app.utils.budget import Budget, LatencyModel, maybe_stage
+from api.app.utils.extractive import extractive_answer
 from api.app.utils.logger import setup_logger
+from api.app.utils.profiler import span, mark, profiled
 from api.app.repositories.history_repo import HistoryRepo
+from api.app.repositories.text_store import TextStore
+from api.app.repositories.vector_store import VectorStore, empty_result, scoped_query
+from api.app.services.chunk_dedup import ChunkDeduplicator, expand_sources
+from api.app.services.document_index import DocumentIndex
 from api.app.services.model_registry import ModelRegistry
 
 
@@ -25,17 +37,76 @@ def system_prompt(lang: str) -> str:
     )
 
 
+class GenerationCancelled(Exception):
+    """The caller gave up (client disconnect or timeout) before the answer was complete."""
+
+
+# A num_predict this large does not constrain a normal answer, so it is not applied.
+FULL_ANSWER_TOKENS = 1024
+
+_SPACE_RE = re.compile(r"\s")
+
+
+def _snap_window(text: str, start: int, end: int, lo: int, hi: int) -> tuple:
+    """Pulls a widened [start, end) in to word boundaries without cutting into the chunk [lo, hi)."""
+    if start > 0 and not text[start - 1].isspace():
+        m = _SPACE_RE.search(text, start, lo)
+        start = m.end() if m else lo
+    if end < len(text) and not text[end].isspace():
+        cut = max(text.rfind(" ", hi, end), text.rfind("\n", hi, end))
+        end = cut if cut >= 0 else hi
+    return start, end
+
+
+def summary_prompt(lang: str) -> str:
+    if lang.lower().startswith("uk"):
+        return "Стислий підсумок попередньої розмови з користувачем (використовуй лише якщо доречно):\n"
+    return "Summary of the earlier conversation with the user (use only if relevant):\n"
+
+
 class RagService:
-    def __init__(self, collection, ollama, sqlite_conn, top_k: int,
-                 history_turns: int, default_lang: str, model_registry: ModelRegistry):
+    def __init__(self, collection: VectorStore, ollama, embedder, sqlite_conn, top_k: int,
+                 history_turns: int, default_lang: str, model_registry: ModelRegistry,
+                 min_similarity: float = 0.75, scope_brute_force_max: int = 2000, keep_alive: str = "15m",
+                 document_index: Optional[DocumentIndex] = None, doc_top_n: int = 8,
+                 confidence_gate: bool = True, min_confidence: float = 0.0, min_predict: int = 32,
+                 answer_cache_size: int = 256, answer_cache_ttl: float = 3600,
+                 text_store: Optional[TextStore] = None, context_window_chars: int = 0,
+                 context_window_chunks: int = 0, dedup: Optional[ChunkDeduplicator] = None):
         self.collection = collection
+        # Near-duplicate references, so a scoped search also finds chunks stored under another file.
+        self.dedup = dedup
+        # Source texts for widening retrieved chunks to their neighbourhood.
+        self.text_store = text_store
+        self.context_window_chars = context_window_chars
+        self.context_window_chunks = context_window_chunks
+        self.document_index = document_index
+        self.doc_top_n = doc_top_n
+        self.confidence_gate = confidence_gate
+        self.min_confidence = min_confidence
+        self.min_predict = min_predict
+        self.latency = LatencyModel()
+        # Recent generated answers, served only as a fallback when a deadline leaves no time to generate.
+        self.answer_cache_size = answer_cache_size
+        self.answer_cache_ttl = answer_cache_ttl
+        self._answer_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._answer_cache_lock = threading.Lock()
         self.ollama = ollama
+        self.embedder = embedder
         self.history = HistoryRepo(sqlite_conn)
         self.top_k = top_k
         self.history_turns = history_turns
         self.default_lang = default_lang
         self.registry = model_registry
+        self.min_similarity = min_similarity
+        self.scope_brute_force_max = scope_brute_force_max
+        self.keep_alive = keep_alive
         self.logger = setup_logger()
+        self._stage_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rag-stage")
+
+    def _in_background(self, fn, *args) -> Future:
+        """Run an independent pipeline stage concurrently, keeping the caller's context (profiling)."""
+        return self._stage_pool.submit(contextvars.copy_context().run, fn, *args)
 
     def _count_tokens(self, text: str) -> int:
         return len(text) // 4
@@ -95,6 +166,7 @@ class RagService:
                     temp_pair = []
         return relevant
 
+    @profiled("_build_messages")
     def _build_messages(
             self,
             user_id: str,
@@ -102,7 +174,9 @@ class RagService:
             ctx_blocks: List[str],
             lang: str,
             query_embedding: List[float],
-            embedding_model: str
+            embedding_model: str,
+            raw_history: List[Dict] = None,
+            summary: Optional[str] = None
     ) -> List[Dict]:
         max_tokens = self.registry.get_chat_model_max_tokens()
         system_msg = {"role": "system", "content": system_prompt(lang)}
@@ -118,8 +192,17 @@ class RagService:
         self.logger.info("System prompt tokens: %d", system_tokens)
         self.logger.info("User prompt tokens: %d", user_tokens)
 
+        if summary:
+            summary_msg = {"role": "system", "content": summary_prompt(lang) + summary}
+            summary_tokens = self._count_tokens(summary_msg["content"])
+            if total_tokens + summary_tokens < max_tokens:
+                messages.append(summary_msg)
+                total_tokens += summary_tokens
+                self.logger.info("Conversation summary tokens: %d", summary_tokens)
+
         # Add a story if it fits
-        raw_history = self.history.recall(user_id, self.history_turns)
+        if raw_history is None:
+            raw_history = self.history.recall(user_id, self.history_turns)
         filtered_history = self.filter_relevant_history(
             query_embedding=query_embedding,
             history=raw_history,
@@ -158,17 +241,13 @@ class RagService:
             total_tokens += block_tokens
         return truncated
 
-    def _prepare_messages(self, user_id: str, query: str, top_k: int, lang: str):
-        res = self.collection.query(query_texts=[query], n_results=top_k)
-        docs = res.get("documents", [[]])[0]
-        metas = res.get("metadatas", [[]])[0]
-        distances = res.get("distances", [[]])[0]
-
+    def _select_context(self, docs: List[str], metas: List[Dict], distances: List[float], top_k: int,
+                        window_chars: Optional[int] = None, window_chunks: Optional[int] = None):
         self.logger.info("Relevance scores (distance): %s", distances)
 
-        min_similarity = 0.75
+        min_similarity = self.min_similarity
 
-        ctx_blocks, citations = [], []
+        ctx_blocks, citations, selected = [], [], []
 
         for i in range(min(top_k, len(docs))):
             doc = docs[i]
@@ -181,6 +260,7 @@ class RagService:
                 continue
 
             ctx_blocks.append(doc)
+            selected.append(meta or {})
             citations.append({
                 "file": meta.get("file_name"),
                 "path": meta.get("file_path"),
@@ -189,74 +269,485 @@ class RagService:
                 "chunk_score": similarity,
                 "chunk_text": doc
             })
+            sources = expand_sources(meta)
+            if sources:
+                # The chunk is stored once for all the files it appears in.
+                citations[-1]["also_in"] = sources
             self.logger.info("Chunk selected: %.4f | %s", similarity, doc[:100].replace("\n", " "))
 
-        embedding_model = self.registry.get_embedding_model()
-        query_embedding = self.ollama.embeddings(model=embedding_model, prompt=query)["embedding"]
-
-        history = self.history.recall(user_id, self.history_turns)
+        window_chars = self.context_window_chars if window_chars is None else window_chars
+        window_chunks = self.context_window_chunks if window_chunks is None else window_chunks
+        if self.text_store is not None and ctx_blocks and (window_chars or window_chunks):
+            ctx_blocks = self._expand_context(ctx_blocks, selected, citations, window_chars, window_chunks)
+        return ctx_blocks, citations
+
+    def _expand_context(self, ctx_blocks: List[str], metas: List[Dict], citations: List[Dict],
+                        window_chars: int, window_chunks: int) -> List[str]:
+        """
+        Widens each selected chunk by `window_chunks` neighbouring chunks and `window_chars`
+        characters either side, read from the stored text of its file by the chunk's
+        offsets (no extra vector queries). Overlapping windows of one file become a single
+        block at the position of its best chunk; chunks without stored text stay as they are.
+        """
+        blocks = []  # [file_hash, start, end, text]; file_hash None for a chunk kept as is
+        missing = set()
+        for doc, meta, citation in zip(ctx_blocks, metas, citations):
+            entry = self.text_store.get(meta.get("file_hash")) if "char_start" in meta else None
+            if entry is None:
+                if "char_start" in meta:
+                    missing.add(meta.get("file_name") or meta.get("file_hash"))
+                blocks.append([None, 0, 0, doc])
+                continue
+            text, spans = entry
+            lo, hi = meta["char_start"], meta["char_end"]
+            start, end = lo, hi
+            if window_chunks:
+                i = meta.get("chunk_index") or 0
+                near = [sp for sp in spans[max(0, i - window_chunks):i + window_chunks + 1] if sp[0] >= 0]
+                start, end = min([start] + [sp[0] for sp in near]), max([end] + [sp[1] for sp in near])
+            if window_chars:
+                start, end = _snap_window(text, max(0, start - window_chars), min(len(text), end + window_chars),
+                                          start, end)
+            citation["context_start"], citation["context_end"] = start, end
+            overlapping = [b for b in blocks if b[0] == meta["file_hash"] and start <= b[2] and end >= b[1]]
+            if not overlapping:
+                blocks.append([meta["file_hash"], start, end, text])
+                continue
+            # The window may bridge several earlier blocks: all of them fold into the first.
+            first = overlapping[0]
+            first[1] = min([start] + [b[1] for b in overlapping])
+            first[2] = max([end] + [b[2] for b in overlapping])
+            blocks = [b for b in blocks if b is first or not any(b is o for o in overlapping)]
+        if missing:
+            self.logger.warning("Context window skipped: no stored text for %s (is TEXT_DIR persisted on this node?)",
+                                ", ".join(sorted(missing)))
+        return [text if file_hash is None else text[start:end] for file_hash, start, end, text in blocks]
+
+    def _load_history(self, user_id: str):
+        return self.history.recall(user_id, self.history_turns), self.history.get_summary(user_id)
+
+    def _assemble_messages(self, user_id: str, query: str, ctx_blocks: List[str], lang: str,
+                           query_embedding: List[float], embedding_model: str, history: List[Dict] = None,
+                           summary: Optional[str] = None):
+        if history is None:
+            history, summary = self._load_history(user_id)
         history_token_count = sum(self._count_tokens(m["content"]) for m in history)
+        if summary:
+            history_token_count += self._count_tokens(summary)
         available_tokens = self.registry.get_chat_model_max_tokens() - history_token_count - 500
         truncated_ctx = self._truncate_ctx_blocks(ctx_blocks, max_tokens=available_tokens)
 
-        messages = self._build_messages(user_id, query, truncated_ctx, lang or self.default_lang,
-                                        query_embedding, embedding_model)
-        return messages, citations
+        return self._build_messages(user_id, query, truncated_ctx, lang or self.default_lang,
+                                    query_embedding, embedding_model, raw_history=history, summary=summary)
+
+    def _search(self, query_embeddings: List[List[float]], top_k: int, where: Optional[Dict] = None,
+                two_stage: bool = False, doc_top_n: Optional[int] = None) -> Dict:
+        """
+        Vector search returning Chroma's query() shape. A scoped search over few enough
+        chunks skips the HNSW index and scores the in-scope chunks exactly.
+
+        With `two_stage` the document index first picks the `doc_top_n` closest files
+        per query, and the chunk search is restricted to those files.
+        """
+        if two_stage and self.document_index is not None:
+            if self.document_index.count():
+                return self._search_two_stage(query_embeddings, top_k, where, doc_top_n or self.doc_top_n)
+            self.logger.info("Document index is empty, falling back to a flat search")
+        return self._scoped_query(query_embeddings, top_k, where)
+
+    def _scoped_query(self, query_embeddings: List[List[float]], top_k: int, where: Optional[Dict]) -> Dict:
+        res = scoped_query(self.collection, query_embeddings, top_k, where, self.scope_brute_force_max)
+        if self.dedup is not None and where:
+            with span("dedup.widen"):
+                res = self.dedup.widen(self.collection, query_embeddings, res, where, top_k)
+        return res
+
+    def _search_two_stage(self, query_embeddings: List[List[float]], top_k: int, where: Optional[Dict],
+                          doc_top_n: int) -> Dict:
+        with span("document_index.query"):
+            files = self.document_index.top_files(query_embeddings, doc_top_n, where)
+        out = empty_result(0)
+        for emb, paths in zip(query_embeddings, files):
+            if paths:
+                # The file-level filters were already applied when picking the files.
+                res = self._scoped_query([emb], top_k, {"file_path": {"$in": paths}})
+            else:
+                res = empty_result(1)
+            for key in out:
+                out[key].append((res.get(key) or [[]])[0])
+        return out
+
+    def _skip_reason(self, citations: List[Dict], mode: str) -> Optional[str]:
+        """
+        Why the chat model should not be called: "extractive" mode was requested, or the
+        confidence gate found no chunk above min_similarity ("no_context") or the best one
+        below min_confidence ("low_confidence").
+        """
+        if mode == "extractive":
+            return "extractive"
+        if not self.confidence_gate:
+            return None
+        if not citations:
+            return "no_context"
+        if max(c["chunk_score"] for c in citations) < self.min_confidence:
+            return "low_confidence"
+        return None
+
+    @profiled("_prepare_messages")
+    def _prepare_messages(self, user_id: str, query: str, top_k: int, lang: str, where: Optional[Dict] = None,
+                          two_stage: bool = False, doc_top_n: Optional[int] = None, mode: str = "generate",
+                          budget: Optional[Budget] = None, window_chars: Optional[int] = None,
+                          window_chunks: Optional[int] = None):
+        """
+        Embeds the query once and reuses that vector for the vector search, history
+        relevance filtering and the history write. History is loaded once, concurrently
+        with embedding + search.
+
+        Returns (messages, citations, query_embedding, skip_reason); messages is None
+        when generation is skipped (see `_skip_reason`). With a `budget` that is running
+        short, top_k is halved and history is left out of the prompt.
+        """
+        start = time.perf_counter()
+        if budget is not None and top_k > 1 and not budget.fits(
+                "embed", "search", "first_token", extra_ms=self.min_predict * budget.estimate("per_token")):
+            budget.degrade(f"top_k:{top_k}->{max(1, top_k // 2)}")
+            top_k = max(1, top_k // 2)
+        history_future = self._in_background(self._load_history, user_id) if mode != "extractive" else None
 
-    def _save_history_async(self, user_id: str, query: str, answer: str):
+        embedding_model = self.registry.get_embedding_model()
+        with maybe_stage(budget, "embed"):
+            query_embedding = self.embedder.embed_one(query, model=embedding_model)
+
+        with maybe_stage(budget, "search"):
+            res = self._search([query_embedding], top_k, where, two_stage, doc_top_n)
+        docs = res.get("documents", [[]])[0]
+        metas = res.get("metadatas", [[]])[0]
+        distances = res.get("distances", [[]])[0]
+
+        ctx_blocks, citations = self._select_context(docs, metas, distances, top_k, window_chars, window_chunks)
+
+        skip = self._skip_reason(citations, mode)
+        if skip:
+            self.logger.info("Skipping generation (%s), retrieval latency: %.1f ms",
+                             skip, (time.perf_counter() - start) * 1000)
+            return None, citations, query_embedding, skip
+
+        if budget is not None and not budget.fits(
+                "history", "first_token", extra_ms=self.min_predict * budget.estimate("per_token")):
+            budget.degrade("skip_history")
+            history, summary = [], None
+        else:
+            with maybe_stage(budget, "history"):
+                history, summary = history_future.result()
+        messages = self._assemble_messages(user_id, query, ctx_blocks, lang, query_embedding,
+                                           self.embedder.space(embedding_model), history=history, summary=summary)
+        self.logger.info("Pre-LLM latency: %.1f ms", (time.perf_counter() - start) * 1000)
+        return messages, citations, query_embedding, None
+
+    def _extractive(self, query: str, citations: List[Dict], lang: str, reason: str) -> Dict:
+        answer, citations = extractive_answer(query, citations, lang or self.default_lang)
+        return {"answer": answer, "citations": citations, "mode": "extractive", "reason": reason}
+
+    def _cache_key(self, user_id: str, query: str, lang: str, where: Optional[Dict], **retrieval) -> tuple:
+        """
+        Answers are conditioned on the user's history, so they are cached per user. The
+        registry version changes with the models, the index settings and every rebuilt
+        index; `retrieval` holds the request's retrieval parameters.
+        """
+        return (user_id, self.registry.get_version(), self.registry.get_chat_model(), lang or self.default_lang,
+                " ".join(query.lower().split()), json.dumps(where, sort_keys=True, default=str) if where else "",
+                tuple(sorted(retrieval.items())))
+
+    @staticmethod
+    def _chunks(citations: List[Dict]) -> set:
+        return {(c.get("path"), c.get("chunk"), c.get("chunk_text")) for c in citations}
+
+    def _cache_answer(self, key: tuple, answer: str, citations: List[Dict]):
+        if self.answer_cache_size <= 0:
+            return
+        with self._answer_cache_lock:
+            self._answer_cache[key] = (time.monotonic(), answer, citations, self._chunks(citations))
+            self._answer_cache.move_to_end(key)
+            while len(self._answer_cache) > self.answer_cache_size:
+                self._answer_cache.popitem(last=False)
+
+    def _cached_answer(self, key: tuple, citations: List[Dict]) -> Optional[tuple]:
+        """
+        The cached (answer, citations), provided every chunk retrieved now is one the answer
+        was generated from: a file changed or added since then invalidates it.
+        """
+        with self._answer_cache_lock:
+            item = self._answer_cache.get(key)
+            if item is None:
+                return None
+            if time.monotonic() - item[0] > self.answer_cache_ttl or not self._chunks(citations) <= item[3]:
+                del self._answer_cache[key]
+                return None
+            return item[1], item[2]
+
+    def _plan_generation(self, budget: Budget) -> Optional[int]:
+        """
+        num_predict that fits the remaining budget (0 = no cap needed), or None when not
+        even `min_predict` tokens fit and the answer has to come from a fallback.
+        """
+        available = budget.remaining_ms() - budget.estimate("first_token")
+        tokens = int(available / max(1.0, budget.estimate("per_token")))
+        if tokens < self.min_predict:
+            return None
+        if tokens >= FULL_ANSWER_TOKENS:
+            return 0
+        budget.degrade(f"num_predict:{tokens}")
+        return tokens
+
+    def _fallback(self, query: str, citations: List[Dict], lang: str, cache_key: tuple, budget: Budget) -> Dict:
+        cached = self._cached_answer(cache_key, citations)
+        if cached is not None:
+            budget.degrade("cached_answer")
+            return {"answer": cached[0], "citations": cached[1], "mode": "cached", "reason": "deadline"}
+        budget.degrade("extractive_fallback")
+        return self._extractive(query, citations, lang, "deadline")
+
+    def _save_history_async(self, user_id: str, query: str, answer: str, embedding: List[float] = None):
         def task():
             try:
                 now = int(time.time())
                 embedding_model = self.registry.get_embedding_model()
-                embedding = self.ollama.embeddings(model=embedding_model, prompt=query)["embedding"]
-                self.history.append(user_id, "user", query, now, embedding_model=embedding_model, embedding=embedding)
+                query_embedding = embedding
+                if query_embedding is None:
+                    query_embedding = self.embedder.embed_one(query, model=embedding_model)
+                # Tagged with the embedding space (model + reduction) the vector lives in.
+                self.history.append(user_id, "user", query, now, embedding_model=self.embedder.space(embedding_model),
+                                    embedding=query_embedding)
                 self.history.append(user_id, "assistant", answer, now)
             except Exception as e:
                 self.logger.warning("Error saving history: %s", str(e))
 
         threading.Thread(target=task, daemon=True).start()
 
-    def answer(self, user_id: str, query: str, top_k: int, lang: str) -> Dict:
-        messages, citations = self._prepare_messages(user_id, query, top_k, lang)
+    def _options(self, num_predict: int = 0) -> Dict:
+        options = {"temperature": 0.2}
+        if num_predict:
+            options["num_predict"] = num_predict
+        return options
+
+    def _chat_chunks(self, messages: List[Dict], cancel: Optional[threading.Event] = None,
+                     budget: Optional[Budget] = None, num_predict: int = 0) -> Iterator[str]:
+        """
+        Streams content deltas from Ollama. The upstream stream is closed as soon as
+        `cancel` is set or the consumer stops iterating, which drops the HTTP response
+        and makes Ollama abort the generation and free its slot. When `budget` expires
+        the answer is cut off there (recorded as the "truncated" degradation).
+        """
+        if cancel is not None and cancel.is_set():
+            raise GenerationCancelled()
+        start = time.perf_counter()
+        first = None
+        tokens = 0
+        stream = self.ollama.chat(
+            model=self.registry.get_chat_model(),
+            messages=messages,
+            stream=True,
+            options=self._options(num_predict),
+            keep_alive=self.keep_alive
+        )
+        try:
+            for chunk in stream:
+                if cancel is not None and cancel.is_set():
+                    raise GenerationCancelled()
+                text = chunk.get("message", {}).get("content", "")
+                if text:
+                    if first is None:
+                        first = time.perf_counter()
+                        self.latency.observe("first_token", (first - start) * 1000)
+                        if budget is not None:
+                            budget.record("first_token", (first - start) * 1000)
+                    tokens += 1
+                    yield text
+                if budget is not None and budget.expired() and not chunk.get("done"):
+                    budget.degrade("truncated")
+                    break
+        finally:
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+            if first is not None and tokens > 1:
+                self.latency.observe("per_token", (time.perf_counter() - first) * 1000 / (tokens - 1))
+
+    def _generate(self, messages: List[Dict], cancel: Optional[threading.Event] = None,
+                  budget: Optional[Budget] = None, num_predict: int = 0) -> str:
         chat_model = self.registry.get_chat_model()
 
         start = time.time()
-        out = self.ollama.chat(
-            model=chat_model,
-            messages=messages,
-            options={"temperature": 0.2},
-            keep_alive="15m"
-        )
+        with span("ollama.chat"), maybe_stage(budget, "generate", learn=False):
+            if cancel is None and budget is None:
+                out = self.ollama.chat(
+                    model=chat_model,
+                    messages=messages,
+                    options=self._options(num_predict),
+                    keep_alive=self.keep_alive
+                )
+                answer = out["message"]["content"]
+                self._observe_generation(out)
+            else:
+                answer = "".join(self._chat_chunks(messages, cancel, budget, num_predict))
         duration = time.time() - start
-        answer = out["message"]["content"]
-
-        self._save_history_async(user_id, query, answer)
         self.logger.info("LLM response time: %.2f seconds", duration)
-        return {"answer": answer, "citations": citations}
+        return answer
+
+    def _observe_generation(self, out: Dict):
+        """Learns first-token and per-token latency from a non-streamed response's stats (ns)."""
+        count, duration = out.get("eval_count"), out.get("eval_duration")
+        if count and duration:
+            self.latency.observe("per_token", duration / count / 1e6)
+            self.latency.observe("first_token", ((out.get("prompt_eval_duration") or 0)
+                                                 + (out.get("load_duration") or 0)) / 1e6)
+
+    def answer(self, user_id: str, query: str, top_k: int, lang: str, where: Optional[Dict] = None,
+               cancel: Optional[threading.Event] = None, two_stage: bool = False,
+               doc_top_n: Optional[int] = None, mode: str = "generate",
+               deadline_ms: Optional[float] = None, window_chars: Optional[int] = None,
+               window_chunks: Optional[int] = None) -> Dict:
+        """
+        Raises GenerationCancelled when `cancel` is set before the answer is complete;
+        a cancelled turn is not written to history (neither the question nor a partial answer).
+        Extractive answers (requested or gated) skip the chat model and are not written
+        to history either.
+
+        With `deadline_ms` every stage checks the remaining budget and degrades (smaller
+        top_k, no history, capped num_predict, cached or extractive answer) to finish in
+        time; the result then carries a "budget" report with per-stage timings.
+        """
+        budget = Budget(deadline_ms, self.latency) if deadline_ms else None
+        messages, citations, query_embedding, skip = self._prepare_messages(user_id, query, top_k, lang, where,
+                                                                            two_stage, doc_top_n, mode, budget,
+                                                                            window_chars, window_chunks)
+        cache_key = self._cache_key(user_id, query, lang, where, top_k=top_k, two_stage=two_stage,
+                                    doc_top_n=doc_top_n, window_chars=window_chars, window_chunks=window_chunks)
+        num_predict = self._plan_generation(budget) if budget is not None and not skip else 0
+        if skip:
+            result = self._extractive(query, citations, lang, skip)
+        elif num_predict is None:
+            result = self._fallback(query, citations, lang, cache_key, budget)
+        else:
+            answer = self._generate(messages, cancel, budget, num_predict)
+            if budget is None or "truncated" not in budget.degradations:
+                self._cache_answer(cache_key, answer, citations)
+            self._save_history_async(user_id, query, answer, embedding=query_embedding)
+            result = {"answer": answer, "citations": citations, "mode": "generate"}
+        if budget is not None:
+            result["budget"] = budget.report()
+        return result
+
+    def answer_batch(self, user_id: str, queries: List[str], top_k: int, lang: str,
+                     concurrency: int, save_history: bool = False, where: Optional[Dict] = None,
+                     cancel: Optional[threading.Event] = None, two_stage: bool = False,
+                     doc_top_n: Optional[int] = None, mode: str = "generate",
+                     window_chars: Optional[int] = None, window_chunks: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Answers many questions at once: one batched embedding call, one vector query
+        and one history lookup for the whole batch, then up to `concurrency` LLM
+        generations in flight. Results are yielded in completion order.
+        """
+        if not queries:
+            return
+
+        history_future = self._in_background(self._load_history, user_id)
 
-    def stream_answer(self, user_id: str, query: str, top_k: int, lang: str) -> Iterator[Dict]:
-        messages, citations = self._prepare_messages(user_id, query, top_k, lang)
-        chat_model = self.registry.get_chat_model()
+        embedding_model = self.registry.get_embedding_model()
+        embeddings = self.embedder.embed(queries, model=embedding_model)
+
+        res = self._search(embeddings, top_k, where, two_stage, doc_top_n)
+        all_docs = res.get("documents") or [[] for _ in queries]
+        all_metas = res.get("metadatas") or [[] for _ in queries]
+        all_distances = res.get("distances") or [[] for _ in queries]
+
+        history, summary = history_future.result()
+
+        def run(i: int) -> Dict:
+            query = queries[i]
+            ctx_blocks, citations = self._select_context(all_docs[i], all_metas[i], all_distances[i], top_k,
+                                                         window_chars, window_chunks)
+            skip = self._skip_reason(citations, mode)
+            if skip:
+                return {"index": i, "query": query, **self._extractive(query, citations, lang, skip)}
+            messages = self._assemble_messages(user_id, query, ctx_blocks, lang, embeddings[i],
+                                               self.embedder.space(embedding_model), history=history,
+                                               summary=summary)
+            answer = self._generate(messages, cancel)
+            if save_history:
+                self._save_history_async(user_id, query, answer, embedding=embeddings[i])
+            return {"index": i, "query": query, "answer": answer, "citations": citations, "mode": "generate"}
+
+        # Each item runs in a copy of the caller's context, so its stages land in the request's profile.
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="rag-batch") as pool:
+            futures = {pool.submit(contextvars.copy_context().run, run, i): i for i in range(len(queries))}
+            try:
+                for fut in as_completed(futures):
+                    i = futures[fut]
+                    try:
+                        yield fut.result()
+                    except GenerationCancelled:
+                        return
+                    except Exception as e:
+                        self.logger.warning("Batch item %d failed: %s", i, str(e))
+                        yield {"index": i, "query": queries[i], "error": str(e)}
+            finally:
+                for fut in futures:
+                    fut.cancel()
+
+    def stream_answer(self, user_id: str, query: str, top_k: int, lang: str,
+                      where: Optional[Dict] = None, cancel: Optional[threading.Event] = None,
+                      two_stage: bool = False, doc_top_n: Optional[int] = None,
+                      mode: str = "generate", deadline_ms: Optional[float] = None,
+                      window_chars: Optional[int] = None, window_chunks: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Stops (without a "final" chunk) as soon as `cancel` is set or the consumer closes
+        the generator; like `answer`, a cancelled turn is not written to history.
+        An extractive (or deadline fallback) answer is sent as a single "final" chunk.
+        """
+        budget = Budget(deadline_ms, self.latency) if deadline_ms else None
+        messages, citations, query_embedding, skip = self._prepare_messages(user_id, query, top_k, lang, where,
+                                                                            two_stage, doc_top_n, mode, budget,
+                                                                            window_chars, window_chunks)
+        cache_key = self._cache_key(user_id, query, lang, where, top_k=top_k, two_stage=two_stage,
+                                    doc_top_n=doc_top_n, window_chars=window_chars, window_chunks=window_chunks)
+        num_predict = self._plan_generation(budget) if budget is not None and not skip else 0
+        result = None
+        if skip:
+            result = self._extractive(query, citations, lang, skip)
+        elif num_predict is None:
+            result = self._fallback(query, citations, lang, cache_key, budget)
+        if result is not None:
+            if budget is not None:
+                result["budget"] = budget.report()
+            yield {"type": "final", "content": result.pop("answer"), **result}
+            return
+        parts = []
         buffer = ""
         chunk_size = 10
 
-        for chunk in self.ollama.chat(
-                model=chat_model,
-                messages=messages,
-                stream=True,
-                options={"temperature": 0.2},
-                keep_alive="15m"
-        ):
-            text = chunk.get("message", {}).get("content", "")
-            if text:
-                buffer += text
-                while len(buffer) >= chunk_size:
-                    yield {"type": "partial", "content": buffer[:chunk_size]}
-                    buffer = buffer[chunk_size:]
+        try:
+            with span("ollama.chat"), maybe_stage(budget, "generate", learn=False):
+                for text in self._chat_chunks(messages, cancel, budget, num_predict):
+                    if not parts:
+                        mark("first_token")
+                    parts.append(text)
+                    buffer += text
+                    while len(buffer) >= chunk_size:
+                        yield {"type": "partial", "content": buffer[:chunk_size]}
+                        buffer = buffer[chunk_size:]
+        except GenerationCancelled:
+            self.logger.info("Generation cancelled after %d chars", sum(len(p) for p in parts))
+            return
 
         if buffer:
             yield {"type": "partial", "content": buffer}
 
-        final_text = buffer
-        self._save_history_async(user_id, query, final_text)
-        yield {"type": "final", "content": final_text, "citations": citations}
+        final_text = "".join(parts)
+        if budget is None or "truncated" not in budget.degradations:
+            self._cache_answer(cache_key, final_text, citations)
+        self._save_history_async(user_id, query, final_text, embedding=query_embedding)
+        final = {"type": "final", "content": final_text, "citations": citations, "mode": "generate"}
+        if budget is not None:
+            final["budget"] = budget.report()
+        yield final
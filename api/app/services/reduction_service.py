@@ -0,0 +1,130 @@
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from fastapi import HTTPException
+
+from api.app.services.hnsw_tuner import estimate_index_bytes, holdout_queries, load_vectors, percentile
+from api.app.utils.logger import setup_logger
+from api.app.utils.reduction import (METHODS, Reducer, fit_pca, load_reducer, meta_space, reduction_tag,
+                                    save_projection)
+from api.app.utils.vectors import normalize_rows
+
+
+class ReductionService:
+    """
+    Embedding dimension reduction for the index. Builds the registry spec for a target
+    dimension (fitting a PCA projection on the corpus when asked), projects stored
+    full-size vectors into the reduced space, and benchmarks recall@k, query latency
+    and index size of several target dimensions against the full vectors.
+    """
+
+    def __init__(self, registry, embedder, page_size: int = 5000):
+        self.registry = registry
+        self.embedder = embedder
+        self.page_size = page_size
+        self.logger = setup_logger()
+
+    def full_vectors(self, collection, max_vectors: int) -> np.ndarray:
+        """Full-size vectors of (a sample of) the corpus; re-embedded when the index is reduced."""
+        if self.embedder.reduction() is None:
+            return load_vectors(collection, max_vectors, self.page_size)
+        docs = collection.get(limit=max_vectors, include=["documents"]).get("documents") or []
+        docs = [d for d in docs if d]
+        if not docs:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.asarray(self.embedder.embed(docs, reduce=False), dtype=np.float32)
+
+    def plan(self, collection, method: str, dim: int, fit_vectors: int = 20000) -> Optional[Dict]:
+        """Registry spec for `method` at `dim` (None for "none"); fits and stores a PCA projection."""
+        if method == "none":
+            return None
+        if method not in METHODS:
+            raise HTTPException(status_code=400, detail=f"Unknown method (use none, {', '.join(METHODS)})")
+        spec = {"method": method, "dim": dim, "model": self.registry.get_embedding_model()}
+        if method == "pca":
+            vectors = self.full_vectors(collection, fit_vectors)
+            try:
+                spec["projection"] = save_projection(fit_pca(vectors, dim), self.registry.artifact_dir)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        return spec
+
+    def transform(self, spec: Dict) -> Callable:
+        """Snapshot import transform: reduces a batch and tags its chunks with the reduction."""
+        reducer = load_reducer(spec, self.registry.artifact_dir)
+        tag = reduction_tag(spec)
+
+        def apply(embeddings, metadatas):
+            return reducer.apply(embeddings), [{**(m or {}), "embedding_reduction": tag} for m in metadatas]
+
+        return apply
+
+    def status(self, collection, sample: int = 1000) -> Dict:
+        page = collection.get(limit=sample, include=["metadatas", "embeddings"])
+        embs = page.get("embeddings")
+        spaces = sorted({meta_space(m) for m in page.get("metadatas") or [] if m})
+        return {
+            "configured": self.registry.get_embedding_reduction(),
+            "active": self.embedder.reduction(),
+            "space": self.embedder.space(),
+            "index_spaces": spaces,
+            "index_dim": len(embs[0]) if embs is not None and len(embs) else None,
+        }
+
+    def benchmark(self, collection, dims: List[int], methods: List[str], sample_queries: int = 200, k: int = 10,
+                  max_vectors: int = 50000, hnsw_m: int = 16, seed: int = 0) -> Dict:
+        start = time.perf_counter()
+        vectors = self.full_vectors(collection, max_vectors)
+        queries, base, truth_sets = holdout_queries(vectors, sample_queries, k, seed)
+        full_dim = base.shape[1]
+        base = normalize_rows(base)
+
+        full = self._measure(queries, base, truth_sets, k, hnsw_m)
+        results = [{"method": "none", "dim": full_dim, **full}]
+        for method in methods:
+            if method not in METHODS:
+                raise HTTPException(status_code=400, detail=f"Unknown method: {method}")
+            for dim in sorted(set(dims)):
+                if dim >= full_dim:
+                    continue
+                try:
+                    # Fitted on the base vectors only, so the held-out queries stay unseen.
+                    reducer = fit_pca(base, dim) if method == "pca" else Reducer(method, dim)
+                except ValueError:
+                    continue
+                row = self._measure(reducer.apply(queries), reducer.apply(base), truth_sets, k, hnsw_m)
+                row["recall_loss"] = round(full["recall_at_k"] - row["recall_at_k"], 4)
+                row["speedup"] = round(full["p50_ms"] / row["p50_ms"], 2) if row["p50_ms"] else None
+                row["memory_saved"] = round(1 - dim / full_dim, 4)
+                results.append({"method": method, "dim": dim, **row})
+                self.logger.info("Reduction benchmark: %s-%d recall@%d=%.4f", method, dim, k, row["recall_at_k"])
+
+        return {
+            "vectors": len(base),
+            "queries": len(queries),
+            "full_dim": full_dim,
+            "k": k,
+            "results": results,
+            "seconds": round(time.perf_counter() - start, 2),
+        }
+
+    @staticmethod
+    def _measure(queries: np.ndarray, base: np.ndarray, truth_sets: List[set], k: int, hnsw_m: int) -> Dict:
+        # Exact search over the (normalised) matrix, as the NumPy backend runs it; HNSW
+        # latency follows the same dimension scaling and its size is estimated.
+        latency, hits = [], 0
+        for qi, q in enumerate(queries):
+            t0 = time.perf_counter()
+            sims = base @ q
+            top = np.argpartition(-sims, k - 1)[:k]
+            latency.append((time.perf_counter() - t0) * 1000)
+            hits += len(truth_sets[qi] & set(top.tolist()))
+        n, dim = base.shape
+        return {
+            "recall_at_k": round(hits / (len(queries) * k), 4),
+            "p50_ms": percentile(latency, 50),
+            "p99_ms": percentile(latency, 99),
+            "flat_mb": round(n * dim * 4 / 2 ** 20, 2),
+            "hnsw_mb": round(estimate_index_bytes(n, dim, hnsw_m) / 2 ** 20, 2),
+        }
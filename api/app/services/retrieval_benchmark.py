@@ -0,0 +1,164 @@
+import math
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import chromadb
+import numpy as np
+from fastapi import HTTPException
+
+from api.app.repositories.chroma_repo import ChromaVectorStore
+from api.app.repositories.numpy_repo import NumpyVectorStore
+from api.app.repositories.vector_store import VectorStore, scoped_query
+from api.app.services.document_index import DocumentIndex
+from api.app.services.hnsw_tuner import hnsw_metadata, percentile
+from api.app.utils.logger import setup_logger
+from api.app.utils.vectors import cosine_top_k, normalize_rows
+
+
+class RetrievalBenchmark:
+    """
+    Compares flat chunk search with two-stage (document-then-chunk) retrieval as the
+    corpus grows. Stored chunk vectors are sampled from the live corpus; a held-out
+    subset becomes the queries and their exact top-k chunks are the ground truth.
+    For each corpus scale (a growing random subset of files) the remaining chunks and
+    their file centroids are loaded into throw-away stores of the active backend, and
+    both strategies report p50/p99 latency, recall@k and the average number of distinct
+    files among the top-k results.
+    """
+
+    def __init__(self, work_dir: Path, page_size: int = 5000):
+        self.work_dir = Path(work_dir)
+        self.page_size = page_size
+        self.logger = setup_logger()
+
+    def _load(self, collection: VectorStore, max_vectors: int):
+        total = collection.count()
+        if max_vectors:
+            total = min(total, max_vectors)
+        vectors, files, offset = [], [], 0
+        while offset < total:
+            page = collection.get(limit=min(self.page_size, total - offset), offset=offset,
+                                  include=["embeddings", "metadatas"])
+            embs = page.get("embeddings")
+            if embs is None or len(embs) == 0:
+                break
+            vectors.append(np.asarray(embs, dtype=np.float32))
+            files.extend(m.get("file_path") or "" for m in page["metadatas"])
+            offset += len(embs)
+        if not vectors:
+            return np.empty((0, 0), dtype=np.float32), np.array([], dtype=object)
+        return np.vstack(vectors), np.array(files, dtype=object)
+
+    def run(self, collection: VectorStore, backend: str, hnsw: Dict[str, int], sample_queries: int = 100,
+            k: int = 10, doc_top_n_values: Sequence[int] = (4, 8, 16), scales: Sequence[float] = (0.25, 0.5, 1.0),
+            max_vectors: int = 50000, seed: int = 0, batch_size: int = 5000, brute_force_max: int = 2000) -> Dict:
+        start = time.perf_counter()
+        vectors, files = self._load(collection, max_vectors)
+        n = len(vectors)
+        n_queries = min(sample_queries, n // 10)
+        if n_queries < 1 or n - n_queries < k:
+            raise HTTPException(status_code=400, detail=f"Not enough vectors to benchmark ({n} indexed)")
+
+        rng = np.random.default_rng(seed)
+        held_out = np.zeros(n, dtype=bool)
+        held_out[rng.choice(n, size=n_queries, replace=False)] = True
+        queries = normalize_rows(vectors[held_out])
+        base, base_files = vectors[~held_out], files[~held_out]
+        all_files = sorted(set(base_files.tolist()))
+        order = [all_files[i] for i in rng.permutation(len(all_files))]
+
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        client = chromadb.EphemeralClient() if backend == "chroma" else None
+        results = []
+        with tempfile.TemporaryDirectory(dir=self.work_dir, prefix=".bench-") as tmp:
+            for scale in sorted(set(scales)):
+                selected = set(order[:max(1, math.ceil(len(order) * scale))])
+                rows = np.flatnonzero(np.fromiter((f in selected for f in base_files), dtype=bool,
+                                                  count=len(base_files)))
+                if len(rows) < k:
+                    continue
+                chunks = self._store(backend, client, hnsw, Path(tmp))
+                doc_index = DocumentIndex(self._store(backend, client, hnsw, Path(tmp)))
+                try:
+                    results.append(self._measure(chunks, doc_index, base[rows], base_files[rows], queries, k,
+                                                 doc_top_n_values, batch_size, brute_force_max))
+                finally:
+                    chunks.drop()
+                    doc_index.store.drop()
+                self.logger.info("Retrieval benchmark: scale %.2f (%d chunks) done", scale, len(rows))
+
+        return {
+            "backend": backend,
+            "vectors": len(base),
+            "files": len(all_files),
+            "queries": len(queries),
+            "k": k,
+            "scales": results,
+            "seconds": round(time.perf_counter() - start, 2),
+        }
+
+    @staticmethod
+    def _store(backend: str, client, hnsw: Dict[str, int], tmp: Path) -> VectorStore:
+        name = f"bench-{uuid.uuid4().hex[:12]}"
+        if backend == "numpy":
+            return NumpyVectorStore(tmp / name)
+        return ChromaVectorStore(client, client.create_collection(
+            name=name,
+            embedding_function=None,
+            metadata=hnsw_metadata(hnsw["m"], hnsw["construction_ef"], hnsw["search_ef"]),
+        ))
+
+    @staticmethod
+    def _measure(chunks: VectorStore, doc_index: DocumentIndex, base: np.ndarray, base_files: np.ndarray,
+                 queries: np.ndarray, k: int, doc_top_n_values: Sequence[int], batch_size: int,
+                 brute_force_max: int) -> Dict:
+        ids = [str(i) for i in range(len(base))]
+        for i in range(0, len(base), batch_size):
+            chunks.add(ids=ids[i:i + batch_size], embeddings=base[i:i + batch_size],
+                       metadatas=[{"file_path": f} for f in base_files[i:i + batch_size]])
+        by_file: Dict[str, List[int]] = {}
+        for i, f in enumerate(base_files):
+            by_file.setdefault(f, []).append(i)
+        for f, rows in by_file.items():
+            doc_index.put(f, base[rows], {"file_path": f})
+
+        truth, _ = cosine_top_k(queries, base, k)
+        truth_sets = [set(row.tolist()) for row in truth]
+
+        def measure(search) -> Dict:
+            search(queries[0])
+            latency, hits, distinct = [], 0, 0
+            for qi, q in enumerate(queries):
+                t0 = time.perf_counter()
+                res = search(q)
+                latency.append((time.perf_counter() - t0) * 1000)
+                found = [int(x) for x in res["ids"][0]]
+                hits += len(truth_sets[qi] & set(found))
+                distinct += len({base_files[j] for j in found})
+            return {
+                "p50_ms": percentile(latency, 50),
+                "p99_ms": percentile(latency, 99),
+                "recall_at_k": round(hits / (len(queries) * k), 4),
+                "distinct_files": round(distinct / len(queries), 2),
+            }
+
+        def flat(q):
+            return scoped_query(chunks, [q.tolist()], k)
+
+        def two_stage(n):
+            def search(q):
+                paths = doc_index.top_files([q.tolist()], n)[0]
+                return scoped_query(chunks, [q.tolist()], k, {"file_path": {"$in": paths}}, brute_force_max)
+            return search
+
+        flat_stats = measure(flat)
+        staged = []
+        for n in sorted(set(doc_top_n_values)):
+            stats = measure(two_stage(n))
+            stats["doc_top_n"] = n
+            stats["speedup"] = round(flat_stats["p50_ms"] / stats["p50_ms"], 2) if stats["p50_ms"] else None
+            staged.append(stats)
+        return {"files": len(by_file), "chunks": len(base), "flat": flat_stats, "two_stage": staged}
@@ -0,0 +1,82 @@
+import time
+from pathlib import Path
+from typing import Dict
+
+from fastapi import HTTPException
+
+from api.app.repositories.sharded_repo import ShardedVectorStore
+from api.app.utils.logger import setup_logger
+
+
+class ShardService:
+    """
+    Per-shard maintenance. Reindexing a shard rebuilds only that shard's index, either
+    from its stored vectors (a snapshot round-trip) or by re-embedding its files, into
+    a store next to it that is swapped in once complete; the live shard and the others
+    keep serving queries meanwhile.
+    """
+
+    def __init__(self, snapshots, page_size: int = 5000):
+        self.snapshots = snapshots
+        self.page_size = page_size
+        self.logger = setup_logger()
+
+    @staticmethod
+    def _sharded(collection) -> ShardedVectorStore:
+        if not isinstance(collection, ShardedVectorStore):
+            raise HTTPException(status_code=400, detail="Sharding is not enabled (set SHARD_KEY)")
+        return collection
+
+    def status(self, collection) -> Dict:
+        store = self._sharded(collection)
+        return {"shard_key": store.shard_key, "shard_count": store.shard_count, "shards": store.status()}
+
+    def reindex(self, collection, shard: str, ingest, reembed: bool = False) -> Dict:
+        store = self._sharded(collection)
+        if shard not in store.shards():
+            raise HTTPException(status_code=404, detail="Shard not found")
+        start = time.perf_counter()
+
+        if not reembed:
+            def fill(live, shadow):
+                snapshot = self.snapshots.export(live, texts=False)
+                try:
+                    return self.snapshots.import_into(self.snapshots.path_for(snapshot["name"]), shadow,
+                                                      batch_size=min(self.page_size, shadow.max_batch_size),
+                                                      verify=False)
+                finally:
+                    self.snapshots.delete(snapshot["name"])
+
+            result = store.rebuild_shard(shard, fill)
+            # Rows whose key no longer maps to this shard move to where they belong.
+            moved = store.rebalance_shard(shard)
+            out = {"shard": shard, "reembedded": False, "chunks": result["imported"], "moved": moved}
+        else:
+            def fill(live, shadow):
+                # Re-ingesting goes through the sharded store; the shard's writes are
+                # mirrored into the shadow, which becomes the shard once they are in.
+                data = live.get(include=["metadatas"], limit=1_000_000)
+                files = {}
+                for meta in data.get("metadatas") or []:
+                    if meta and meta.get("file_path"):
+                        files[meta["file_path"]] = [t for t in (meta.get("tags") or "").split(",") if t]
+                indexed, missing = [], []
+                for fp, tags in sorted(files.items()):
+                    path = Path(fp)
+                    if not path.exists():
+                        missing.append(fp)
+                        ingest.remove_from_index(path)
+                        continue
+                    r = ingest.upsert_file(path, force=True, tags=tags)
+                    indexed.append({"file": path.name, **r})
+                return indexed, missing
+
+            indexed, missing = store.rebuild_shard(shard, fill)
+            out = {"shard": shard, "reembedded": True, "indexed": indexed, "missing": missing}
+
+        out["seconds"] = round(time.perf_counter() - start, 2)
+        self.logger.info("Shard %s reindexed in %.2fs", shard, out["seconds"])
+        return out
+
+    def rebalance(self, collection, batch_size: int = 1000) -> Dict:
+        return self._sharded(collection).rebalance(batch_size=batch_size)
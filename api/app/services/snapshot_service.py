@@ -0,0 +1,323 @@
+import hashlib
+import json
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set
+
+import numpy as np
+from fastapi import HTTPException
+
+from api.app.repositories.text_store import TextStore
+from api.app.utils.logger import setup_logger
+from api.app.utils.reduction import projection_path
+
+FORMAT_VERSION = 1
+SNAPSHOT_NAME = re.compile(r"^[\w.-]+\.zip$")
+MEMBERS = ("ids.jsonl", "documents.jsonl", "metadatas.jsonl", "embeddings.npy")
+# Only present when the embeddings were reduced with a PCA projection.
+PROJECTION = "projection.npz"
+# Only present when the exporting node had stored texts: {"file_hash", "text", "spans"} per line.
+TEXTS = "texts.jsonl"
+_FILE_HASH = re.compile(r"^[0-9a-f]{64}$")
+DTYPES = {"float32": np.float32, "float16": np.float16}
+
+
+def _sha256_file(path: Path, bufsize: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(bufsize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def corpus_version(ids: List[str], file_hashes: List[Optional[str]]) -> str:
+    """Stable fingerprint of the indexed corpus: sorted chunk ids with the hash of their source file."""
+    h = hashlib.sha256()
+    for chunk_id, file_hash in sorted(zip(ids, file_hashes), key=lambda x: x[0]):
+        h.update(f"{chunk_id}\t{file_hash or ''}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+class SnapshotService:
+    """
+    Portable collection snapshots: a zip with columnar members (ids, documents and
+    metadatas as JSON lines, embeddings as one .npy matrix) and a manifest holding the
+    embedding model and reduction, corpus version and a sha256 per member. Import verifies every
+    checksum and writes straight to the collection with precomputed embeddings, in
+    large batches, so a new node is seeded without calling the embedding model.
+    With a `text_store` the stored texts of the exported files travel along, so context
+    windows keep working on the importing node.
+    """
+
+    def __init__(self, snapshot_dir: Path, registry, page_size: int = 5000, text_store: Optional[TextStore] = None):
+        self.snapshot_dir = Path(snapshot_dir)
+        self.registry = registry
+        self.page_size = page_size
+        self.text_store = text_store
+        self.logger = setup_logger()
+
+    def path_for(self, name: str) -> Path:
+        if not SNAPSHOT_NAME.match(name or ""):
+            raise HTTPException(status_code=400, detail="Invalid snapshot name")
+        path = self.snapshot_dir / name
+        if not path.exists():
+            raise HTTPException(status_code=404, detail="Snapshot not found")
+        return path
+
+    def list(self) -> List[Dict]:
+        if not self.snapshot_dir.exists():
+            return []
+        out = []
+        for p in sorted(self.snapshot_dir.glob("*.zip"), key=lambda x: x.stat().st_mtime, reverse=True):
+            try:
+                manifest = self.read_manifest(p)
+            except Exception:
+                continue
+            out.append({"name": p.name, "size": p.stat().st_size, **manifest})
+        return out
+
+    @staticmethod
+    def read_manifest(path: Path) -> Dict:
+        with zipfile.ZipFile(path) as zf:
+            return json.loads(zf.read("manifest.json"))
+
+    def export(self, collection, dtype: str = "float32", texts: bool = True) -> Dict:
+        """`texts=False` leaves the stored texts out, for a round-trip within this node."""
+        if dtype not in DTYPES:
+            raise HTTPException(status_code=400, detail=f"Unsupported dtype (use one of {', '.join(DTYPES)})")
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        start = time.perf_counter()
+        total = collection.count()
+
+        with tempfile.TemporaryDirectory(dir=self.snapshot_dir, prefix=".export-") as tmp:
+            tmp = Path(tmp)
+            ids_all, hashes_all = [], []
+            matrix = None
+            written = 0
+            with open(tmp / "ids.jsonl", "w", encoding="utf-8") as f_ids, \
+                    open(tmp / "documents.jsonl", "w", encoding="utf-8") as f_docs, \
+                    open(tmp / "metadatas.jsonl", "w", encoding="utf-8") as f_metas:
+                while written < total:
+                    page = collection.get(
+                        limit=self.page_size,
+                        offset=written,
+                        include=["embeddings", "documents", "metadatas"],
+                    )
+                    ids = page.get("ids") or []
+                    if not ids:
+                        break
+                    embs = np.asarray(page["embeddings"], dtype=np.float32)
+                    if matrix is None:
+                        matrix = np.lib.format.open_memmap(
+                            tmp / "embeddings.npy", mode="w+", dtype=DTYPES[dtype], shape=(total, embs.shape[1])
+                        )
+                    n = min(len(ids), total - written)
+                    matrix[written:written + n] = embs[:n]
+                    docs = page.get("documents") or [None] * len(ids)
+                    metas = page.get("metadatas") or [None] * len(ids)
+                    for i in range(n):
+                        f_ids.write(json.dumps(ids[i], ensure_ascii=False) + "\n")
+                        f_docs.write(json.dumps(docs[i], ensure_ascii=False) + "\n")
+                        f_metas.write(json.dumps(metas[i], ensure_ascii=False) + "\n")
+                        ids_all.append(ids[i])
+                        hashes_all.append((metas[i] or {}).get("file_hash"))
+                    written += n
+
+            if matrix is None:
+                np.save(tmp / "embeddings.npy", np.zeros((0, 0), dtype=DTYPES[dtype]))
+                dim = 0
+            else:
+                dim = int(matrix.shape[1])
+                matrix.flush()
+                del matrix
+
+            model = self.registry.get_embedding_model()
+            reduction = self.registry.get_embedding_reduction()
+            if reduction and reduction.get("model") != model:
+                reduction = None
+            members = list(MEMBERS)
+            if reduction and reduction.get("projection"):
+                shutil.copyfile(projection_path(reduction, self.registry.artifact_dir), tmp / PROJECTION)
+                members.append(PROJECTION)
+            if texts and self.text_store is not None and self._export_texts(set(hashes_all), tmp / TEXTS):
+                members.append(TEXTS)
+
+            manifest = {
+                "format_version": FORMAT_VERSION,
+                "created_at": int(time.time()),
+                "embedding_model": model,
+                "embedding_model_max_tokens": self.registry.get_embedding_model_max_tokens(),
+                "embedding_reduction": reduction,
+                "collection_metadata": collection.metadata or {},
+                "count": written,
+                "dim": dim,
+                "dtype": dtype,
+                "corpus_version": corpus_version(ids_all, hashes_all),
+                "checksums": {m: _sha256_file(tmp / m) for m in members},
+            }
+            (tmp / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+
+            name = f"snapshot-{time.strftime('%Y%m%d-%H%M%S')}-{manifest['corpus_version'][:12]}.zip"
+            part = tmp / (name + ".part")
+            with zipfile.ZipFile(part, "w", allowZip64=True) as zf:
+                zf.write(tmp / "manifest.json", "manifest.json", compress_type=zipfile.ZIP_DEFLATED)
+                for m in members:
+                    # Float matrices barely compress; store them as-is.
+                    compress = zipfile.ZIP_STORED if m.endswith((".npy", ".npz")) else zipfile.ZIP_DEFLATED
+                    zf.write(tmp / m, m, compress_type=compress)
+            target = self.snapshot_dir / name
+            part.replace(target)
+
+        sha = _sha256_file(target)
+        (self.snapshot_dir / (name + ".sha256")).write_text(f"{sha}  {name}\n", encoding="utf-8")
+        self.logger.info("Exported %d chunks to %s in %.2fs", written, name, time.perf_counter() - start)
+        return {"name": name, "sha256": sha, "size": target.stat().st_size, **manifest}
+
+    def _export_texts(self, file_hashes: Set[Optional[str]], target: Path) -> int:
+        written = 0
+        with open(target, "w", encoding="utf-8") as fh:
+            for h in sorted(h for h in file_hashes if h):
+                entry = self.text_store.get(h)
+                if entry is not None:
+                    fh.write(json.dumps({"file_hash": h, "text": entry[0], "spans": entry[1]}, ensure_ascii=False)
+                             + "\n")
+                    written += 1
+        return written
+
+    def _import_texts(self, zf: zipfile.ZipFile) -> int:
+        """Stores the snapshot's texts this node does not have yet; returns how many."""
+        added = 0
+        with zf.open(TEXTS) as fh:
+            for line in fh:
+                item = json.loads(line)
+                h = item.get("file_hash")
+                if not isinstance(h, str) or not _FILE_HASH.match(h):
+                    raise HTTPException(status_code=422, detail=f"Invalid file hash in {TEXTS}")
+                if not self.text_store.has(h):
+                    self.text_store.put(h, item["text"], [tuple(s) for s in item["spans"]])
+                    added += 1
+        return added
+
+    def verify(self, path: Path) -> Dict:
+        """Checks the archive digest (if a .sha256 sidecar exists) and every member checksum."""
+        problems = []
+        sidecar = path.with_name(path.name + ".sha256")
+        if sidecar.exists():
+            expected = sidecar.read_text(encoding="utf-8").split()[0]
+            if _sha256_file(path) != expected:
+                problems.append("archive sha256 mismatch")
+        manifest = self.read_manifest(path)
+        with zipfile.ZipFile(path) as zf:
+            for member, expected in manifest.get("checksums", {}).items():
+                h = hashlib.sha256()
+                with zf.open(member) as fh:
+                    for block in iter(lambda: fh.read(1 << 20), b""):
+                        h.update(block)
+                if h.hexdigest() != expected:
+                    problems.append(f"{member} sha256 mismatch")
+        return {"ok": not problems, "problems": problems, "manifest": manifest}
+
+    def import_into(self, path: Path, collection, batch_size: int = 5000, verify: bool = True,
+                    transform: Optional[Callable] = None) -> Dict:
+        """
+        Upserts the snapshot into `collection` with its stored embeddings. The caller is
+        responsible for the collection being bound to the snapshot's embedding model.
+        `transform(embeddings, metadatas) -> (embeddings, metadatas)` rewrites each batch.
+        """
+        start = time.perf_counter()
+        if verify:
+            check = self.verify(path)
+            if not check["ok"]:
+                raise HTTPException(status_code=422, detail={"error": "Snapshot failed verification", **check})
+        manifest = self.read_manifest(path)
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise HTTPException(status_code=422, detail="Unsupported snapshot format")
+
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=self.snapshot_dir, prefix=".import-") as tmp:
+            tmp = Path(tmp)
+            with zipfile.ZipFile(path) as zf:
+                for m in MEMBERS:
+                    with zf.open(m) as src, open(tmp / m, "wb") as dst:
+                        shutil.copyfileobj(src, dst, 1 << 20)
+                texts = self._import_texts(zf) if self.text_store is not None and TEXTS in zf.namelist() else 0
+
+            matrix = np.load(tmp / "embeddings.npy", mmap_mode="r") if manifest.get("count") else None
+            imported = 0
+            with open(tmp / "ids.jsonl", encoding="utf-8") as f_ids, \
+                    open(tmp / "documents.jsonl", encoding="utf-8") as f_docs, \
+                    open(tmp / "metadatas.jsonl", encoding="utf-8") as f_metas:
+                while True:
+                    ids, docs, metas = [], [], []
+                    for line in f_ids:
+                        ids.append(json.loads(line))
+                        docs.append(json.loads(f_docs.readline()))
+                        metas.append(json.loads(f_metas.readline()))
+                        if len(ids) >= batch_size:
+                            break
+                    if not ids:
+                        break
+                    embs = np.asarray(matrix[imported:imported + len(ids)], dtype=np.float32)
+                    if transform is not None:
+                        embs, metas = transform(embs, metas)
+                    collection.upsert(ids=ids, embeddings=embs, documents=docs, metadatas=metas)
+                    imported += len(ids)
+            del matrix
+
+        if imported != manifest.get("count"):
+            raise HTTPException(status_code=422, detail=f"Imported {imported} of {manifest.get('count')} chunks")
+        self.logger.info("Imported %d chunks from %s in %.2fs", imported, path.name, time.perf_counter() - start)
+        return {
+            "name": path.name,
+            "imported": imported,
+            "texts": texts,
+            "embedding_model": manifest["embedding_model"],
+            "corpus_version": manifest["corpus_version"],
+            "seconds": round(time.perf_counter() - start, 2),
+        }
+
+    def adopt_reduction(self, path: Path) -> Optional[Dict]:
+        """Makes the snapshot's embedding reduction the registered one, with its PCA projection."""
+        spec = self.install_projection(path)
+        self.registry.set_embedding_reduction(spec)
+        return spec
+
+    def install_projection(self, path: Path) -> Optional[Dict]:
+        """Copies the snapshot's PCA projection (if any) into the registry's artifacts; returns its reduction."""
+        spec = self.read_manifest(path).get("embedding_reduction")
+        if spec and spec.get("projection"):
+            try:
+                target = projection_path(spec, self.registry.artifact_dir)
+            except ValueError as e:
+                raise HTTPException(status_code=422, detail=str(e))
+            self.registry.artifact_dir.mkdir(parents=True, exist_ok=True)
+            with zipfile.ZipFile(path) as zf, zf.open(PROJECTION) as src, open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+        return spec
+
+    def delete(self, name: str):
+        path = self.path_for(name)
+        path.unlink(missing_ok=True)
+        path.with_name(name + ".sha256").unlink(missing_ok=True)
+
+    def save_upload(self, name: str, fileobj) -> Path:
+        if not SNAPSHOT_NAME.match(name or ""):
+            raise HTTPException(status_code=400, detail="Invalid snapshot name")
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        target = self.snapshot_dir / name
+        part = target.with_name(name + ".part")
+        with open(part, "wb") as dst:
+            shutil.copyfileobj(fileobj, dst, 1 << 20)
+        try:
+            self.read_manifest(part)
+        except Exception:
+            part.unlink(missing_ok=True)
+            raise HTTPException(status_code=400, detail="Not a snapshot archive")
+        part.replace(target)
+        # A digest written for an older archive of the same name no longer applies.
+        target.with_name(name + ".sha256").unlink(missing_ok=True)
+        return target
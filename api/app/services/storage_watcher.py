@@ -0,0 +1,214 @@
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from api.app.utils.locks import try_exclusive_lock
+from api.app.utils.logger import setup_logger
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    from watchdog.observers.polling import PollingObserver
+except ImportError:  # pragma: no cover - watchdog is an optional runtime dependency
+    FileSystemEventHandler = object
+    Observer = PollingObserver = None
+
+IGNORED_SUFFIXES = {".tmp", ".part", ".crdownload", ".swp"}
+
+
+class _Handler(FileSystemEventHandler):
+    def __init__(self, watcher: "StorageWatcher"):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if getattr(event, "is_directory", False):
+            return
+        self.watcher.touch(Path(event.src_path))
+        dest = getattr(event, "dest_path", None)
+        if dest:
+            self.watcher.touch(Path(dest))
+
+
+class StorageWatcher:
+    """
+    Incrementally indexes STORAGE_DIR from filesystem events (inotify via watchdog,
+    falling back to polling). Events are debounced per path until the file has been
+    quiet and its size/mtime stable for `debounce` seconds, then the path goes to a
+    bounded work queue consumed by a few workers that call upsert_file or drop the
+    file from the index. A full queue blocks the scheduler, so a mass copy is fed
+    to Ollama at the workers' pace instead of all at once.
+
+    Only one process per CONFIG_DIR runs the watcher (exclusive lock file), so it
+    is safe with several uvicorn workers.
+    """
+
+    def __init__(self, storage_dir: Path, get_ingest: Callable, supported_extensions, lock_path: Path,
+                 debounce: float = 2.0, queue_size: int = 256, workers: int = 1,
+                 poll_interval: float = 5.0, force_polling: bool = False):
+        self.storage_dir = Path(storage_dir)
+        self.get_ingest = get_ingest
+        self.supported_extensions = set(supported_extensions)
+        self.lock_path = Path(lock_path)
+        self.debounce = debounce
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.force_polling = force_polling
+        self.logger = setup_logger()
+
+        self._lock = threading.Lock()
+        self._pending: Dict[Path, Tuple[float, Optional[Tuple[int, int]]]] = {}
+        self._queued = set()
+        self._queue: "queue.Queue[Path]" = queue.Queue(maxsize=max(1, queue_size))
+        self._stop = threading.Event()
+        self._threads = []
+        self._observer = None
+        self._lock_fh = None
+        self.mode = None
+        self.processed = 0
+        self.errors = 0
+
+    def _relevant(self, path: Path) -> bool:
+        if path.parent != self.storage_dir or path.name.startswith(".") or path.name.endswith("~"):
+            return False
+        suffix = path.suffix.lower()
+        return suffix in self.supported_extensions and suffix not in IGNORED_SUFFIXES
+
+    def touch(self, path: Path):
+        if not self._relevant(path):
+            return
+        with self._lock:
+            self._pending[path] = (time.monotonic(), self._stat(path))
+
+    @staticmethod
+    def _stat(path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            st = path.stat()
+            return st.st_size, st.st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self._spawn(self._leader_loop, "storage-watcher")
+
+    def stop(self):
+        self._stop.set()
+        if self._observer:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
+        if self._lock_fh:
+            self._lock_fh.close()
+            self._lock_fh = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "mode": self.mode,
+            "pending": pending,
+            "queued": self._queue.qsize(),
+            "processed": self.processed,
+            "errors": self.errors,
+        }
+
+    def _spawn(self, target, name: str):
+        t = threading.Thread(target=target, name=name, daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def _leader_loop(self):
+        while not self._stop.is_set():
+            self._lock_fh = try_exclusive_lock(self.lock_path)
+            if self._lock_fh:
+                try:
+                    self._start_observer()
+                except Exception as e:
+                    self.logger.error("Storage watcher could not start: %s", str(e))
+                    return
+                self._spawn(self._schedule_loop, "storage-watcher-debounce")
+                for i in range(self.workers):
+                    self._spawn(self._work_loop, f"storage-watcher-worker-{i}")
+                return
+            self._stop.wait(self.poll_interval)
+
+    def _start_observer(self):
+        if Observer is None:
+            raise RuntimeError("watchdog is not installed")
+        handler = _Handler(self)
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        if not self.force_polling:
+            try:
+                self._observer = Observer()
+                self._observer.schedule(handler, str(self.storage_dir), recursive=False)
+                self._observer.start()
+                self.mode = "native"
+                self.logger.info("Storage watcher started (native events) on %s", self.storage_dir)
+                return
+            except Exception as e:
+                self.logger.warning("Native file events unavailable (%s), falling back to polling", str(e))
+        self._observer = PollingObserver(timeout=self.poll_interval)
+        self._observer.schedule(handler, str(self.storage_dir), recursive=False)
+        self._observer.start()
+        self.mode = "polling"
+        self.logger.info("Storage watcher started (polling every %.1fs) on %s", self.poll_interval, self.storage_dir)
+
+    def _ready_paths(self):
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            for path, (seen, stat) in list(self._pending.items()):
+                if path in self._queued or now - seen < self.debounce:
+                    continue
+                current = self._stat(path)
+                if current != stat:
+                    # Still being written: restart the quiet period.
+                    self._pending[path] = (now, current)
+                    continue
+                del self._pending[path]
+                self._queued.add(path)
+                ready.append(path)
+        return ready
+
+    def _schedule_loop(self):
+        tick = max(0.05, self.debounce / 4)
+        while not self._stop.wait(tick):
+            for path in self._ready_paths():
+                while not self._stop.is_set():
+                    try:
+                        self._queue.put(path, timeout=1)
+                        break
+                    except queue.Full:
+                        continue
+
+    def _work_loop(self):
+        while not self._stop.is_set():
+            try:
+                path = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            with self._lock:
+                self._queued.discard(path)
+            try:
+                ingest = self.get_ingest()
+                if path.exists():
+                    r = ingest.upsert_file(path)
+                    self.logger.info("Watcher indexed %s: %s", path.name, r)
+                else:
+                    ingest.remove_from_index(path)
+                    self.logger.info("Watcher removed %s from index", path.name)
+                with self._lock:
+                    self.processed += 1
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                self.logger.warning("Watcher failed on %s: %s", path, str(e))
+            finally:
+                self._queue.task_done()
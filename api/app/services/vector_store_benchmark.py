@@ -0,0 +1,91 @@
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List
+
+import chromadb
+
+from api.app.repositories.chroma_repo import ChromaVectorStore
+from api.app.repositories.numpy_repo import NumpyVectorStore
+from api.app.repositories.vector_store import VectorStore
+from api.app.services.hnsw_tuner import estimate_index_bytes, hnsw_metadata, holdout_queries, load_vectors, percentile
+from api.app.utils.logger import setup_logger
+
+
+class VectorStoreBenchmark:
+    """
+    Compares the vector store backends on a sample of the live corpus. The same vectors
+    are loaded into a throw-away Chroma collection (current HNSW parameters) and into a
+    temporary NumPy store. Each backend reports build time, p50/p99 single-query latency
+    and recall@k against exact cosine neighbours of held-out queries.
+    """
+
+    def __init__(self, work_dir: Path, page_size: int = 5000):
+        self.work_dir = Path(work_dir)
+        self.page_size = page_size
+        self.logger = setup_logger()
+
+    def run(self, collection, hnsw: Dict[str, int], sample_queries: int = 200, k: int = 10,
+            max_vectors: int = 50000, seed: int = 0, batch_size: int = 5000) -> Dict:
+        start = time.perf_counter()
+        vectors = load_vectors(collection, max_vectors, self.page_size)
+        queries, base, truth_sets = holdout_queries(vectors, sample_queries, k, seed)
+        ids = [str(i) for i in range(len(base))]
+
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        client = chromadb.EphemeralClient()
+        chroma_name = f"bench-{uuid.uuid4().hex[:12]}"
+        results = {}
+        with tempfile.TemporaryDirectory(dir=self.work_dir, prefix=".bench-") as tmp:
+            backends = {
+                "chroma": lambda: ChromaVectorStore(client, client.create_collection(
+                    name=chroma_name,
+                    embedding_function=None,
+                    metadata=hnsw_metadata(hnsw["m"], hnsw["construction_ef"], hnsw["search_ef"]),
+                )),
+                "numpy": lambda: NumpyVectorStore(Path(tmp) / "bench"),
+            }
+            for name, make in backends.items():
+                store = make()
+                try:
+                    results[name] = self._measure(store, base, ids, queries, truth_sets, k, batch_size)
+                finally:
+                    store.drop()
+                self.logger.info("Vector store benchmark: %s done", name)
+
+        dim = base.shape[1]
+        results["chroma"]["index_mb"] = round(estimate_index_bytes(len(base), dim, hnsw["m"]) / 2 ** 20, 1)
+        results["numpy"]["index_mb"] = round(len(base) * dim * 4 / 2 ** 20, 1)
+        return {
+            "vectors": len(base),
+            "queries": len(queries),
+            "dim": dim,
+            "k": k,
+            "hnsw": hnsw,
+            "backends": results,
+            "fastest": min(results, key=lambda b: results[b]["p50_ms"]),
+            "seconds": round(time.perf_counter() - start, 2),
+        }
+
+    @staticmethod
+    def _measure(store: VectorStore, base, ids: List[str], queries, truth_sets: List[set], k: int,
+                 batch_size: int) -> Dict:
+        t0 = time.perf_counter()
+        for i in range(0, len(base), batch_size):
+            store.add(ids=ids[i:i + batch_size], embeddings=base[i:i + batch_size])
+        build_s = time.perf_counter() - t0
+
+        store.query(query_embeddings=[queries[0].tolist()], n_results=k, include=[])
+        latency, hits = [], 0
+        for qi, q in enumerate(queries):
+            t0 = time.perf_counter()
+            res = store.query(query_embeddings=[q.tolist()], n_results=k, include=[])
+            latency.append((time.perf_counter() - t0) * 1000)
+            hits += len(truth_sets[qi] & {int(x) for x in res["ids"][0]})
+        return {
+            "build_seconds": round(build_s, 3),
+            "p50_ms": percentile(latency, 50),
+            "p99_ms": percentile(latency, 99),
+            "recall_at_k": round(hits / (len(queries) * k), 4),
+        }
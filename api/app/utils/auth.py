@@ -0,0 +1,18 @@
+import hmac
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+from api.app.config import settings
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """True when `token` matches ADMIN_TOKEN; nobody is admin while ADMIN_TOKEN is unset."""
+    return bool(settings.ADMIN_TOKEN) and hmac.compare_digest((token or "").encode(), settings.ADMIN_TOKEN.encode())
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin routes are disabled: set ADMIN_TOKEN")
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
@@ -0,0 +1,98 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+
+class LatencyModel:
+    """
+    Running (EWMA) estimates of pipeline stage latencies in ms, learned from completed
+    requests. "first_token" is the time to the first generated token (prompt eval
+    included) and "per_token" the decode time per token after it.
+    """
+
+    DEFAULTS = {"embed": 50.0, "search": 30.0, "history": 10.0, "first_token": 1500.0, "per_token": 60.0}
+
+    def __init__(self, alpha: float = 0.2, **defaults: float):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._est = {**self.DEFAULTS, **defaults}
+
+    def observe(self, name: str, ms: float):
+        if ms < 0 or math.isnan(ms):
+            return
+        with self._lock:
+            prev = self._est.get(name)
+            self._est[name] = ms if prev is None else prev + self.alpha * (ms - prev)
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            return self._est.get(name, 0.0)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {k: round(v, 1) for k, v in self._est.items()}
+
+
+class Budget:
+    """
+    Latency budget of one request. Stages time themselves with `stage()`; the pipeline
+    asks `remaining_ms()` before optional work and records what it dropped with `degrade()`.
+    """
+
+    def __init__(self, deadline_ms: float, latency: Optional[LatencyModel] = None):
+        self.deadline_ms = float(deadline_ms)
+        self.latency = latency
+        self.start = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self.degradations: List[str] = []
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+    def remaining_ms(self) -> float:
+        return self.deadline_ms - self.elapsed_ms()
+
+    def expired(self) -> bool:
+        return self.remaining_ms() <= 0
+
+    def estimate(self, *stages: str) -> float:
+        return sum(self.latency.get(s) for s in stages) if self.latency else 0.0
+
+    def fits(self, *stages: str, extra_ms: float = 0.0) -> bool:
+        return self.remaining_ms() >= self.estimate(*stages) + extra_ms
+
+    def degrade(self, what: str):
+        self.degradations.append(what)
+
+    def record(self, name: str, ms: float):
+        self.timings[name] = round(self.timings.get(name, 0.0) + ms, 1)
+
+    @contextmanager
+    def stage(self, name: str, learn: bool = True):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            self.record(name, ms)
+            if learn and self.latency:
+                self.latency.observe(name, ms)
+
+    def report(self) -> Dict:
+        return {
+            "deadline_ms": self.deadline_ms,
+            "elapsed_ms": round(self.elapsed_ms(), 1),
+            "timings": dict(self.timings),
+            "degradations": list(self.degradations),
+        }
+
+
+@contextmanager
+def maybe_stage(budget: Optional[Budget], name: str, learn: bool = True):
+    if budget is None:
+        yield
+    else:
+        with budget.stage(name, learn=learn):
+            yield
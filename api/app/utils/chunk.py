@@ -1,5 +1,5 @@
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from typing import List
+from typing import List, Tuple
 
 
 def chunk_text(text: str, chunk_size: int, chunk_overlap: int):
@@ -27,3 +27,21 @@ def sentence_chunk_text(text: str, chunk_size: int, chunk_overlap: int) -> List[
     )
 
     return splitter.split_text(text)
+
+
+def chunk_spans(text: str, chunks: List[str]) -> List[Tuple[int, int]]:
+    """
+    (start, end) character offsets of each chunk in `text`. Chunks come in text order and
+    may overlap; (-1, -1) marks a chunk that is not a verbatim slice of the text.
+    """
+    spans, pos = [], 0
+    for chunk in chunks:
+        start = text.find(chunk, pos)
+        if start < 0:
+            start = text.find(chunk)
+        if start < 0:
+            spans.append((-1, -1))
+            continue
+        spans.append((start, start + len(chunk)))
+        pos = start + 1
+    return spans
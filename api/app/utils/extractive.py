@@ -0,0 +1,83 @@
+import re
+from typing import Dict, List, Set, Tuple
+
+_SENTENCE_RE = re.compile(r"\S[^.!?…\n]*(?:[.!?…]+|\n|$)")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Prefix matching is a crude stemmer that copes with Ukrainian inflection ("столиця"/"столицею").
+_STEM_CHARS = 5
+_STOPWORDS = {
+    "the", "and", "for", "are", "was", "what", "which", "who", "how", "that", "this", "with", "from", "is", "of",
+    "to", "in", "on", "a", "an", "or", "do", "does", "did",
+    "що", "як", "які", "який", "яка", "яке", "де", "коли", "чи", "та", "і", "й", "в", "у", "на", "з", "із",
+    "до", "за", "по", "про", "для", "це", "є", "не", "а", "але",
+}
+
+
+def terms(text: str) -> Set[str]:
+    return {
+        w[:_STEM_CHARS]
+        for w in (m.group(0).lower() for m in _WORD_RE.finditer(text or ""))
+        if len(w) > 1 and w not in _STOPWORDS
+    }
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    spans = []
+    for m in _SENTENCE_RE.finditer(text or ""):
+        start, end = m.start(), m.end()
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            spans.append((start, end))
+    return spans
+
+
+def highlight(query: str, text: str, max_sentences: int = 2) -> List[Dict]:
+    """
+    Sentences of `text` that best cover the query terms, in document order, as
+    {"start", "end", "text", "score"} (char offsets into `text`; score is the share
+    of query terms the sentence contains). Falls back to the first sentence.
+    """
+    spans = sentence_spans(text)
+    if not spans:
+        return []
+    q = terms(query)
+    scored = []
+    for i, (start, end) in enumerate(spans):
+        overlap = len(q & terms(text[start:end])) / len(q) if q else 0.0
+        scored.append((overlap, -i, start, end))
+    best, seen = [], set()
+    for s in sorted(scored, reverse=True):
+        key = " ".join(_WORD_RE.findall(text[s[2]:s[3]].lower()))
+        if s[0] <= 0 or len(best) >= max_sentences:
+            break
+        if key not in seen:
+            seen.add(key)
+            best.append(s)
+    best = best or [(0.0, 0, *spans[0])]
+    return [
+        {"start": start, "end": end, "text": text[start:end], "score": round(score, 3)}
+        for score, _, start, end in sorted(best, key=lambda s: s[2])
+    ]
+
+
+def no_answer_text(lang: str) -> str:
+    if lang.lower().startswith("uk"):
+        return "У документах не знайдено релевантної інформації."
+    return "No relevant information was found in the documents."
+
+
+def extractive_answer(query: str, citations: List[Dict], lang: str, max_sentences: int = 2) -> Tuple[str, List[Dict]]:
+    """
+    Builds an answer from the retrieved passages alone: the best-matching sentences of
+    each passage, followed by its file name. Returns (answer, citations with "highlights").
+    """
+    if not citations:
+        return no_answer_text(lang), []
+    parts, out = [], []
+    for c in citations:
+        marks = highlight(query, c.get("chunk_text") or "", max_sentences)
+        out.append({**c, "highlights": marks})
+        if marks:
+            parts.append(" … ".join(m["text"] for m in marks) + (f" [{c['file']}]" if c.get("file") else ""))
+    return "\n\n".join(parts) or no_answer_text(lang), out
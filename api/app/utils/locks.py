@@ -0,0 +1,19 @@
+import fcntl
+from pathlib import Path
+from typing import IO, Optional
+
+
+def try_exclusive_lock(path: Path) -> Optional[IO]:
+    """
+    Non-blocking inter-process lock. Returns the open handle (keep it to hold the lock,
+    close it to release) or None if another process holds it.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fh = open(path, "a+")
+    try:
+        fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        fh.close()
+        return None
+    return fh
@@ -0,0 +1,36 @@
+import threading
+from typing import Dict, Tuple
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class Counters:
+    """Process-local monotonic counters, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[str, Dict[LabelSet, float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def get(self, name: str, **labels) -> float:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            return self._values.get(name, {}).get(key, 0)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name in sorted(self._values):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self._values[name].items()):
+                    labels = ",".join(f'{k}="{v}"' for k, v in key)
+                    lines.append(f"{name}{{{labels}}} {value:g}" if labels else f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+counters = Counters()
@@ -0,0 +1,60 @@
+import hashlib
+import re
+from typing import List, Set
+
+import numpy as np
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Smallest prime above 2**32: (a * x + b) % P stays inside uint64 for 32-bit a, x and b.
+_PRIME = np.uint64(4294967311)
+
+
+def _hash32(s: str) -> int:
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """Word n-grams of the lower-cased text; short texts fall back to the whole word sequence."""
+    words = _WORD_RE.findall((text or "").lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """
+    MinHash signatures over word shingles, plus LSH band keys: two texts with Jaccard
+    similarity s share at least one of `bands` keys with probability 1 - (1 - s^r)^bands
+    (r = num_perm / bands rows per band).
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 16, shingle_size: int = 3, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        sh = shingles(text, self.shingle_size)
+        if not sh:
+            return np.full(self.num_perm, _PRIME, dtype=np.uint64)
+        x = np.fromiter((_hash32(s) for s in sh), dtype=np.uint64, count=len(sh))
+        return ((np.outer(x, self._a) + self._b) % _PRIME).min(axis=0)
+
+    def band_keys(self, signature: np.ndarray) -> List[int]:
+        """One 63-bit key per band (fits an SQLite INTEGER)."""
+        keys = []
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            keys.append(int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), "little") >> 1)
+        return keys
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Jaccard similarity estimated from two signatures."""
+    return float(np.mean(a == b))
@@ -0,0 +1,247 @@
+import contextvars
+import functools
+import json
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from fastapi import Request
+
+from api.app.config import settings
+from api.app.utils.auth import is_admin
+
+_current: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar("profile", default=None)
+_NOOP = nullcontext()
+
+
+class StackSampler:
+    """
+    Minimal sampling profiler: periodically snapshots the stacks of the threads
+    a profile is running on and aggregates them in folded ("a;b;c N") format,
+    which flamegraph.pl and speedscope read directly.
+    """
+
+    def __init__(self, threads: set, interval: float):
+        self.threads = threads
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for tid in list(self.threads):
+                if tid == own or tid not in frames:
+                    continue
+                stack = []
+                f = frames[tid]
+                while f is not None:
+                    code = f.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{f.f_lineno})")
+                    f = f.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class Profile:
+    def __init__(self, name: str, sample: bool = False, interval: float = 0.005):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self._threads = {threading.get_ident()}
+        self.spans: List[Dict[str, Any]] = []
+        self.marks: List[Dict[str, Any]] = []
+        self.duration_ms: Optional[float] = None
+        self._ctx = contextvars.copy_context()
+        self._ctx.run(_current.set, self)
+        self._sampler = StackSampler(self._threads, interval) if sample else None
+        if self._sampler:
+            self._sampler.start()
+
+    def _now_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000
+
+    @contextmanager
+    def span(self, name: str):
+        tid = threading.get_ident()
+        with self._lock:
+            self._threads.add(tid)
+        start = self._now_ms()
+        try:
+            yield
+        finally:
+            end = self._now_ms()
+            with self._lock:
+                self.spans.append({
+                    "name": name,
+                    "start_ms": round(start, 3),
+                    "end_ms": round(end, 3),
+                    "duration_ms": round(end - start, 3),
+                    "thread": tid,
+                })
+
+    def mark(self, name: str):
+        with self._lock:
+            self.marks.append({"name": name, "at_ms": round(self._now_ms(), 3)})
+
+    def run(self, fn: Callable, *args, **kwargs):
+        """Call fn with this profile active, regardless of the calling thread/context."""
+        return self._ctx.run(fn, *args, **kwargs)
+
+    def iterate(self, iterable: Iterable) -> Iterator:
+        """Drive a (lazy) iterator step by step with this profile active."""
+        it = self._ctx.run(iter, iterable)
+        while True:
+            try:
+                item = self._ctx.run(next, it)
+            except StopIteration:
+                return
+            yield item
+
+    def finish(self) -> Dict[str, Any]:
+        if self.duration_ms is None:
+            self.duration_ms = round(self._now_ms(), 3)
+            if self._sampler:
+                self._sampler.stop()
+        return self.to_dict()
+
+    def flamegraph(self) -> Optional[str]:
+        return self._sampler.folded() if self._sampler else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+            marks = list(self.marks)
+        totals: Dict[str, float] = {}
+        for s in spans:
+            totals[s["name"]] = round(totals.get(s["name"], 0.0) + s["duration_ms"], 3)
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "spans": spans,
+            "marks": marks,
+            "totals_ms": totals,
+            "has_flamegraph": self._sampler is not None,
+        }
+
+
+def current() -> Optional[Profile]:
+    return _current.get()
+
+
+def span(name: str):
+    prof = _current.get()
+    if prof is None:
+        return _NOOP
+    return prof.span(name)
+
+
+def profiled(name: str):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            prof = _current.get()
+            if prof is None:
+                return fn(*args, **kwargs)
+            with prof.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def mark(name: str):
+    prof = _current.get()
+    if prof is not None:
+        prof.mark(name)
+
+
+class ProfileStore:
+    """
+    Keeps finished profiles as files under PROFILE_DIR so any worker can serve them.
+    """
+
+    def __init__(self, directory: Path, keep: int = 100):
+        self.dir = Path(directory)
+        self.keep = keep
+
+    def save(self, prof: Profile):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        data = prof.finish()
+        (self.dir / f"{prof.id}.json").write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        folded = prof.flamegraph()
+        if folded is not None:
+            (self.dir / f"{prof.id}.folded").write_text(folded, encoding="utf-8")
+        self._prune()
+
+    def _prune(self):
+        files = sorted(self.dir.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for old in files[self.keep:]:
+            old.unlink(missing_ok=True)
+            old.with_suffix(".folded").unlink(missing_ok=True)
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        if not self.dir.exists():
+            return []
+        files = sorted(self.dir.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        out = []
+        for p in files[:limit]:
+            try:
+                data = json.loads(p.read_text(encoding="utf-8"))
+            except Exception:
+                continue
+            out.append({k: data.get(k) for k in ("id", "name", "started_at", "duration_ms", "has_flamegraph")})
+        return out
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        p = self.dir / f"{Path(profile_id).name}.json"
+        if not p.exists():
+            return None
+        return json.loads(p.read_text(encoding="utf-8"))
+
+    def get_flamegraph(self, profile_id: str) -> Optional[str]:
+        p = self.dir / f"{Path(profile_id).name}.folded"
+        if not p.exists():
+            return None
+        return p.read_text(encoding="utf-8")
+
+
+store = ProfileStore(settings.PROFILE_DIR, keep=settings.PROFILE_KEEP)
+
+
+def profile_request(request: Request) -> Optional[Profile]:
+    """
+    FastAPI dependency: returns an active Profile when the caller asked for one via
+    `X-Profile: 1|flame` or `?profile=1|flame`, otherwise None (no instrumentation cost).
+    """
+    if not settings.PROFILING_ENABLED:
+        return None
+    flag = request.headers.get("x-profile") or request.query_params.get("profile")
+    if not flag or flag.lower() in {"0", "false", "no", "off"}:
+        return None
+    if not is_admin(request.headers.get("x-admin-token")):
+        return None
+    return Profile(
+        name=f"{request.method} {request.url.path}",
+        sample=flag.lower() == "flame",
+        interval=settings.PROFILE_SAMPLE_INTERVAL_MS / 1000,
+    )
@@ -0,0 +1,96 @@
+import hashlib
+import re
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from api.app.utils.vectors import normalize_rows
+
+METHODS = ("truncate", "pca")
+# Names save_projection() gives; a spec from elsewhere (a snapshot manifest) must match.
+PROJECTION_NAME = re.compile(r"^pca-\d+-[0-9a-f]{12}\.npz$")
+
+
+class Reducer:
+    """
+    Maps full embeddings to `dim` dimensions, either by keeping the prefix (Matryoshka-style
+    truncation) or by a PCA projection fitted on the corpus. Output rows are L2-normalised.
+    """
+
+    def __init__(self, method: str, dim: int, mean: Optional[np.ndarray] = None,
+                 components: Optional[np.ndarray] = None):
+        if method not in METHODS:
+            raise ValueError(f"Unknown reduction method: {method}")
+        if method == "pca" and (mean is None or components is None):
+            raise ValueError("PCA reduction needs a fitted projection")
+        self.method = method
+        self.dim = dim
+        self.mean = mean
+        self.components = components
+
+    def apply(self, vectors) -> np.ndarray:
+        m = np.asarray(vectors, dtype=np.float32)
+        if m.ndim == 1:
+            m = m.reshape(1, -1)
+        if self.method == "truncate":
+            if m.shape[1] < self.dim:
+                raise ValueError(f"Cannot truncate {m.shape[1]}-dim vectors to {self.dim}")
+            return normalize_rows(m[:, :self.dim])
+        if m.shape[1] != self.components.shape[1]:
+            raise ValueError(f"Projection expects {self.components.shape[1]}-dim vectors, got {m.shape[1]}")
+        return normalize_rows((normalize_rows(m) - self.mean) @ self.components.T)
+
+
+def fit_pca(vectors, dim: int) -> Reducer:
+    x = normalize_rows(vectors)
+    if dim > min(x.shape):
+        raise ValueError(f"PCA to {dim} dims needs at least {dim} vectors of at least {dim} dims")
+    mean = x.mean(axis=0)
+    _, _, vt = np.linalg.svd(x - mean, full_matrices=False)
+    return Reducer("pca", dim, mean.astype(np.float32), vt[:dim].astype(np.float32))
+
+
+def save_projection(reducer: Reducer, directory: Path) -> str:
+    """Stores a PCA projection under `directory`; the file name is content-addressed."""
+    h = hashlib.sha256(reducer.mean.tobytes() + reducer.components.tobytes()).hexdigest()[:12]
+    name = f"pca-{reducer.dim}-{h}.npz"
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    np.savez(directory / name, mean=reducer.mean, components=reducer.components)
+    return name
+
+
+def projection_path(spec: Dict, directory: Path) -> Path:
+    """Where the spec's PCA projection lives under `directory`; raises ValueError on a foreign name."""
+    name = spec.get("projection")
+    if not isinstance(name, str) or not PROJECTION_NAME.match(name):
+        raise ValueError(f"Invalid projection name: {name!r}")
+    return Path(directory) / name
+
+
+def load_reducer(spec: Optional[Dict], directory: Path) -> Optional[Reducer]:
+    if not spec:
+        return None
+    if spec["method"] == "pca":
+        with np.load(projection_path(spec, directory)) as data:
+            return Reducer("pca", spec["dim"], data["mean"], data["components"])
+    return Reducer(spec["method"], spec["dim"])
+
+
+def reduction_tag(spec: Optional[Dict]) -> str:
+    """Short name of a reduction, stored on every chunk it produced ("" for full vectors)."""
+    if not spec:
+        return ""
+    if spec["method"] == "pca":
+        return Path(spec["projection"]).stem
+    return f"{spec['method']}-{spec['dim']}"
+
+
+def embedding_space(model: str, tag: str = "") -> str:
+    """Vectors are comparable only within one space: the model plus the reduction applied."""
+    return f"{model}@{tag}" if tag else model
+
+
+def meta_space(meta: Dict) -> str:
+    return embedding_space(meta.get("embedding_model"), meta.get("embedding_reduction") or "")
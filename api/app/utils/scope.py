@@ -0,0 +1,95 @@
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+_TAG_RE = re.compile(r"[^a-z0-9_\-]+")
+
+
+def normalize_tags(tags: Optional[Iterable[str]]) -> List[str]:
+    if not tags:
+        return []
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    out = []
+    for t in tags:
+        t = _TAG_RE.sub("-", (t or "").strip().lower()).strip("-")
+        if t and t not in out:
+            out.append(t)
+    return out
+
+
+def tag_key(tag: str) -> str:
+    return f"tag_{tag}"
+
+
+def tags_metadata(tags: List[str], previous: Iterable[str] = ()) -> Dict:
+    """
+    Chroma metadata can't hold lists, so every tag becomes a boolean `tag_<name>` key
+    (filterable with `$eq`) next to a human-readable `tags` string. Tags that were
+    removed are flipped to False rather than deleted, which works with both the
+    merge semantics of `collection.update` and a fresh `add`.
+    """
+    meta = {"tags": ",".join(tags)}
+    for t in previous:
+        meta[tag_key(t)] = False
+    for t in tags:
+        meta[tag_key(t)] = True
+    return meta
+
+
+def build_where(files: Optional[List[str]] = None, tags: Optional[List[str]] = None,
+                mtime_from: Optional[int] = None, mtime_to: Optional[int] = None) -> Optional[Dict]:
+    """
+    Translates a retrieval scope into a Chroma `where` filter: chunks of any of `files`,
+    carrying any of `tags`, with file_mtime inside [mtime_from, mtime_to].
+    """
+    clauses = []
+    if files:
+        names = sorted({Path(f).name for f in files if f})
+        if names:
+            clauses.append({"file_name": {"$in": names}})
+    tags = normalize_tags(tags)
+    if tags:
+        tag_clauses = [{tag_key(t): True} for t in tags]
+        clauses.append(tag_clauses[0] if len(tag_clauses) == 1 else {"$or": tag_clauses})
+    if mtime_from is not None:
+        clauses.append({"file_mtime": {"$gte": int(mtime_from)}})
+    if mtime_to is not None:
+        clauses.append({"file_mtime": {"$lte": int(mtime_to)}})
+
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+_COMPARE = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+}
+
+
+def matches_where(meta: Optional[Dict], where: Optional[Dict]) -> bool:
+    """Evaluates a Chroma `where` filter against one metadata dict, for rows kept outside the vector store."""
+    if not where:
+        return True
+    meta = meta or {}
+    for key, cond in where.items():
+        if key == "$and":
+            ok = all(matches_where(meta, c) for c in cond)
+        elif key == "$or":
+            ok = any(matches_where(meta, c) for c in cond)
+        elif isinstance(cond, dict):
+            ok = all(_COMPARE[op](meta.get(key), value) for op, value in cond.items())
+        else:
+            ok = meta.get(key) == cond
+        if not ok:
+            return False
+    return True
@@ -0,0 +1,35 @@
+from typing import Sequence, Tuple
+
+import numpy as np
+
+
+def normalize_rows(matrix) -> np.ndarray:
+    m = np.asarray(matrix, dtype=np.float32)
+    if m.ndim == 1:
+        m = m.reshape(1, -1)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+def cosine_top_k(queries: Sequence, matrix, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact cosine search. Returns (indices, distances) of shape (n_queries, min(k, n_rows)),
+    ordered by ascending distance (1 - cosine similarity), like Chroma's cosine space.
+    """
+    q = normalize_rows(queries)
+    m = normalize_rows(matrix)
+    n = m.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((q.shape[0], 0), dtype=np.int64), np.empty((q.shape[0], 0), dtype=np.float32)
+    sims = q @ m.T
+    if k < n:
+        idx = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.tile(np.arange(n), (q.shape[0], 1))
+    top = np.take_along_axis(sims, idx, axis=1)
+    order = np.argsort(-top, axis=1)
+    idx = np.take_along_axis(idx, order, axis=1)
+    dist = 1.0 - np.take_along_axis(top, order, axis=1)
+    return idx, dist
@@ -0,0 +1,33 @@
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from api.app.config import settings
+from api.app.utils import auth
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.post("/admin/thing", dependencies=[Depends(auth.require_admin)])
+    def thing():
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+def test_admin_routes_closed_without_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "")
+    r = client.post("/admin/thing")
+    assert r.status_code == 403
+    assert "ADMIN_TOKEN" in r.json()["detail"]
+    assert client.post("/admin/thing", headers={"X-Admin-Token": ""}).status_code == 403
+    assert not auth.is_admin("")
+
+
+def test_admin_routes_check_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "s3cret")
+    assert client.post("/admin/thing").status_code == 403
+    assert client.post("/admin/thing", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.post("/admin/thing", headers={"X-Admin-Token": "s3cret"}).json() == {"ok": True}
@@ -0,0 +1,173 @@
+import sqlite3
+
+import pytest
+
+from api.app.repositories.numpy_repo import NumpyVectorStore
+from api.app.services.model_registry import ModelRegistry
+from api.app.services.rag_service import RagService
+from api.app.utils.budget import Budget, LatencyModel
+from api.tests.test_chunk_dedup import StubEmbedder
+
+DEADLINE = 10_000
+DOCS = [f"Section {i}: the leave policy grants {i + 20} days per year." for i in range(6)]
+QUERY = DOCS[0]
+
+
+class StubLatency(LatencyModel):
+    """Fixed stage estimates: what completed requests observe does not move them."""
+
+    def __init__(self, **est: float):
+        super().__init__(**{**{name: 0.0 for name in self.DEFAULTS}, **est})
+
+    def observe(self, name: str, ms: float):
+        pass
+
+
+class Embedder(StubEmbedder):
+
+    def embed_one(self, text: str, model: str = None):
+        return self.embed([text])[0]
+
+
+class FakeChat:
+    def __init__(self):
+        self.options = []
+
+    def chat(self, model, messages, stream=False, options=None, **kw):
+        self.options.append(options or {})
+        if not stream:
+            return {"message": {"content": "full answer"}}
+        return iter([{"message": {"content": w}, "done": False} for w in ("generated ", "answer")]
+                    + [{"message": {"content": ""}, "done": True}])
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return ModelRegistry(tmp_path / "config" / "models.json", "chat", 8192, "stub", 512)
+
+
+@pytest.fixture
+def rag(tmp_path, registry):
+    embedder = Embedder()
+    store = NumpyVectorStore(tmp_path / "chunks")
+    store.upsert(ids=[f"c{i}" for i in range(len(DOCS))], embeddings=embedder.embed(DOCS), documents=DOCS,
+                 metadatas=[{"file_path": f"/s/{i}.txt", "file_name": f"{i}.txt", "chunk_index": 0}
+                            for i in range(len(DOCS))])
+    service = RagService(store, FakeChat(), embedder, sqlite3.connect(":memory:", check_same_thread=False),
+                         top_k=4, history_turns=3, default_lang="en", model_registry=registry, min_similarity=-1.0,
+                         confidence_gate=False, min_predict=32)
+    service.latency = StubLatency()
+    return service
+
+
+def _starve(rag):
+    # first_token + min_predict tokens alone exceed the deadline.
+    rag.latency = StubLatency(first_token=8000, per_token=100)
+
+
+def test_latency_model_ewma():
+    model = LatencyModel(alpha=0.5, embed=100.0)
+    model.observe("embed", 200)
+    model.observe("embed", -1)
+    model.observe("new", 40)
+    assert model.get("embed") == 150.0
+    assert model.get("new") == 40.0
+    assert model.get("unknown") == 0.0
+
+
+def test_budget_fits_and_report():
+    budget = Budget(DEADLINE, StubLatency(embed=3000, first_token=5000))
+    assert budget.estimate("embed", "first_token") == 8000
+    assert budget.fits("embed", "first_token", extra_ms=1000)
+    assert not budget.fits("embed", "first_token", extra_ms=3000)
+    with budget.stage("embed"):
+        pass
+    with budget.stage("embed"):
+        pass
+    budget.degrade("skip_history")
+    report = budget.report()
+    assert set(report["timings"]) == {"embed"}
+    assert report["degradations"] == ["skip_history"]
+    assert report["deadline_ms"] == DEADLINE and 0 <= report["elapsed_ms"] < 1000
+
+
+def test_budget_stage_learns():
+    latency = LatencyModel(alpha=1.0)
+    budget = Budget(DEADLINE, latency)
+    with budget.stage("search"):
+        pass
+    with budget.stage("generate", learn=False):
+        pass
+    assert latency.get("search") == pytest.approx(budget.timings["search"], abs=0.1)
+    assert latency.get("generate") == 0.0
+
+
+def test_answer_without_degradation(rag):
+    out = rag.answer("u", QUERY, top_k=4, lang="en", deadline_ms=DEADLINE)
+    assert out["mode"] == "generate" and out["answer"] == "generated answer"
+    assert len(out["citations"]) == 4
+    assert out["budget"]["degradations"] == []
+    assert {"embed", "search", "history", "generate"} <= set(out["budget"]["timings"])
+    assert "num_predict" not in rag.ollama.options[-1]
+
+
+def test_answer_caps_num_predict(rag):
+    rag.latency = StubLatency(first_token=1000, per_token=10)
+    out = rag.answer("u", QUERY, top_k=4, lang="en", deadline_ms=DEADLINE)
+    assert out["mode"] == "generate"
+    [cap] = out["budget"]["degradations"]
+    assert cap.startswith("num_predict:")
+    tokens = int(cap.split(":")[1])
+    assert 32 <= tokens <= 900
+    assert rag.ollama.options[-1]["num_predict"] == tokens
+
+
+def test_answer_skips_history(rag):
+    rag.latency = StubLatency(history=7000, first_token=3000, per_token=10)
+    out = rag.answer("u", QUERY, top_k=4, lang="en", deadline_ms=DEADLINE)
+    assert out["mode"] == "generate"
+    assert out["budget"]["degradations"][0] == "skip_history"
+    assert "history" not in out["budget"]["timings"]
+    assert len(out["citations"]) == 4
+
+
+def test_answer_extractive_fallback(rag):
+    _starve(rag)
+    out = rag.answer("u", QUERY, top_k=4, lang="en", deadline_ms=DEADLINE)
+    assert out["mode"] == "extractive" and out["reason"] == "deadline"
+    assert out["budget"]["degradations"] == ["top_k:4->2", "skip_history", "extractive_fallback"]
+    assert len(out["citations"]) <= 2
+    assert rag.ollama.options == []
+
+
+def test_answer_cached_fallback(rag):
+    generated = rag.answer("u", QUERY, top_k=4, lang="en")
+    _starve(rag)
+    out = rag.answer("u", QUERY, top_k=4, lang="en", deadline_ms=DEADLINE)
+    assert out["mode"] == "cached" and out["reason"] == "deadline"
+    assert out["answer"] == generated["answer"] == "full answer"
+    assert out["budget"]["degradations"] == ["top_k:4->2", "skip_history", "cached_answer"]
+
+
+def test_stream_truncated_at_deadline(rag):
+    truncated = Budget(DEADLINE, rag.latency)
+    truncated.deadline_ms = 0
+    answer = "".join(rag._chat_chunks([{"role": "user", "content": QUERY}], budget=truncated))
+    assert answer == "generated "
+    assert truncated.degradations == ["truncated"]
+
+
+@pytest.mark.parametrize("change", ["user", "version", "params"])
+def test_cache_key_isolation(rag, registry, change):
+    rag.answer("u", QUERY, top_k=4, lang="en")
+    _starve(rag)
+    user, top_k = "u", 4
+    if change == "user":
+        user = "other"
+    elif change == "version":
+        registry.set_hnsw(search_ef=200)
+    else:
+        top_k = 3
+    out = rag.answer(user, QUERY, top_k=top_k, lang="en", deadline_ms=DEADLINE)
+    assert out["mode"] == "extractive"
+    assert out["budget"]["degradations"][-1] == "extractive_fallback"
@@ -0,0 +1,144 @@
+import hashlib
+import sqlite3
+
+import numpy as np
+import pytest
+
+from api.app.repositories.dedup_repo import ChunkDedupRepo
+from api.app.repositories.numpy_repo import NumpyVectorStore
+from api.app.services.chunk_dedup import ChunkDeduplicator, also_in
+from api.app.services.ingest_service import IngestService
+from api.app.utils.minhash import MinHasher, similarity
+from api.app.utils.scope import build_where
+
+BOILERPLATE = "Confidential. This document is the property of the company and must not be shared. " * 12
+
+
+class StubEmbedder:
+    """Deterministic 16-dim vectors from the text hash; no reduction."""
+
+    def model(self) -> str:
+        return "stub"
+
+    def reduction(self, model: str = None):
+        return None
+
+    def space(self, model: str = None) -> str:
+        return "stub"
+
+    def embed(self, texts, model: str = None):
+        out = []
+        for t in texts:
+            seed = int.from_bytes(hashlib.sha1(t.encode()).digest()[:4], "little")
+            out.append(np.random.default_rng(seed).normal(size=16).tolist())
+        return out
+
+
+@pytest.fixture
+def dedup():
+    return ChunkDeduplicator(ChunkDedupRepo(sqlite3.connect(":memory:", check_same_thread=False)),
+                             MinHasher(num_perm=128, bands=16), threshold=0.9)
+
+
+@pytest.fixture
+def ingest(tmp_path, dedup):
+    storage = tmp_path / "storage"
+    storage.mkdir()
+    return IngestService(storage, NumpyVectorStore(tmp_path / "chunks"), StubEmbedder(), chunk_size=1200,
+                         chunk_overlap=200, dedup=dedup)
+
+
+def _write(ingest, name: str, body: str, boilerplate: bool = True):
+    path = ingest.storage_dir / name
+    path.write_text(body * 60 + ("\n\n" + BOILERPLATE if boilerplate else ""), encoding="utf-8")
+    return path
+
+
+def _stored(ingest, where):
+    return ingest.collection.get(where=where, include=["metadatas"])
+
+
+def test_band_keys_collide_for_near_duplicates():
+    hasher = MinHasher(num_perm=128, bands=16)
+    a = hasher.signature(BOILERPLATE)
+    b = hasher.signature(BOILERPLATE.replace("company", "firm", 1))
+    c = hasher.signature("Quarterly revenue grew in every region except the north. " * 12)
+    assert np.array_equal(a, hasher.signature(BOILERPLATE))
+    assert similarity(a, b) > 0.8
+    assert set(enumerate(hasher.band_keys(a))) & set(enumerate(hasher.band_keys(b)))
+    assert similarity(a, c) < 0.2
+    assert not set(enumerate(hasher.band_keys(a))) & set(enumerate(hasher.band_keys(c)))
+    assert all(0 <= k < 2 ** 63 for k in hasher.band_keys(a))
+
+
+def test_duplicate_is_stored_once(ingest, dedup):
+    a = _write(ingest, "a.txt", "Sales report A. ")
+    b = _write(ingest, "b.txt", "Staff report B. ")
+    assert ingest.upsert_file(a)["deduplicated"] == 0
+    assert ingest.upsert_file(b)["deduplicated"] == 1
+
+    assert ingest.collection.count() == 3
+    shared = [m for m in _stored(ingest, {"file_name": "a.txt"})["metadatas"] if also_in(m)]
+    assert len(shared) == 1
+    assert also_in(shared[0]) == [(str(b), 1)]
+    assert dedup.stats()["duplicate_refs"] == 1
+    assert [m["chunk_index"] for m in dedup.file_metas(str(b))] == [1]
+
+
+def test_deleting_owner_hands_chunk_over(ingest, dedup):
+    a = _write(ingest, "a.txt", "Sales report A. ")
+    b = _write(ingest, "b.txt", "Staff report B. ")
+    ingest.upsert_file(a)
+    ingest.upsert_file(b)
+
+    ingest.remove_from_index(a)
+    assert _stored(ingest, {"file_name": "a.txt"})["ids"] == []
+    metas = _stored(ingest, {"file_name": "b.txt"})["metadatas"]
+    assert sorted(m["chunk_index"] for m in metas) == [0, 1]
+    assert all(m["file_path"] == str(b) and not also_in(m) for m in metas)
+    assert dedup.stats()["duplicate_refs"] == 0
+
+    ingest.remove_from_index(b)
+    assert ingest.collection.count() == 0
+    stats = dedup.stats()
+    assert (stats["stored_chunks"], stats["duplicate_refs"]) == (0, 0)
+
+
+def test_reingesting_a_file_clears_its_refs(ingest, dedup):
+    a = _write(ingest, "a.txt", "Sales report A. ")
+    b = _write(ingest, "b.txt", "Staff report B. ")
+    ingest.upsert_file(a)
+    ingest.upsert_file(b)
+
+    _write(ingest, "b.txt", "Staff B v2. ", boilerplate=False)
+    assert ingest.upsert_file(b)["deduplicated"] == 0
+    assert dedup.file_metas(str(b)) == []
+    assert not any(also_in(m) for m in _stored(ingest, {"file_name": "a.txt"})["metadatas"])
+
+    # Putting the boilerplate back references A's copy again, once.
+    _write(ingest, "b.txt", "Staff report B. ")
+    ingest.upsert_file(b)
+    ingest.upsert_file(b, force=True)
+    assert dedup.stats()["duplicate_refs"] == 1
+
+
+def test_scoped_search_finds_referenced_chunks(ingest, dedup):
+    a = _write(ingest, "a.txt", "Sales report A. ")
+    b = _write(ingest, "b.txt", "Staff report B. ")
+    ingest.upsert_file(a, tags=["sales"])
+    ingest.upsert_file(b, tags=["hr"])
+    query = StubEmbedder().embed([BOILERPLATE])
+
+    for where in (build_where(files=["b.txt"]), build_where(tags=["hr"]), {"file_path": {"$in": [str(b)]}}):
+        res = ingest.collection.query(query_embeddings=query, n_results=5, where=where)
+        assert len(res["ids"][0]) == 1
+        res = dedup.widen(ingest.collection, query, res, where, 5)
+        assert len(res["ids"][0]) == 2
+        assert {(m["file_name"], m["chunk_index"]) for m in res["metadatas"][0]} == {("b.txt", 0), ("b.txt", 1)}
+        assert res["distances"][0] == sorted(res["distances"][0])
+
+    # Tag edits reach the references.
+    ingest.upsert_file(b, tags=["legal"])
+    assert len(dedup.scoped_refs(build_where(tags=["legal"]))) == 1
+    assert dedup.scoped_refs(build_where(tags=["hr"])) == {}
+    assert dedup.scoped_refs(build_where(files=["a.txt"])) == {}
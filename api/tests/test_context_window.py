@@ -0,0 +1,109 @@
+import logging
+
+import pytest
+
+from api.app.repositories.text_store import TextStore
+from api.app.services.rag_service import RagService, _snap_window
+from api.app.utils.chunk import chunk_spans, chunk_text
+
+TEXT = "alpha beta gamma delta epsilon zeta omega theta iota kappa lambda mu"
+HASH = "a" * 64
+
+
+def test_chunk_spans_overlapping_windows():
+    chunks = chunk_text(TEXT, chunk_size=20, chunk_overlap=8)
+    spans = chunk_spans(TEXT, chunks)
+    assert spans[:3] == [(0, 20), (12, 32), (24, 44)]
+    assert all(TEXT[s:e] == c for (s, e), c in zip(spans, chunks))
+
+
+def test_chunk_spans_repeated_chunk_advances():
+    text = "abc abc abc"
+    assert chunk_spans(text, ["abc", "abc", "abc"]) == [(0, 3), (4, 7), (8, 11)]
+
+
+def test_chunk_spans_marks_non_verbatim_chunks():
+    assert chunk_spans(TEXT, ["alpha beta", "ALPHA", "gamma"]) == [(0, 10), (-1, -1), (11, 16)]
+
+
+def test_snap_window_stops_at_word_boundaries():
+    lo, hi = TEXT.index("delta"), TEXT.index("delta") + len("delta")
+    # Mid-word on both sides: pulled in to the nearest spaces outside the chunk.
+    start, end = _snap_window(TEXT, lo - 8, hi + 8, lo, hi)
+    assert TEXT[start:end] == "gamma delta epsilon"
+    # No space between the window edge and the chunk: falls back to the chunk itself.
+    start, end = _snap_window(TEXT, lo - 2, hi + 2, lo, hi)
+    assert (start, end) == (lo, hi)
+    # Already on a boundary: unchanged.
+    assert _snap_window(TEXT, 0, len(TEXT), lo, hi) == (0, len(TEXT))
+
+
+@pytest.fixture
+def rag(tmp_path):
+    service = object.__new__(RagService)
+    service.text_store = TextStore(tmp_path / "texts")
+    service.logger = logging.getLogger("test_context_window")
+    return service
+
+
+def _meta(word: str, index: int, spans):
+    start = TEXT.index(word)
+    assert spans[index][0] <= start < spans[index][1]
+    return {"file_hash": HASH, "file_name": "t.txt", "chunk_index": index,
+            "char_start": spans[index][0], "char_end": spans[index][1]}
+
+
+def _chunks():
+    chunks = TEXT.split(" ")
+    return chunks, chunk_spans(TEXT, chunks)
+
+
+def test_expand_context_by_chunks(rag):
+    chunks, spans = _chunks()
+    rag.text_store.put(HASH, TEXT, spans)
+    citations = [{}]
+    out = rag._expand_context([chunks[4]], [_meta("epsilon", 4, spans)], citations, 0, 1)
+    assert out == ["delta epsilon zeta"]
+    assert TEXT[citations[0]["context_start"]:citations[0]["context_end"]] == out[0]
+
+
+def test_expand_context_merges_overlapping_windows(rag):
+    chunks, spans = _chunks()
+    rag.text_store.put(HASH, TEXT, spans)
+    out = rag._expand_context([chunks[4], chunks[5]], [_meta("epsilon", 4, spans), _meta("zeta", 5, spans)],
+                              [{}, {}], 0, 1)
+    assert out == ["delta epsilon zeta omega"]
+
+
+def test_expand_context_bridging_window_folds_earlier_blocks(rag):
+    chunks, spans = _chunks()
+    rag.text_store.put(HASH, TEXT, spans)
+    metas = [_meta("beta", 1, spans), {"file_hash": "b" * 64}, _meta("zeta", 5, spans), _meta("delta", 3, spans)]
+    citations = [{}, {}, {}, {}]
+    out = rag._expand_context(["beta", "elsewhere", "zeta", "delta"], metas, citations, 0, 1)
+    # delta's window (gamma..epsilon) touches both earlier blocks: they fold into the first one.
+    assert out == ["alpha beta gamma delta epsilon zeta omega", "elsewhere"]
+    assert TEXT[citations[3]["context_start"]:citations[3]["context_end"]] == "gamma delta epsilon"
+
+
+def test_expand_context_skips_non_verbatim_chunks(rag, caplog):
+    chunks = TEXT.split(" ")
+    chunks[3] = "DELTA"
+    spans = chunk_spans(TEXT, chunks)
+    assert spans[3] == (-1, -1)
+    rag.text_store.put(HASH, TEXT, spans)
+    # A (-1, -1) neighbour does not widen the window...
+    assert rag._expand_context(["epsilon"], [_meta("epsilon", 4, spans)], [{}], 0, 1) == ["epsilon zeta"]
+    # ...and a selected non-verbatim chunk carries no offsets, so it is kept as is without a warning.
+    meta = {"file_hash": HASH, "file_name": "t.txt", "chunk_index": 3}
+    with caplog.at_level(logging.WARNING, logger="test_context_window"):
+        assert rag._expand_context(["DELTA"], [meta], [{}], 20, 1) == ["DELTA"]
+    assert not caplog.text
+
+
+def test_expand_context_without_stored_text(rag, caplog):
+    meta = {"file_hash": "c" * 64, "file_name": "gone.txt", "chunk_index": 0, "char_start": 0, "char_end": 5}
+    with caplog.at_level(logging.WARNING, logger="test_context_window"):
+        out = rag._expand_context(["alpha"], [meta], [{}], 50, 2)
+    assert out == ["alpha"]
+    assert "gone.txt" in caplog.text
@@ -0,0 +1,77 @@
+import sqlite3
+import threading
+
+import pytest
+
+from api.app.repositories.history_repo import HistoryRepo
+
+
+@pytest.fixture
+def repo(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "chat_history.db"), check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    return HistoryRepo(conn)
+
+
+def _turns(repo, user_id: str, n: int, start: int = 0):
+    for i in range(start, start + n):
+        repo.append(user_id, "user", f"q{i}", ts=i)
+        repo.append(user_id, "assistant", f"a{i}", ts=i)
+
+
+def test_compact_folds_old_turns(repo):
+    _turns(repo, "u", 5)
+    seen = []
+
+    def summarize(prev, turns):
+        seen.append((prev, [t["content"] for t in turns]))
+        return "summary"
+
+    assert repo.compact("u", keep_turns=2, min_ts=0, summarize=summarize) == 6
+    assert seen == [(None, ["q0", "a0", "q1", "a1", "q2", "a2"])]
+    assert [m["content"] for m in repo.recall("u", 10)] == ["q3", "a3", "q4", "a4"]
+    assert repo.get_summary("u") == "summary"
+
+
+def test_append_during_compaction_is_kept(repo):
+    _turns(repo, "u", 4)
+    in_summarize, release = threading.Event(), threading.Event()
+
+    def summarize(prev, turns):
+        in_summarize.set()
+        release.wait(5)
+        return "summary"
+
+    compactor = threading.Thread(target=repo.compact, args=("u", 1, 0, summarize))
+    compactor.start()
+    assert in_summarize.wait(5)
+    # A request thread writes while the summary is being built: its commit is its own.
+    _turns(repo, "u", 1, start=4)
+    release.set()
+    compactor.join(5)
+
+    assert [m["content"] for m in repo.recall("u", 10)] == ["q3", "a3", "q4", "a4"]
+    repo.vacuum()
+    assert repo.get_summary("u") == "summary"
+
+
+def test_compact_drops_stale_summary(repo):
+    _turns(repo, "u", 3)
+
+    def summarize(prev, turns):
+        # Another compaction of the same user lands first.
+        repo.conn.execute("INSERT INTO history_summary (user_id, summary, turns) VALUES ('u', 'other', 1)")
+        repo.conn.commit()
+        return "mine"
+
+    assert repo.compact("u", keep_turns=1, min_ts=0, summarize=summarize) == 0
+    assert repo.get_summary("u") == "other"
+    assert len(repo.recall("u", 10)) == 6
+
+
+def test_vacuum_after_pending_write(repo):
+    _turns(repo, "u", 1)
+    repo.conn.execute("DELETE FROM history WHERE user_id='nobody'")
+    assert repo.conn.in_transaction
+    repo.vacuum()
+    assert not repo.conn.in_transaction
@@ -0,0 +1,155 @@
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from api.app.services.ollama_router import OllamaRouter
+
+
+class StubOllama:
+    """Minimal Ollama HTTP API (/api/chat, /api/ps) that can be switched to answer 500."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.failing = False
+        self.hits = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, body: bytes, content_type: str = "application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                stub.hits.append(self.path)
+                if stub.failing:
+                    return self._reply(500, b'{"error": "down"}')
+                if self.path == "/api/ps":
+                    return self._reply(200, json.dumps({"models": [{"model": "m", "name": "m"}]}).encode())
+                self._reply(404, b'{"error": "not found"}')
+
+            def do_POST(self):
+                stub.hits.append(self.path)
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                if stub.failing:
+                    return self._reply(500, b'{"error": "down"}')
+                if self.path != "/api/chat":
+                    return self._reply(404, b'{"error": "not found"}')
+                message = {"role": "assistant", "content": f"from {stub.name}"}
+                if payload.get("stream"):
+                    lines = [{"model": "m", "message": message, "done": False},
+                             {"model": "m", "message": {"role": "assistant", "content": ""}, "done": True}]
+                    return self._reply(200, "".join(json.dumps(line) + "\n" for line in lines).encode(),
+                                       "application/x-ndjson")
+                self._reply(200, json.dumps({"model": "m", "message": message, "done": True}).encode())
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def chat_hits(self) -> int:
+        return self.hits.count("/api/chat")
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stubs():
+    servers = [StubOllama("a"), StubOllama("b")]
+    yield servers
+    for s in servers:
+        s.close()
+
+
+def _closed_port_url() -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"
+
+
+def _backend(router: OllamaRouter, url: str):
+    return next(b for b in router.backends if b.url == url)
+
+
+def test_chat_fails_over_and_ejects_failing_backend(stubs):
+    a, b = stubs
+    a.failing = True
+    router = OllamaRouter([a.url, b.url], eject_seconds=60)
+
+    for _ in range(3):
+        res = router.chat(model="m", messages=[{"role": "user", "content": "hi"}])
+        assert res["message"]["content"] == "from b"
+
+    failed = _backend(router, a.url)
+    assert not failed.available
+    assert failed.failures == 1
+    # Ejected once, then skipped while the other backend is up.
+    assert a.chat_hits() == 1
+    assert b.chat_hits() == 3
+
+
+def test_unreachable_backend_is_ejected(stubs):
+    _, b = stubs
+    dead = _closed_port_url()
+    router = OllamaRouter([dead, b.url], eject_seconds=60)
+
+    for _ in range(2):
+        res = router.chat(model="m", messages=[{"role": "user", "content": "hi"}])
+        assert res["message"]["content"] == "from b"
+
+    assert not _backend(router, dead).available
+    assert _backend(router, dead).last_error
+
+
+def test_stream_fails_over_before_first_chunk(stubs):
+    a, b = stubs
+    a.failing = True
+    router = OllamaRouter([a.url, b.url], eject_seconds=60)
+
+    chunks = list(router.chat(model="m", messages=[{"role": "user", "content": "hi"}], stream=True))
+
+    assert chunks[0]["message"]["content"] == "from b"
+    assert not _backend(router, a.url).available
+    assert all(b.outstanding == 0 for b in router.backends)
+
+
+def test_health_check_readmits_recovered_backend(stubs):
+    a, b = stubs
+    a.failing = True
+    router = OllamaRouter([a.url, b.url], eject_seconds=60)
+    router.chat(model="m", messages=[{"role": "user", "content": "hi"}])
+    assert not _backend(router, a.url).available
+
+    router.check_health()
+    assert not _backend(router, a.url).available
+
+    a.failing = False
+    router.check_health()
+    recovered = _backend(router, a.url)
+    assert recovered.available
+    assert recovered.last_error is None
+    assert "m" in recovered.loaded_models
+
+    served = {router.chat(model="m", messages=[{"role": "user", "content": str(i)}])["message"]["content"]
+              for i in range(4)}
+    assert served == {"from a", "from b"}
+
+
+def test_all_backends_failing_raises(stubs):
+    a, b = stubs
+    a.failing = b.failing = True
+    router = OllamaRouter([a.url, b.url], eject_seconds=60)
+
+    with pytest.raises(Exception):
+        router.chat(model="m", messages=[{"role": "user", "content": "hi"}])
+    assert not any(backend.available for backend in router.backends)
@@ -0,0 +1,90 @@
+import chromadb
+import pytest
+
+from api.app.repositories.chroma_repo import ChromaVectorStore
+from api.app.repositories.numpy_repo import NumpyVectorStore
+from api.app.repositories.sharded_repo import ShardedVectorStore
+from api.app.services.hnsw_tuner import hnsw_metadata
+from api.tests.test_vector_store import _vec
+
+SHARD = "docs_t_x"
+
+
+@pytest.fixture(params=["chroma", "numpy"])
+def backend(request, tmp_path):
+    """(make_store, list_stores) over one Chroma client or one numpy directory."""
+    if request.param == "numpy":
+        root = tmp_path / "numpy"
+        root.mkdir()
+        return (lambda name: NumpyVectorStore(root / name),
+                lambda: [p.name for p in root.iterdir() if (p / "store.db").exists()])
+    client = chromadb.PersistentClient(path=str(tmp_path / "chroma"))
+
+    def make(name):
+        col = client.get_or_create_collection(name=name, embedding_function=None, metadata=hnsw_metadata(16, 100, 100))
+        return ChromaVectorStore(client, col)
+    return make, lambda: [c.name for c in client.list_collections()]
+
+
+def _sharded(backend) -> ShardedVectorStore:
+    return ShardedVectorStore("docs", "tag", 1, backend[0], backend[1], max_workers=2)
+
+
+def _fill(store: ShardedVectorStore, tag: str, ids, start: int = 0):
+    store.upsert(ids=list(ids), embeddings=[_vec(start + i) for i in range(len(ids))], documents=list(ids),
+                 metadatas=[{"file_path": f"/s/{i}.txt", "tags": tag} for i in ids])
+
+
+def _copy(live, shadow):
+    data = live.get(include=["embeddings", "documents", "metadatas"])
+    shadow.upsert(ids=data["ids"], embeddings=data["embeddings"], documents=data["documents"],
+                  metadatas=data["metadatas"])
+
+
+def test_rebuild_serves_live_shard_and_keeps_writes(backend):
+    store = _sharded(backend)
+    _fill(store, "x", ["x0", "x1", "x2"])
+    _fill(store, "y", ["y0"], start=10)
+    seen = {}
+
+    def fill(live, shadow):
+        _copy(live, shadow)
+        # The live shard still answers while the shadow is built...
+        seen["count"] = store.count()
+        seen["hit"] = store.query(query_embeddings=[_vec(1)], n_results=1)["ids"][0]
+        # ...and writes made meanwhile reach the rebuilt shard.
+        _fill(store, "x", ["x3"], start=3)
+        store.delete(ids=["x0"])
+        assert {s["shard"]: s["rebuilding"] for s in store.status()}[SHARD]
+
+    store.rebuild_shard(SHARD, fill)
+    assert seen == {"count": 4, "hit": ["x1"]}
+    assert sorted(store.shards()[SHARD].get(include=[])["ids"]) == ["x1", "x2", "x3"]
+    assert "rebuild-" + SHARD not in backend[1]()
+    assert not any(s["rebuilding"] for s in store.status())
+
+    _fill(store, "x", ["x4"], start=4)
+    assert store.count() == 5
+
+
+def test_failed_rebuild_keeps_live_shard(backend):
+    store = _sharded(backend)
+    _fill(store, "x", ["x0", "x1"])
+
+    def fill(live, shadow):
+        _copy(live, shadow)
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        store.rebuild_shard(SHARD, fill)
+    assert sorted(store.get(include=[])["ids"]) == ["x0", "x1"]
+    assert "rebuild-" + SHARD not in backend[1]()
+
+
+def test_other_worker_picks_up_rebuilt_shard(backend):
+    store = _sharded(backend)
+    _fill(store, "x", ["x0", "x1"])
+    other = _sharded(backend)
+    assert other.count() == 2
+    store.rebuild_shard(SHARD, lambda live, shadow: _fill(shadow, "x", ["x0", "x1", "x2"]))
+    assert other.query(query_embeddings=[_vec(2)], n_results=1)["ids"][0] == ["x2"]
@@ -0,0 +1,173 @@
+import threading
+import uuid
+
+import chromadb
+import numpy as np
+import pytest
+
+from api.app.repositories.chroma_repo import ChromaVectorStore
+from api.app.repositories.numpy_repo import NumpyVectorStore
+from api.app.repositories.vector_store import VectorStore
+from api.app.services.hnsw_tuner import hnsw_metadata
+
+DIM = 8
+
+
+def _vec(i: int) -> list:
+    rng = np.random.default_rng(i)
+    v = rng.normal(size=DIM)
+    return (v / np.linalg.norm(v)).tolist()
+
+
+ROWS = [
+    ("a0", "alpha zero", {"file_path": "/s/a.txt", "chunk_index": 0, "file_mtime": 100, "tag_x": True}),
+    ("a1", "alpha one", {"file_path": "/s/a.txt", "chunk_index": 1, "file_mtime": 100}),
+    ("b0", "beta zero", {"file_path": "/s/b.txt", "chunk_index": 0, "file_mtime": 200, "tag_x": True}),
+    ("c0", "gamma zero", {"file_path": "/s/c.txt", "chunk_index": 0, "file_mtime": 300, "score": 0.5}),
+]
+
+
+@pytest.fixture(params=["chroma", "numpy"])
+def store(request, tmp_path) -> VectorStore:
+    if request.param == "numpy":
+        s = NumpyVectorStore(tmp_path / "numpy", initial_capacity=2)
+    else:
+        client = chromadb.PersistentClient(path=str(tmp_path / "chroma"))
+        col = client.create_collection(name=f"t{uuid.uuid4().hex[:12]}", embedding_function=None,
+                                       metadata=hnsw_metadata(16, 100, 100))
+        s = ChromaVectorStore(client, col)
+    s.add(ids=[r[0] for r in ROWS], embeddings=[_vec(i) for i in range(len(ROWS))],
+          documents=[r[1] for r in ROWS], metadatas=[r[2] for r in ROWS])
+    return s
+
+
+def _ids(store: VectorStore, where) -> set:
+    return set(store.get(where=where, include=[])["ids"])
+
+
+def test_add_get_count(store):
+    assert store.count() == len(ROWS)
+    got = store.get(ids=["b0", "a1"], include=["documents", "metadatas"])
+    by_id = dict(zip(got["ids"], zip(got["documents"], got["metadatas"])))
+    assert by_id["b0"][0] == "beta zero"
+    assert by_id["a1"][1]["chunk_index"] == 1
+    assert store.get(ids=["missing"], include=[])["ids"] == []
+
+
+def test_add_keeps_existing_ids(store):
+    store.add(ids=["a0"], embeddings=[_vec(99)], documents=["changed"], metadatas=[{"chunk_index": 9}])
+    got = store.get(ids=["a0"])
+    assert got["documents"] == ["alpha zero"]
+    assert store.count() == len(ROWS)
+
+
+def test_upsert_and_update_merge_metadata(store):
+    store.upsert(ids=["d0"], embeddings=[_vec(10)], documents=["delta"], metadatas=[{"file_path": "/s/d.txt"}])
+    store.update(ids=["a0"], metadatas=[{"tag_x": None, "tag_y": True}])
+    meta = store.get(ids=["a0"])["metadatas"][0]
+    assert "tag_x" not in meta
+    assert meta["tag_y"] is True
+    assert meta["file_path"] == "/s/a.txt"
+    assert store.count() == len(ROWS) + 1
+    # update() never inserts.
+    store.update(ids=["zz"], metadatas=[{"x": 1}])
+    assert store.count() == len(ROWS) + 1
+
+
+@pytest.mark.parametrize("where, expected", [
+    ({"file_path": "/s/a.txt"}, {"a0", "a1"}),
+    ({"file_path": {"$eq": "/s/b.txt"}}, {"b0"}),
+    ({"file_path": {"$ne": "/s/a.txt"}}, {"b0", "c0"}),
+    ({"file_path": {"$in": ["/s/b.txt", "/s/c.txt"]}}, {"b0", "c0"}),
+    ({"file_path": {"$nin": ["/s/b.txt", "/s/c.txt"]}}, {"a0", "a1"}),
+    ({"file_mtime": {"$gt": 100}}, {"b0", "c0"}),
+    ({"file_mtime": {"$gte": 200}}, {"b0", "c0"}),
+    ({"file_mtime": {"$lt": 200}}, {"a0", "a1"}),
+    ({"file_mtime": {"$lte": 200}}, {"a0", "a1", "b0"}),
+    ({"score": {"$gte": 0.5}}, {"c0"}),
+    ({"tag_x": True}, {"a0", "b0"}),
+    ({"$and": [{"file_mtime": {"$gte": 100}}, {"chunk_index": 0}]}, {"a0", "b0", "c0"}),
+    ({"$or": [{"file_path": "/s/c.txt"}, {"chunk_index": 1}]}, {"a1", "c0"}),
+    ({"$and": [{"tag_x": True}, {"$or": [{"file_mtime": 100}, {"file_mtime": 300}]}]}, {"a0"}),
+    ({"file_path": "/s/none.txt"}, set()),
+])
+def test_where(store, where, expected):
+    assert _ids(store, where) == expected
+
+
+def test_get_limit_offset(store):
+    all_ids = store.get(include=[])["ids"]
+    assert len(all_ids) == len(ROWS)
+    first = store.get(limit=2, include=[])["ids"]
+    rest = store.get(limit=10, offset=2, include=[])["ids"]
+    assert len(first) == 2
+    assert set(first) | set(rest) == set(all_ids)
+    assert not set(first) & set(rest)
+
+
+def test_query_ranks_by_cosine_distance(store):
+    res = store.query(query_embeddings=[_vec(2), _vec(3)], n_results=2)
+    assert [row[0] for row in res["ids"]] == ["b0", "c0"]
+    assert res["distances"][0][0] == pytest.approx(0.0, abs=1e-4)
+    assert res["distances"][0][0] <= res["distances"][0][1]
+    assert res["documents"][0][0] == "beta zero"
+    assert res["metadatas"][1][0]["file_path"] == "/s/c.txt"
+
+
+def test_query_with_where(store):
+    res = store.query(query_embeddings=[_vec(2)], n_results=3, where={"file_path": "/s/a.txt"})
+    assert set(res["ids"][0]) == {"a0", "a1"}
+
+
+def test_query_include_embeddings(store):
+    res = store.query(query_embeddings=[_vec(0)], n_results=1, include=["embeddings"])
+    assert np.allclose(res["embeddings"][0][0], _vec(0), atol=1e-5)
+
+
+def test_delete_by_ids_and_where(store):
+    store.delete(ids=["a0"])
+    assert store.count() == len(ROWS) - 1
+    store.delete(where={"file_path": "/s/b.txt"})
+    assert set(store.get(include=[])["ids"]) == {"a1", "c0"}
+    res = store.query(query_embeddings=[_vec(2)], n_results=10)
+    assert set(res["ids"][0]) == {"a1", "c0"}
+
+
+def test_delete_then_reinsert(store):
+    store.delete(ids=["a1"])
+    store.add(ids=["e0"], embeddings=[_vec(20)], documents=["eps"], metadatas=[{"file_path": "/s/e.txt"}])
+    assert _ids(store, {"file_path": "/s/e.txt"}) == {"e0"}
+    assert _ids(store, {"chunk_index": 1}) == set()
+    res = store.query(query_embeddings=[_vec(20)], n_results=1)
+    assert res["ids"][0] == ["e0"]
+
+
+class _HookedLock:
+    """Runs `hook` just before the n-th acquisition of the wrapped lock."""
+
+    def __init__(self, inner, n: int, hook):
+        self.inner, self.n, self.hook = inner, n, hook
+
+    def __enter__(self):
+        self.n -= 1
+        if self.n == 0:
+            self.hook()
+        return self.inner.__enter__()
+
+    def __exit__(self, *exc):
+        return self.inner.__exit__(*exc)
+
+
+def test_numpy_query_drops_slots_reused_during_search(tmp_path):
+    s = NumpyVectorStore(tmp_path / "race")
+    s.add(ids=["old"], embeddings=[_vec(0)], documents=["old"], metadatas=[{"k": 1}])
+
+    def reuse_slot():
+        s.delete(ids=["old"])
+        s.add(ids=["new"], embeddings=[_vec(1)], documents=["new"], metadatas=[{"k": 2}])
+
+    # query() takes the lock once for the mask and once more after the matrix product.
+    s._lock = _HookedLock(s._lock, 2, reuse_slot)
+    res = s.query(query_embeddings=[_vec(0)], n_results=1)
+    assert res["ids"] == [[]]
+    assert s.get(ids=["new"], include=[])["ids"] == ["new"]